@@ -0,0 +1 @@
+"""SoW agent and the streaming SARIF reader it shares with the analyzer API."""
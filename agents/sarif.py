@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import json
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterator, List, Optional, TextIO, Tuple
+
+
+# Streaming SARIF reading, shared by the SoW agent and the API's findings store; standard library only
+SEVERITIES = ("critical", "high", "medium", "low", "info")
+# SARIF `level` when no CVSS-style `security-severity` is given
+LEVEL_SEVERITY = {"error": "high", "warning": "medium", "note": "low", "none": "info"}
+# Single values (one result, one rule) larger than this are treated as a corrupt report
+MAX_VALUE_CHARS = 64 << 20
+
+_DECODER = json.JSONDecoder()
+_WS = re.compile(r"[ \t\r\n]*")
+_STRUCT = re.compile(r'[\[\]{}"]')
+_STR_END = re.compile(r'["\\]')
+
+
+class JsonStream:
+    """Pull parser over a JSON file: walk containers, decode small values, skip the rest.
+
+    Only the unread tail of one chunk is buffered, so memory stays flat no
+    matter how large the file is; values are materialised only when `value()`
+    is called on them.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 16) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        data = self.f.read(self.chunk_size)
+        if not data:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"expected {ch!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as exc:
+                # Either the value continues in the next chunk or it is broken; a broken one
+                # must not pull the rest of the file into memory looking for its end
+                if len(self.buf) - self.pos > MAX_VALUE_CHARS:
+                    raise ValueError(f"JSON value larger than {MAX_VALUE_CHARS} characters: {exc.msg}") from None
+                if not self._fill():
+                    raise ValueError(f"truncated JSON: {exc.msg}") from None
+                continue
+            # A number that ends the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip(self) -> None:
+        ch = self.peek()
+        if ch == '"':
+            return self._skip_string()
+        if ch not in "{[":
+            self.value()
+            return
+        depth = 0
+        while True:
+            m = _STRUCT.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("truncated JSON")
+                continue
+            c = m.group()
+            if c == '"':
+                self.pos = m.start()
+                self._skip_string()
+                continue
+            self.pos = m.end()
+            if c in "{[":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_string(self) -> None:
+        self.pos += 1
+        while True:
+            m = _STR_END.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("truncated JSON")
+                continue
+            self.pos = m.end()
+            if m.group() == '"':
+                return
+            # Backslash: step over the escaped character, which may start the next chunk
+            if self.pos >= len(self.buf) and not self._fill():
+                raise ValueError("truncated JSON")
+            self.pos += 1
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object at the cursor; the caller must read or skip each value."""
+        self.take("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.take(":")
+            yield key
+            c = self.peek()
+            self.pos += 1
+            if c == "}":
+                return
+            if c != ",":
+                raise ValueError(f"expected ',' or '}}' at offset {self.pos - 1}")
+
+    def items(self) -> Iterator[None]:
+        """One step per element of the array at the cursor; the caller must read or skip each."""
+        self.take("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            c = self.peek()
+            self.pos += 1
+            if c == "]":
+                return
+            if c != ",":
+                raise ValueError(f"expected ',' or ']' at offset {self.pos - 1}")
+
+
+def _cvss_severity(score: Any) -> Optional[str]:
+    if score is None:
+        return None
+    try:
+        score = float(score)
+    except (TypeError, ValueError):
+        return None
+    if score >= 9.0:
+        return "critical"
+    if score >= 7.0:
+        return "high"
+    if score >= 4.0:
+        return "medium"
+    return "low" if score > 0 else "info"
+
+
+def result_path(result: Dict[str, Any]) -> Optional[str]:
+    for loc in result.get("locations") or []:
+        uri = (((loc or {}).get("physicalLocation") or {}).get("artifactLocation") or {}).get("uri")
+        if uri:
+            return uri
+    return None
+
+
+class SarifSink(ABC):
+    """Receives a SARIF report result by result and resolves each one's rule and severity.
+
+    Subclasses implement `on_result`. A result that appears before its run's
+    rules is held back, reduced to whatever `keep` returns, until they arrive.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.found = False
+        self.error: Optional[str] = None
+        self.total = 0
+        self.runs: List[str] = []
+        self.rule_titles: Dict[str, str] = {}
+        self._rules: Dict[str, Tuple[Any, Any]] = {}
+        self._rule_ids: List[Optional[str]] = []
+        # Held back until the rules are known: ((rule id, rule index, level, security-severity), kept) -> count
+        self._pending: Counter = Counter()
+        self._rules_seen = False
+
+    def keep(self, result: Dict[str, Any]) -> Hashable:
+        """The part of `result` that `on_result` needs; must be hashable."""
+        return None
+
+    @abstractmethod
+    def on_result(self, rule_id: str, severity: str, kept: Any, n: int) -> None:
+        """Called with `n` results of `rule_id` at `severity` whose kept part is `kept`."""
+
+    def start_run(self) -> None:
+        self._rules, self._rule_ids, self._rules_seen = {}, [], False
+        self._pending = Counter()
+
+    def add_rule(self, rule: Dict[str, Any], indexed: bool = True) -> None:
+        # Only the driver's rules are addressable by `ruleIndex`
+        rule_id = rule.get("id")
+        if indexed:
+            self._rule_ids.append(rule_id)
+        if not rule_id:
+            return
+        props = rule.get("properties") or {}
+        level = (rule.get("defaultConfiguration") or {}).get("level")
+        self._rules[rule_id] = (props.get("security-severity"), level)
+        title = (rule.get("shortDescription") or {}).get("text") or rule.get("name")
+        if title:
+            self.rule_titles.setdefault(rule_id, " ".join(str(title).split())[:120])
+
+    def add_result(self, result: Dict[str, Any]) -> None:
+        self.total += 1
+        rule = result.get("rule") or {}
+        score = (result.get("properties") or {}).get("security-severity")
+        ref = (
+            result.get("ruleId") or rule.get("id"),
+            result.get("ruleIndex", rule.get("index")),
+            result.get("level"),
+            score if isinstance(score, (str, int, float)) else None,
+        )
+        if self._rules_seen:
+            self._resolve(ref, self.keep(result), 1)
+        else:
+            self._pending[(ref, self.keep(result))] += 1
+
+    def end_rules(self) -> None:
+        self._rules_seen = True
+        for (ref, kept), n in self._pending.items():
+            self._resolve(ref, kept, n)
+        self._pending = Counter()
+
+    def end_run(self) -> None:
+        # A run without `tool` still gets its results counted, at their own levels
+        self.end_rules()
+
+    def _resolve(self, ref: Tuple[Any, Any, Any, Any], kept: Any, n: int) -> None:
+        rule_id, index, level, score = ref
+        if not rule_id and isinstance(index, int) and 0 <= index < len(self._rule_ids):
+            rule_id = self._rule_ids[index]
+        rule_id = rule_id or "(unknown rule)"
+        rule_score, rule_level = self._rules.get(rule_id, (None, None))
+        # SARIF: the result's own level wins over the rule default, and a missing level means warning
+        severity = _cvss_severity(score) or _cvss_severity(rule_score) or LEVEL_SEVERITY.get(level or rule_level or "warning", "medium")
+        self.on_result(rule_id, severity, kept, n)
+
+
+def _read_tool(stream: JsonStream, sink: SarifSink) -> Optional[str]:
+    tool_name = None
+    for key in stream.members():
+        if key == "driver":
+            for dkey in stream.members():
+                if dkey == "name":
+                    tool_name = stream.value()
+                elif dkey == "rules":
+                    for _ in stream.items():
+                        sink.add_rule(stream.value())
+                else:
+                    stream.skip()
+        elif key == "extensions":
+            # Rules of tool extensions (e.g. CodeQL query packs); results may reference them by id
+            for _ in stream.items():
+                for ekey in stream.members():
+                    if ekey == "rules":
+                        for _ in stream.items():
+                            sink.add_rule(stream.value(), indexed=False)
+                    else:
+                        stream.skip()
+        else:
+            stream.skip()
+    return tool_name
+
+
+def read_sarif(path: str, sink: SarifSink) -> SarifSink:
+    """Feed every result of every run in the SARIF file at `path` to `sink`, reading it incrementally."""
+    try:
+        f = open(path, "r", encoding="utf-8-sig")
+    except OSError:
+        return sink
+    sink.found = True
+    try:
+        with f:
+            stream = JsonStream(f)
+            for key in stream.members():
+                if key != "runs":
+                    stream.skip()
+                    continue
+                for _ in stream.items():
+                    sink.start_run()
+                    tool_name = None
+                    for rkey in stream.members():
+                        if rkey == "tool":
+                            tool_name = _read_tool(stream, sink)
+                            sink.end_rules()
+                        elif rkey == "results":
+                            if stream.peek() != "[":
+                                stream.skip()
+                                continue
+                            for _ in stream.items():
+                                sink.add_result(stream.value())
+                        else:
+                            stream.skip()
+                    sink.end_run()
+                    sink.runs.append(tool_name or "unknown")
+    except (ValueError, OSError) as exc:
+        # Keep whatever was counted before the damage
+        sink.error = str(exc)
+        sink.end_run()
+    return sink
@@ -1,19 +1,83 @@
 #!/usr/bin/env python3
-import os, json, argparse
+import os, argparse
+from collections import Counter
+
+# The streaming SARIF reader is shared with the API's findings store, which imports it from here
+from sarif import SEVERITIES, SarifSink, read_sarif, result_path
 
 ASVS_LEVEL = os.getenv("ASVS_LEVEL", "L1")
 
-def load_sarif(path: str):
-    try:
-        data = json.load(open(path, 'r', encoding='utf-8'))
-        return data.get('runs', [])[0].get('results', [])
-    except Exception:
-        return []
+TOP_N = 10
+
+
+class SarifSummary(SarifSink):
+    """Per-severity, per-rule and per-file counts over every run of one SARIF report."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.by_severity = Counter()
+        self.by_rule = Counter()
+        self.by_file = Counter()
+        self.rule_severity = {}
+
+    def keep(self, result):
+        return result_path(result)
+
+    def on_result(self, rule_id, severity, path, n):
+        self.by_rule[rule_id] += n
+        self.by_severity[severity] += n
+        if path:
+            self.by_file[path] += n
+        worst = self.rule_severity.get(rule_id)
+        if worst is None or SEVERITIES.index(severity) < SEVERITIES.index(worst):
+            self.rule_severity[rule_id] = severity
+
+
+def load_sarif(path: str) -> SarifSummary:
+    """Aggregate every result of every run in the SARIF file at `path`."""
+    return read_sarif(path, SarifSummary(path))
 
-def summarize(findings, name: str) -> str:
-    if not findings:
+
+def _severity_line(counter):
+    parts = [f"{counter[s]} {s}" for s in SEVERITIES if counter[s]]
+    return ", ".join(parts) if parts else "none"
+
+
+def summarize(summary: SarifSummary, name: str) -> str:
+    if not summary.found:
         return f"### {name}\n- No findings (or report missing).\n"
-    lines = [f"### {name}", f"- Findings: {len(findings)}"]
+    lines = [f"### {name}"]
+    if summary.error:
+        lines.append(f"- Report could not be fully parsed ({summary.error}); counts below are partial.")
+    if not summary.total:
+        lines.append("- No findings.")
+        return "\n".join(lines) + "\n"
+    lines.append(f"- Findings: {summary.total} ({_severity_line(summary.by_severity)})")
+    if len(summary.runs) > 1:
+        lines.append(f"- Runs: {len(summary.runs)} ({', '.join(summary.runs)})")
+    lines.append("- Top rules:")
+    for rule_id, n in summary.by_rule.most_common(TOP_N):
+        title = summary.rule_titles.get(rule_id)
+        label = f"`{rule_id}` ({summary.rule_severity.get(rule_id, 'medium')})" + (f" – {title}" if title else "")
+        lines.append(f"  - {label}: {n}")
+    if summary.by_file:
+        lines.append("- Most affected files:")
+        for path, n in summary.by_file.most_common(TOP_N):
+            lines.append(f"  - `{path}`: {n}")
+    return "\n".join(lines) + "\n"
+
+
+def overview(reports) -> str:
+    """Severity totals per scanner, plus the combined row the acceptance criteria are measured against."""
+    lines = ["## Findings Overview", "", "| Scanner | " + " | ".join(s.capitalize() for s in SEVERITIES) + " | Total |",
+             "|---|" + "---:|" * (len(SEVERITIES) + 1)]
+    combined = Counter()
+    for name, summary in reports:
+        if not summary.found:
+            continue
+        combined.update(summary.by_severity)
+        lines.append(f"| {name} | " + " | ".join(str(summary.by_severity[s]) for s in SEVERITIES) + f" | {summary.total} |")
+    lines.append("| **All** | " + " | ".join(str(combined[s]) for s in SEVERITIES) + f" | {sum(combined.values())} |")
     return "\n".join(lines) + "\n"
 
 def main():
@@ -35,17 +99,28 @@ def main():
     sections.append(f"_Target ASVS Level: **{ASVS_LEVEL}**_  ")
     sections.append("This draft groups scanner findings by workstream and proposes priceable scopes with acceptance criteria.")
 
-    sections.append(summarize(semgrep, "SAST (Semgrep)"))
-    sections.append(summarize(codeql, "SAST (CodeQL)"))
-    sections.append(summarize(gitleaks, "Secrets (Gitleaks)"))
-    sections.append(summarize(grype, "Dependencies/Vulns (Grype from Syft SBOM)"))
+    reports = [
+        ("SAST (Semgrep)", semgrep),
+        ("SAST (CodeQL)", codeql),
+        ("Secrets (Gitleaks)", gitleaks),
+        ("Dependencies/Vulns (Grype from Syft SBOM)", grype),
+    ]
+    sections.append(overview(reports))
+    for name, summary in reports:
+        sections.append(summarize(summary, name))
+
+    code = Counter()
+    for summary in (semgrep, codeql, gitleaks):
+        code.update(summary.by_severity)
 
     scopes = f"""## Proposed Scopes
 1) **SAST + Secrets Remediation Sprint**
+   - **Current**: {_severity_line(code)} across SAST and secrets scans; {gitleaks.total} secret finding(s).
    - **Acceptance**: No Critical findings; Highs <= 3; PR checks enforcing SARIF gates.
    - **Deliverables**: Fixed PRs, rule suppressions with rationale, updated docs.
 
 2) **Supply Chain Hardening**
+   - **Current**: {_severity_line(grype.by_severity)} dependency vulnerabilities.
    - **Acceptance**: Cosign-signed images; SBOM published; SLSA build provenance (Level 1→2).
    - **Deliverables**: CI pipeline, release notes, verification docs.
 
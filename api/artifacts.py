@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+try:  # optional dependency; gzip is always offered
+    import zstandard  # type: ignore
+except Exception:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+
+# Reports at least this large get .gz (and .zst) copies when the job finishes; smaller ones are compressed per request
+ANALYZER_PRECOMPRESS_MIN_BYTES = int(os.getenv("ANALYZER_PRECOMPRESS_MIN_BYTES", str(1 << 20)))
+# Responses smaller than this are not worth compressing
+_COMPRESS_MIN_BYTES = 1024
+_CHUNK_BYTES = 256 * 1024
+_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+# Copies are written once per job, so they can afford slower levels than per-request compression
+_PRECOMPRESS_LEVELS = {"zstd": 10, "gzip": 9}
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_MEDIA_TYPES = {
+    ".sarif": "application/sarif+json",
+    ".json": "application/json",
+    ".md": "text/markdown; charset=utf-8",
+}
+
+
+def media_type(path: Path) -> str:
+    return _MEDIA_TYPES.get(path.suffix.lower(), "application/octet-stream")
+
+
+def file_etag(st: os.stat_result) -> str:
+    # Artifacts are written once and never edited in place, so size + mtime identify the content
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against `etag`."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == bare:
+            return True
+    return False
+
+
+def not_modified(request: Request, etag: str, headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+    """A 304 response when the client already holds `etag`, else None."""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
+    return None
+
+
+def negotiate_encoding(header: Optional[str], offered: List[str]) -> Optional[str]:
+    """The first of `offered` (server preference order) with the highest q-value, or None for identity."""
+    prefs: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        prefs[name] = q
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = prefs.get(encoding, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive `(start, end)` of a single `bytes=` range, or None to send the whole file.
+
+    Multiple or malformed ranges are ignored, as RFC 9110 allows. Raises
+    ValueError when the range cannot be satisfied.
+    """
+    m = _RANGE_RE.match((header or "").strip())
+    if not m or m.group(1) == m.group(2) == "":
+        return None
+    first, last = m.group(1), m.group(2)
+    if first == "":
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _read_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        left = end - start + 1
+        while left > 0:
+            chunk = f.read(min(_CHUNK_BYTES, left))
+            if not chunk:
+                return
+            left -= len(chunk)
+            yield chunk
+
+
+def _compress(path: Path, encoding: str, level: Optional[int] = None) -> Iterator[bytes]:
+    if encoding == "zstd":
+        comp = zstandard.ZstdCompressor(level=level or 3).compressobj()
+    else:
+        # wbits=31: gzip container
+        comp = zlib.compressobj(level or 6, zlib.DEFLATED, 31)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_CHUNK_BYTES)
+            if not chunk:
+                break
+            out = comp.compress(chunk)
+            if out:
+                yield out
+    yield comp.flush()
+
+
+def _offered() -> List[str]:
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def precompress(path: Path, out_dir: Path) -> List[Path]:
+    """Write compressed copies of `path` into `out_dir`, one per supported encoding."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    st = path.stat()
+    written: List[Path] = []
+    for encoding in _offered():
+        dest = out_dir / (path.name + _SUFFIXES[encoding])
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as out:
+            for chunk in _compress(path, encoding, level=_PRECOMPRESS_LEVELS[encoding]):
+                out.write(chunk)
+        # Stamped with the source mtime, so a copy of an older version is never served
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, dest)
+        written.append(dest)
+    return written
+
+
+def _precompressed(path: Path, st: os.stat_result, copies_dir: Optional[Path], encoding: str) -> Optional[Path]:
+    if copies_dir is None:
+        return None
+    copy = copies_dir / (path.name + _SUFFIXES[encoding])
+    try:
+        return copy if copy.stat().st_mtime_ns == st.st_mtime_ns else None
+    except OSError:
+        return None
+
+
+def file_response(request: Request, path: Path, copies_dir: Optional[Path] = None, filename: Optional[str] = None) -> Response:
+    """Serve `path` from disk with ETag revalidation, a single byte range, or gzip/zstd.
+
+    Full identity responses go out as a FileResponse, which hands the path to
+    the server when it supports `http.response.pathsend` and otherwise streams
+    it in chunks; nothing is read into memory whole. Ranges always refer to the
+    uncompressed file, so a ranged request is never compressed. Copies written
+    by `precompress` into `copies_dir` are preferred over compressing on the fly.
+    """
+    st = path.stat()
+    etag = file_etag(st)
+    ranged = "range" in request.headers
+    encoding = None
+    if not ranged and st.st_size >= _COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"), _offered())
+    if encoding is not None:
+        etag = f'{etag[:-1]}-{encoding}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if filename:
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+    cached = not_modified(request, etag, headers)
+    if cached is not None:
+        return cached
+    kind = media_type(path)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        copy = _precompressed(path, st, copies_dir, encoding)
+        if copy is not None:
+            return FileResponse(copy, media_type=kind, headers=headers)
+        return StreamingResponse(_compress(path, encoding), media_type=kind, headers=headers)
+    # If-Range with a stale validator means the client wants the whole new file
+    if ranged and request.headers.get("if-range", etag) == etag:
+        try:
+            span = byte_range(request.headers.get("range"), st.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+        if span is not None:
+            start, end = span
+            headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(_read_range(path, start, end), status_code=206, media_type=kind, headers=headers)
+    return FileResponse(path, media_type=kind, headers=headers, stat_result=st)
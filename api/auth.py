@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import hashlib
+import hmac
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException
@@ -18,6 +23,8 @@ OAUTH_SIGNING_KEY = os.getenv("OAUTH_SIGNING_KEY", "dev-signing-key-change-me")
 OAUTH_ISSUER = os.getenv("OAUTH_ISSUER", "vibefunder-analyzer")
 OAUTH_AUDIENCE = os.getenv("OAUTH_AUDIENCE", "analyzer-api")
 OAUTH_TOKEN_TTL_SECONDS = int(os.getenv("OAUTH_TOKEN_TTL_SECONDS", "3600"))
+# Verified tokens remembered (until their `exp`) so polling clients skip the JWT decode
+OAUTH_TOKEN_CACHE_SIZE = int(os.getenv("OAUTH_TOKEN_CACHE_SIZE", "10000"))
 
 _clients_env = os.getenv("OAUTH_CLIENTS", "{}")
 try:
@@ -25,6 +32,26 @@ try:
 except Exception:
     OAUTH_CLIENTS = {}
 
+# Scopes a client may be granted on top of the default, e.g. {"release-bot": "priority:high"}
+_client_scopes_env = os.getenv("OAUTH_CLIENT_SCOPES", "{}")
+try:
+    OAUTH_CLIENT_SCOPES: Dict[str, str] = json.loads(_client_scopes_env)
+except Exception:
+    OAUTH_CLIENT_SCOPES = {}
+
+DEFAULT_SCOPE = "analyze:write"
+
+
+def grant_scope(client_id: str, requested: Optional[str]) -> str:
+    """The requested scopes this client may hold; anything it was not configured for is dropped."""
+    allowed = {DEFAULT_SCOPE, *str(OAUTH_CLIENT_SCOPES.get(client_id, "")).split()}
+    granted = [s for s in (requested or DEFAULT_SCOPE).split() if s in allowed]
+    return " ".join(granted) or DEFAULT_SCOPE
+
+
+def has_scope(claims: Dict[str, object], scope: str) -> bool:
+    return scope in str(claims.get("scope", "")).split()
+
 
 def issue_token(client_id: str, scope: Optional[str] = None) -> Dict[str, object]:
     now = datetime.now(tz=timezone.utc)
@@ -35,7 +62,7 @@ def issue_token(client_id: str, scope: Optional[str] = None) -> Dict[str, object
         "aud": OAUTH_AUDIENCE,
         "iat": int(now.timestamp()),
         "exp": int(exp.timestamp()),
-        "scope": scope or "analyze:write",
+        "scope": scope or DEFAULT_SCOPE,
     }
     token = jwt.encode(payload, OAUTH_SIGNING_KEY, algorithm="HS256")
     return {
@@ -46,22 +73,70 @@ def issue_token(client_id: str, scope: Optional[str] = None) -> Dict[str, object
     }
 
 
+class TokenCache:
+    """LRU of verified token claims, keyed by the token's SHA-256 and valid until its `exp`.
+
+    Only successful verifications are stored, so a flood of bad tokens cannot
+    evict good ones or be answered from memory.
+    """
+
+    def __init__(self, max_entries: int = OAUTH_TOKEN_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, object]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Dict[str, object]]:
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: Dict[str, object]) -> None:
+        exp = payload.get("exp")
+        if self.max_entries <= 0 or not isinstance(exp, (int, float)):
+            return
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        with self._lock:
+            self._entries[key] = (float(exp), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+TOKEN_CACHE = TokenCache()
+
+
 def verify_token(token: str, required_scope: Optional[str] = None) -> Dict[str, object]:
-    try:
-        payload = jwt.decode(token, OAUTH_SIGNING_KEY, algorithms=["HS256"], audience=OAUTH_AUDIENCE, issuer=OAUTH_ISSUER)
-    except jwt.PyJWTError as exc:  # type: ignore[attr-defined]
-        raise HTTPException(status_code=401, detail=f"invalid_token: {exc}")
-    if required_scope:
-        scopes = str(payload.get("scope", "")).split()
-        if required_scope not in scopes:
-            raise HTTPException(status_code=403, detail="insufficient_scope")
+    payload = TOKEN_CACHE.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, OAUTH_SIGNING_KEY, algorithms=["HS256"], audience=OAUTH_AUDIENCE, issuer=OAUTH_ISSUER)
+        except jwt.PyJWTError as exc:  # type: ignore[attr-defined]
+            raise HTTPException(status_code=401, detail=f"invalid_token: {exc}")
+        TOKEN_CACHE.put(token, payload)
+    if required_scope and not has_scope(payload, required_scope):
+        raise HTTPException(status_code=403, detail="insufficient_scope")
     return payload
 
 
 http_bearer = HTTPBearer(auto_error=False)
 
 
-def require_auth(credentials: Optional[HTTPAuthorizationCredentials] = Depends(http_bearer)) -> Dict[str, object]:
+async def require_auth(credentials: Optional[HTTPAuthorizationCredentials] = Depends(http_bearer)) -> Dict[str, object]:
+    # async so the check runs inline on the event loop rather than costing a threadpool hop per request
     if credentials is None or credentials.scheme.lower() != "bearer":
         raise HTTPException(status_code=401, detail="missing_authorization")
     return verify_token(credentials.credentials)
@@ -72,11 +147,6 @@ def authenticate_client(client_id: str, client_secret: str) -> bool:
     if not expected:
         return False
     # Constant-time compare
-    if len(expected) != len(client_secret):
-        return False
-    result = 0
-    for x, y in zip(expected.encode(), client_secret.encode()):
-        result |= x ^ y
-    return result == 0
+    return hmac.compare_digest(expected.encode("utf-8"), client_secret.encode("utf-8"))
 
 
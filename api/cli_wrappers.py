@@ -1,41 +1,225 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import re
 import shlex
+import signal
 import subprocess
+import time
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import sys
 
+from .deadline import Deadline
+
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
+# Worker processes for the indexer's parse/chunk/embed work (0 = all cores)
+ANALYZER_INDEX_JOBS = int(os.getenv("ANALYZER_INDEX_JOBS", "0"))
+
+
+# How often a running command checks for cancellation, and how long it gets to exit after SIGTERM
+_POLL_SECONDS = 0.2
+_KILL_GRACE_SECONDS = 0.5
+
+
+class ProcessCanceled(RuntimeError):
+    """A command was killed because its job was canceled."""
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    # The command runs in its own session, so its pid is also the process group id;
+    # signalling the group takes down every child it spawned as well.
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return
+        try:
+            proc.wait(timeout=_KILL_GRACE_SECONDS)
+            return
+        except subprocess.TimeoutExpired:
+            continue
 
 
-def _run(cmd: list[str], cwd: Optional[Path] = None, timeout: Optional[int] = None) -> subprocess.CompletedProcess:
+def _command_env() -> Dict[str, str]:
     env = os.environ.copy()
     # Ensure non-interactive, predictable locale
     env.setdefault("LC_ALL", "C")
     env.setdefault("LANG", "C")
-    return subprocess.run(cmd, cwd=str(cwd) if cwd else None, env=env, capture_output=True, text=True, timeout=timeout, check=False)
-
-
-def tools_available() -> Dict[str, bool]:
-    tools = {
-        "git": ["git", "--version"],
-        "semgrep": ["semgrep", "--version"],
-        "gitleaks": ["gitleaks", "version"],
-        "syft": ["syft", "version"],
-        "grype": ["grype", "version"],
-    }
-    availability: Dict[str, bool] = {}
-    for name, cmd in tools.items():
+    return env
+
+
+def _run(
+    cmd: list[str],
+    cwd: Optional[Path] = None,
+    timeout: Optional[float] = None,
+    deadline: Optional[Deadline] = None,
+    stdout_path: Optional[Path] = None,
+) -> subprocess.CompletedProcess:
+    """Run `cmd` to completion in its own process group.
+
+    `timeout` is additionally capped by what is left of `deadline`. The calling
+    thread supervises the command: on timeout or once the deadline's job is
+    canceled, the whole group is terminated (SIGTERM, then SIGKILL) within
+    about a second and TimeoutExpired / ProcessCanceled is raised. With
+    `stdout_path`, stdout is written to that file instead of being captured.
+    """
+    if deadline is not None:
+        if deadline.canceled():
+            raise ProcessCanceled(f"{cmd[0]} canceled")
+        timeout = deadline.timeout(cap=timeout)
+    out_file = open(stdout_path, "w", encoding="utf-8") if stdout_path else None
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            cwd=str(cwd) if cwd else None,
+            env=_command_env(),
+            stdin=subprocess.DEVNULL,
+            stdout=out_file if out_file else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        expires = time.monotonic() + timeout if timeout else None
+        while True:
+            try:
+                stdout, stderr = proc.communicate(timeout=_POLL_SECONDS)
+                return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+            except subprocess.TimeoutExpired:
+                pass
+            if deadline is not None and deadline.canceled():
+                _kill_group(proc)
+                proc.communicate()
+                raise ProcessCanceled(f"{cmd[0]} canceled")
+            if expires is not None and time.monotonic() >= expires:
+                _kill_group(proc)
+                stdout, stderr = proc.communicate()
+                raise subprocess.TimeoutExpired(cmd, timeout or 0, output=stdout, stderr=stderr)
+    finally:
+        if out_file:
+            out_file.close()
+
+
+async def _kill_group_async(proc: asyncio.subprocess.Process) -> None:
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return
+        try:
+            await asyncio.wait_for(proc.wait(), _KILL_GRACE_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+
+async def _run_async(
+    cmd: list[str],
+    cwd: Optional[Path] = None,
+    timeout: Optional[float] = None,
+    deadline: Optional[Deadline] = None,
+    stdout_path: Optional[Path] = None,
+) -> subprocess.CompletedProcess:
+    """Async twin of `_run` for request handlers: same timeout, deadline and
+    process-group handling, but the event loop supervises the command instead
+    of a blocked thread.
+
+    stdout and stderr are drained as they are produced (stdout straight into
+    `stdout_path` when given). If the awaiting task is cancelled, e.g. because
+    the client went away, the command's process group is killed.
+    """
+    if deadline is not None:
+        if deadline.canceled():
+            raise ProcessCanceled(f"{cmd[0]} canceled")
+        timeout = deadline.timeout(cap=timeout)
+    out_file = open(stdout_path, "wb") if stdout_path else None
+    chunks: Dict[str, List[bytes]] = {"stdout": [], "stderr": []}
+
+    async def drain(stream: asyncio.StreamReader, name: str) -> None:
+        while True:
+            chunk = await stream.read(1 << 16)
+            if not chunk:
+                return
+            if name == "stdout" and out_file is not None:
+                out_file.write(chunk)
+            else:
+                chunks[name].append(chunk)
+
+    def text(name: str) -> Optional[str]:
+        if name == "stdout" and out_file is not None:
+            return None
+        return b"".join(chunks[name]).decode("utf-8", errors="replace")
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(cwd) if cwd else None,
+            env=_command_env(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        finished = asyncio.ensure_future(asyncio.gather(drain(proc.stdout, "stdout"), drain(proc.stderr, "stderr"), proc.wait()))  # type: ignore[arg-type]
+        expires = time.monotonic() + timeout if timeout else None
         try:
-            result = _run(cmd)
-            availability[name] = result.returncode == 0
-        except Exception:
-            availability[name] = False
-    return availability
+            while True:
+                done, _pending = await asyncio.wait({finished}, timeout=_POLL_SECONDS)
+                if done:
+                    finished.result()
+                    return subprocess.CompletedProcess(cmd, proc.returncode, text("stdout"), text("stderr"))
+                if deadline is not None and deadline.canceled():
+                    await _kill_group_async(proc)
+                    await finished
+                    raise ProcessCanceled(f"{cmd[0]} canceled")
+                if expires is not None and time.monotonic() >= expires:
+                    await _kill_group_async(proc)
+                    await finished
+                    raise subprocess.TimeoutExpired(cmd, timeout or 0, output=text("stdout"), stderr=text("stderr"))
+        except asyncio.CancelledError:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            finished.cancel()
+            # Mark the drained outcome as seen so asyncio does not log it as lost
+            finished.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise
+    finally:
+        if out_file:
+            out_file.close()
+
+
+_TOOL_PROBES = {
+    "git": ["git", "--version"],
+    "semgrep": ["semgrep", "--version"],
+    "gitleaks": ["gitleaks", "version"],
+    "syft": ["syft", "version"],
+    "grype": ["grype", "version"],
+}
+
+
+# A hung tool (e.g. semgrep waiting on the network) must not stall the probe forever
+_PROBE_TIMEOUT_SECONDS = 60
+# First dotted version number in a tool's output ("git version 2.43.0", "Version: 0.98.0", "v8.18.1")
+_VERSION_RE = re.compile(r"\d+(?:\.\d+)+(?:[-+][0-9A-Za-z.-]+)?")
+
+
+def probe_tool(cmd: list[str]) -> Dict[str, object]:
+    """Run one version probe: whether the tool works, its parsed version and the first line it printed."""
+    try:
+        result = _run(cmd, timeout=_PROBE_TIMEOUT_SECONDS)
+    except Exception:
+        return {"available": False, "version": None, "raw": None}
+    if result.returncode != 0:
+        return {"available": False, "version": None, "raw": None}
+    output = result.stdout or result.stderr or ""
+    lines = [ln.strip() for ln in output.splitlines() if ln.strip()]
+    raw = lines[0] if lines else ""
+    m = _VERSION_RE.search(output)
+    return {"available": True, "version": m.group(0) if m else raw, "raw": raw}
 
 
 def sanitize_url_for_logging(url: str) -> str:
@@ -43,26 +227,103 @@ def sanitize_url_for_logging(url: str) -> str:
     return re.sub(r"(https?://)([^:@/]+):([^@/]+)@", r"\1\2:***@", url)
 
 
-def clone_repo(repo_url: str, dest_dir: Path, github_token: Optional[str] = None, branch: Optional[str] = None, timeout: Optional[int] = None) -> str:
-    dest_dir = Path(dest_dir)
-    dest_dir.parent.mkdir(parents=True, exist_ok=True)
-    url = repo_url
+def _authenticated_url(repo_url: str, github_token: Optional[str]) -> str:
     if github_token and repo_url.startswith("https://"):
         # Embed token safely without logging it; use x-access-token per GitHub docs
-        url = repo_url.replace("https://", f"https://x-access-token:{github_token}@")
+        return repo_url.replace("https://", f"https://x-access-token:{github_token}@")
+    return repo_url
+
+
+def clone_repo(repo_url: str, dest_dir: Path, github_token: Optional[str] = None, branch: Optional[str] = None, timeout: Optional[float] = None, use_cache: bool = True, deadline: Optional[Deadline] = None) -> str:
+    dest_dir = Path(dest_dir)
+    dest_dir.parent.mkdir(parents=True, exist_ok=True)
+    url = _authenticated_url(repo_url, github_token)
+
+    from .repo_cache import REPO_CACHE_ENABLED, checkout_from_mirror
 
+    if use_cache and REPO_CACHE_ENABLED:
+        # Incremental fetch into a shared bare mirror, then a local shallow checkout
+        checkout_from_mirror(repo_url, url, dest_dir=dest_dir, branch=branch, timeout=timeout, deadline=deadline)
+        return sanitize_url_for_logging(repo_url)
+
+    result = _run(_clone_cmd(url, dest_dir, branch), timeout=timeout, deadline=deadline)
+    if result.returncode != 0:
+        raise RuntimeError(f"git clone failed: {sanitize_url_for_logging(repo_url)}\n{result.stderr}")
+    return sanitize_url_for_logging(repo_url)
+
+
+async def clone_repo_async(repo_url: str, dest_dir: Path, github_token: Optional[str] = None, branch: Optional[str] = None, timeout: Optional[float] = None, use_cache: bool = True, deadline: Optional[Deadline] = None) -> str:
+    dest_dir = Path(dest_dir)
+    dest_dir.parent.mkdir(parents=True, exist_ok=True)
+    url = _authenticated_url(repo_url, github_token)
+
+    from .repo_cache import REPO_CACHE_ENABLED, checkout_from_mirror_async
+
+    if use_cache and REPO_CACHE_ENABLED:
+        await checkout_from_mirror_async(repo_url, url, dest_dir=dest_dir, branch=branch, timeout=timeout, deadline=deadline)
+        return sanitize_url_for_logging(repo_url)
+
+    result = await _run_async(_clone_cmd(url, dest_dir, branch), timeout=timeout, deadline=deadline)
+    if result.returncode != 0:
+        raise RuntimeError(f"git clone failed: {sanitize_url_for_logging(repo_url)}\n{result.stderr}")
+    return sanitize_url_for_logging(repo_url)
+
+
+def _clone_cmd(url: str, dest_dir: Path, branch: Optional[str]) -> list[str]:
     cmd = ["git", "clone", "--depth", "1"]
     if branch:
         cmd += ["--branch", branch]
-    cmd += [url, str(dest_dir)]
+    return cmd + [url, str(dest_dir)]
+
+
+def _ls_remote_cmd(url: str, branch: Optional[str]) -> list[str]:
+    refs = [f"refs/heads/{branch}", f"refs/tags/{branch}", f"refs/tags/{branch}^{{}}"] if branch else ["HEAD"]
+    return ["git", "ls-remote", url, *refs]
 
-    result = _run(cmd, timeout=timeout)
+
+def _remote_commit(repo_url: str, branch: Optional[str], result: subprocess.CompletedProcess) -> Optional[str]:
     if result.returncode != 0:
-        raise RuntimeError(f"git clone failed: {sanitize_url_for_logging(repo_url)}\n{result.stderr}")
-    return sanitize_url_for_logging(repo_url)
+        raise RuntimeError(f"git ls-remote failed: {sanitize_url_for_logging(repo_url)}\n{sanitize_url_for_logging(result.stderr or '')}")
+    found: Dict[str, str] = {}
+    for line in (result.stdout or "").splitlines():
+        parts = line.split("\t")
+        if len(parts) == 2:
+            found[parts[1].strip()] = parts[0].strip()
+    if not branch:
+        return found.get("HEAD")
+    # Same preference as `git clone --branch`: branch first, then the commit a tag points at
+    for ref in (f"refs/heads/{branch}", f"refs/tags/{branch}^{{}}", f"refs/tags/{branch}"):
+        if ref in found:
+            return found[ref]
+    return None
+
+
+def resolve_remote_commit(repo_url: str, github_token: Optional[str] = None, branch: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Optional[str]:
+    # Cheap `ls-remote` lookup of the commit a clone would check out, without fetching objects
+    url = _authenticated_url(repo_url, github_token)
+    return _remote_commit(repo_url, branch, _run(_ls_remote_cmd(url, branch), timeout=timeout, deadline=deadline))
+
+
+async def resolve_remote_commit_async(repo_url: str, github_token: Optional[str] = None, branch: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Optional[str]:
+    url = _authenticated_url(repo_url, github_token)
+    return _remote_commit(repo_url, branch, await _run_async(_ls_remote_cmd(url, branch), timeout=timeout, deadline=deadline))
+
+
+def resolve_commit(repo_dir: Path, timeout: Optional[int] = None) -> Optional[str]:
+    result = _run(["git", "-C", str(repo_dir), "rev-parse", "HEAD"], timeout=timeout)
+    if result.returncode != 0:
+        return None
+    return (result.stdout or "").strip() or None
+
 
+async def resolve_commit_async(repo_dir: Path, timeout: Optional[int] = None) -> Optional[str]:
+    result = await _run_async(["git", "-C", str(repo_dir), "rev-parse", "HEAD"], timeout=timeout)
+    if result.returncode != 0:
+        return None
+    return (result.stdout or "").strip() or None
 
-def run_semgrep(repo_dir: Path, reports_dir: Path, config_path: Path, timeout: Optional[int] = None) -> Path:
+
+def run_semgrep(repo_dir: Path, reports_dir: Path, config_path: Path, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Path:
     reports_dir.mkdir(parents=True, exist_ok=True)
     out = reports_dir / "semgrep.sarif"
     cmd = [
@@ -71,11 +332,11 @@ def run_semgrep(repo_dir: Path, reports_dir: Path, config_path: Path, timeout: O
         "--sarif", "-o", str(out),
     ]
     # semgrep returns non-zero for findings in some modes; ignore rc but capture output
-    _run(cmd, cwd=repo_dir, timeout=timeout)
+    _run(cmd, cwd=repo_dir, timeout=timeout, deadline=deadline)
     return out
 
 
-def run_gitleaks(repo_dir: Path, reports_dir: Path, timeout: Optional[int] = None) -> Path:
+def run_gitleaks(repo_dir: Path, reports_dir: Path, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Path:
     reports_dir.mkdir(parents=True, exist_ok=True)
     out = reports_dir / "gitleaks.sarif"
     cmd = [
@@ -84,40 +345,47 @@ def run_gitleaks(repo_dir: Path, reports_dir: Path, timeout: Optional[int] = Non
         "--report-format", "sarif",
         "--report-path", str(out),
     ]
-    _run(cmd, timeout=timeout)
+    _run(cmd, timeout=timeout, deadline=deadline)
     return out
 
 
-def run_syft_grype(repo_dir: Path, reports_dir: Path, timeout: Optional[int] = None) -> Dict[str, Path]:
+def run_syft_grype(repo_dir: Path, reports_dir: Path, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Dict[str, Path]:
     reports_dir.mkdir(parents=True, exist_ok=True)
     sbom = reports_dir / "sbom.json"
     grype_out = reports_dir / "grype.sarif"
 
-    # syft dir scan to CycloneDX JSON
-    with open(sbom, "w", encoding="utf-8") as f:
-        _run(["syft", f"dir:{repo_dir}", "-o", "cyclonedx-json"], timeout=timeout, cwd=repo_dir)
-        # Unfortunately syft writes to stdout; re-run capturing stdout
-        proc = subprocess.Popen(["syft", f"dir:{repo_dir}", "-o", "cyclonedx-json"], stdout=f, stderr=subprocess.PIPE, text=True)
-        proc.wait(timeout=timeout)
+    # syft dir scan to CycloneDX JSON; syft writes the SBOM to stdout
+    _run(["syft", f"dir:{repo_dir}", "-o", "cyclonedx-json"], timeout=timeout, cwd=repo_dir, deadline=deadline, stdout_path=sbom)
 
     # grype against SBOM
-    with open(grype_out, "w", encoding="utf-8") as f:
-        proc = subprocess.Popen(["grype", f"sbom:{sbom}", "-o", "sarif"], stdout=f, stderr=subprocess.PIPE, text=True)
-        proc.wait(timeout=timeout)
+    _run(["grype", f"sbom:{sbom}", "-o", "sarif"], timeout=timeout, deadline=deadline, stdout_path=grype_out)
 
     return {"sbom": sbom, "grype": grype_out}
 
 
-def run_indexer(repo_dir: Path, index_out_dir: Path, timeout: Optional[int] = None) -> Path:
+def _run_warm(task: str, cmd: list[str], timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> subprocess.CompletedProcess:
+    """Run one of our own Python scripts in a warm worker, or cold when none is free."""
+    from .warm_worker import WARM_POOL  # local import: warm_worker builds on this module
+
+    result = WARM_POOL.run(task, cmd[2:], timeout=timeout, deadline=deadline)
+    if result is not None:
+        return result
+    return _run(cmd, timeout=timeout, cwd=REPO_ROOT, deadline=deadline)
+
+
+def run_indexer(repo_dir: Path, index_out_dir: Path, timeout: Optional[float] = None, deadline: Optional[Deadline] = None, previous_index_dir: Optional[Path] = None) -> Path:
     index_out_dir.mkdir(parents=True, exist_ok=True)
     script = REPO_ROOT / "tools" / "indexer" / "index_repo.py"
     py = sys.executable or "python3"
-    cmd = [py, str(script), "--repo", str(repo_dir), "--out", str(index_out_dir)]
-    _run(cmd, timeout=timeout, cwd=REPO_ROOT)
+    cmd = [py, str(script), "--repo", str(repo_dir), "--out", str(index_out_dir), "--jobs", str(ANALYZER_INDEX_JOBS)]
+    if previous_index_dir is not None:
+        # Files whose content hash is unchanged reuse that index's chunks and vectors
+        cmd += ["--previous", str(previous_index_dir)]
+    _run_warm("index", cmd, timeout=timeout, deadline=deadline)
     return index_out_dir
 
 
-def run_sow(index_dir: Path, reports_dir: Path, out_file: Path, timeout: Optional[int] = None) -> Path:
+def run_sow(index_dir: Path, reports_dir: Path, out_file: Path, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Path:
     out_file.parent.mkdir(parents=True, exist_ok=True)
     script = REPO_ROOT / "agents" / "security_agent.py"
     py = sys.executable or "python3"
@@ -128,7 +396,5 @@ def run_sow(index_dir: Path, reports_dir: Path, out_file: Path, timeout: Optiona
         "--reports", str(reports_dir),
         "--out", str(out_file),
     ]
-    _run(cmd, timeout=timeout, cwd=REPO_ROOT)
+    _run_warm("sow", cmd, timeout=timeout, deadline=deadline)
     return out_file
-
-
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tools.indexer.embeddings import embed_texts
+from tools.indexer.index_format import IndexReader
+
+try:
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover - optional
+    faiss = None
+
+
+# Bytes of loaded indexes (vectors + ANN structures) kept in memory across requests
+ANALYZER_SEARCH_CACHE_BYTES = int(os.getenv("ANALYZER_SEARCH_CACHE_BYTES", str(1024 * 1024 * 1024)))
+# hnsw | ivf | flat; used for indexes with at least ANALYZER_SEARCH_ANN_MIN_ROWS chunks
+ANALYZER_SEARCH_ANN = os.getenv("ANALYZER_SEARCH_ANN", "hnsw").lower()
+ANALYZER_SEARCH_ANN_MIN_ROWS = int(os.getenv("ANALYZER_SEARCH_ANN_MIN_ROWS", "20000"))
+
+# Built ANN structures are saved next to the index so a restart does not rebuild them
+ANN_FILE = "ann-{kind}.faiss"
+
+
+class LoadedIndex:
+    """An opened job index plus whatever structure answers its queries."""
+
+    def __init__(self, index_dir: Path) -> None:
+        self.reader = IndexReader(index_dir)
+        self.embedder = str(self.reader.header.get("embedder") or "hash")
+        self.kind = "flat"
+        self._ann = None
+        self._vectors: Optional[np.ndarray] = None
+        if len(self.reader) and faiss is not None:
+            self._ann, self.kind = self._load_ann(index_dir)
+        elif len(self.reader):
+            # NumPy fallback: exact scores over the (memory-mapped) matrix
+            self._vectors = np.asarray(self.reader.vectors)
+        self.nbytes = self._estimate_bytes()
+
+    def _load_ann(self, index_dir: Path) -> Tuple[object, str]:
+        kind = ANALYZER_SEARCH_ANN if len(self.reader) >= ANALYZER_SEARCH_ANN_MIN_ROWS else "flat"
+        path = index_dir / ANN_FILE.format(kind=kind)
+        if kind != "flat" and path.exists():
+            try:
+                index = faiss.read_index(str(path))
+                if index.ntotal == len(self.reader):
+                    return self._tune(index, kind), kind
+            except Exception:
+                pass
+        vecs = np.ascontiguousarray(self.reader.vectors, dtype="float32")
+        dim = vecs.shape[1]
+        if kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 80
+            index.add(vecs)
+        elif kind == "ivf":
+            nlist = max(1, int(4 * np.sqrt(len(vecs))))
+            index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vecs[np.random.default_rng(0).permutation(len(vecs))[: max(nlist * 40, 10000)]])
+            index.add(vecs)
+        else:
+            index = faiss.IndexFlatIP(dim)
+            index.add(vecs)
+        if kind != "flat":
+            try:
+                tmp = path.with_suffix(".tmp")
+                faiss.write_index(index, str(tmp))
+                os.replace(tmp, path)
+            except OSError:
+                pass
+        return self._tune(index, kind), kind
+
+    @staticmethod
+    def _tune(index: object, kind: str) -> object:
+        if kind == "hnsw":
+            index.hnsw.efSearch = 64  # type: ignore[attr-defined]
+        elif kind == "ivf":
+            index.nprobe = 8  # type: ignore[attr-defined]
+        return index
+
+    def _estimate_bytes(self) -> int:
+        rows, dim = len(self.reader), self.reader.dim
+        if self._ann is None:
+            return rows * dim * self.reader.vectors.dtype.itemsize if rows else 0
+        # Every faiss variant here keeps a float32 copy; HNSW adds its graph links
+        links = rows * 32 * 2 * 4 if self.kind == "hnsw" else 0
+        return rows * dim * 4 + links
+
+    def search(self, query: str, top_k: int) -> List[Dict[str, object]]:
+        if not len(self.reader):
+            return []
+        q = embed_texts([query], spec=self.embedder, batch_size=1, dtype="float32")
+        k = min(top_k, len(self.reader))
+        if self._ann is not None:
+            scores, rows = self._ann.search(q, k)  # type: ignore[attr-defined]
+            hits = [(int(r), float(s)) for r, s in zip(rows[0], scores[0]) if r >= 0]
+        else:
+            scores = self._vectors @ q[0].astype(self._vectors.dtype)  # type: ignore[operator]
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            hits = [(int(r), float(scores[r])) for r in top]
+        results = []
+        for row, score in hits:
+            record = self.reader.record(row)
+            record["score"] = round(score, 6)
+            results.append(record)
+        return results
+
+
+class IndexCache:
+    """LRU of opened job indexes, bounded by estimated resident bytes."""
+
+    def __init__(self, max_bytes: int = ANALYZER_SEARCH_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, LoadedIndex]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, index_dir: Path) -> LoadedIndex:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.reader.path == index_dir and (index_dir / "header.json").exists():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self._entries.pop(key, None)
+            gate = self._loading.setdefault(key, threading.Lock())
+        # One loader per index; concurrent requests for it wait instead of loading twice
+        with gate:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            try:
+                loaded = LoadedIndex(index_dir)
+                with self._lock:
+                    self.misses += 1
+                    self._entries[key] = loaded
+                    self._evict_locked(keep=key)
+                return loaded
+            finally:
+                # Also after a failed load (corrupt or half-written index), so gates never pile up
+                with self._lock:
+                    if self._loading.get(key) is gate:
+                        del self._loading[key]
+
+    def drop(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _evict_locked(self, keep: str) -> None:
+        total = sum(e.nbytes for e in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key).nbytes
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e.nbytes for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+INDEX_CACHE = IndexCache()
+
+
+def search_index(key: str, index_dir: Path, query: str, top_k: int) -> Tuple[List[Dict[str, object]], str, float]:
+    """Top `top_k` chunks of the index in `index_dir` for `query`, plus the search kind and elapsed ms."""
+    started = time.perf_counter()
+    loaded = INDEX_CACHE.get(key, index_dir)
+    results = loaded.search(query, top_k)
+    return results, loaded.kind, round((time.perf_counter() - started) * 1000, 2)
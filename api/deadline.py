@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, Dict, Optional
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        name, _, value = part.partition("=")
+        try:
+            weights[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return weights
+
+
+# Largest share of the job budget each step may use. Scanners and the indexer run
+# side by side, so their shares overlap rather than add up.
+STEP_WEIGHTS: Dict[str, float] = {
+    "resolve": 0.05,
+    "clone": 0.25,
+    "semgrep": 0.6,
+    "gitleaks": 0.6,
+    "sbom": 0.6,
+    "index": 0.5,
+    "trigram": 0.3,
+    "sow": 0.1,
+}
+STEP_WEIGHTS.update(_parse_weights(os.getenv("ANALYZER_STEP_WEIGHTS", "")))
+# Optional steps are skipped rather than started with less time than this
+ANALYZER_OPTIONAL_STEP_MIN_SECONDS = float(os.getenv("ANALYZER_OPTIONAL_STEP_MIN_SECONDS", "30"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """The job's overall time budget ran out."""
+
+
+class Deadline:
+    """One time budget for a whole job, plus its cancellation flag.
+
+    Created when the job starts and handed to every step, so the sum of all
+    steps can never outlive `timeout_seconds`.
+    """
+
+    def __init__(self, seconds: float, cancel: Optional[Callable[[], bool]] = None) -> None:
+        self.total = float(seconds)
+        self.expires_at = time.monotonic() + self.total
+        self._cancel = cancel
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def canceled(self) -> bool:
+        return bool(self._cancel and self._cancel())
+
+    def timeout(self, cap: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Seconds a command may run now: the time left minus `reserve`, capped at `cap`.
+
+        Raises DeadlineExceeded when nothing is left.
+        """
+        left = self.remaining() - reserve
+        if cap is not None:
+            left = min(left, cap)
+        if left <= 0:
+            raise DeadlineExceeded("job time budget exhausted")
+        return left
+
+    def share(self, name: str) -> float:
+        """The most a step may spend according to its weight."""
+        return self.total * STEP_WEIGHTS.get(name, 1.0)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tools.indexer.repo_walk import forget
+
+
+# Total bytes WORK_ROOT may hold before finished jobs are evicted
+ANALYZER_WORK_MAX_BYTES = int(os.getenv("ANALYZER_WORK_MAX_BYTES", str(20 * 1024 * 1024 * 1024)))
+# Bulky per-job data (checkout, index) is dropped this long after a job last wrote to it;
+# small artifacts (reports, SoW) live until the job store's retention evicts the job
+ANALYZER_JOB_TTL_SECONDS = int(os.getenv("ANALYZER_JOB_TTL_SECONDS", str(24 * 3600)))
+# /aggregate and /features scratch clones left behind by a crashed request
+ANALYZER_SCRATCH_TTL_SECONDS = int(os.getenv("ANALYZER_SCRATCH_TTL_SECONDS", "3600"))
+ANALYZER_GC_INTERVAL_SECONDS = int(os.getenv("ANALYZER_GC_INTERVAL_SECONDS", "300"))
+# Keep the checkout after the steps that read it have finished (debugging aid)
+ANALYZER_KEEP_CHECKOUT = os.getenv("ANALYZER_KEEP_CHECKOUT", "0").lower() in ("1", "true", "yes", "on")
+
+BULKY_PARTS = ("repo", "data")
+SMALL_PARTS = ("reports", "out")
+SCRATCH_PREFIXES = ("agg-", "feat-")
+
+
+def dir_size(path: Path) -> int:
+    total = 0
+    stack = [str(path)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except (NotADirectoryError, FileNotFoundError):
+            continue
+        except OSError:
+            continue
+    return total
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def remove_checkout(repo_dir: Path) -> None:
+    if not ANALYZER_KEEP_CHECKOUT:
+        forget(repo_dir)
+        shutil.rmtree(repo_dir, ignore_errors=True)
+
+
+def usage(work_root: Path) -> Dict[str, object]:
+    """Bytes used under `work_root`, split by kind of content."""
+    by_part: Dict[str, int] = {p: 0 for p in BULKY_PARTS + SMALL_PARTS}
+    scratch = 0
+    other = 0
+    jobs = 0
+    if work_root.exists():
+        for child in work_root.iterdir():
+            if not child.is_dir():
+                other += child.stat().st_size if child.exists() else 0
+                continue
+            if child.name.startswith(SCRATCH_PREFIXES):
+                scratch += dir_size(child)
+                continue
+            jobs += 1
+            for part in child.iterdir():
+                size = dir_size(part) if part.is_dir() else part.stat().st_size
+                if part.name in by_part:
+                    by_part[part.name] += size
+                else:
+                    other += size
+    total = sum(by_part.values()) + scratch + other
+    return {
+        "work_root": str(work_root),
+        "max_bytes": ANALYZER_WORK_MAX_BYTES,
+        "bytes": total,
+        "jobs": jobs,
+        "checkouts_bytes": by_part["repo"],
+        "indexes_bytes": by_part["data"],
+        "reports_bytes": by_part["reports"],
+        "outputs_bytes": by_part["out"],
+        "scratch_bytes": scratch,
+        "other_bytes": other,
+    }
+
+
+def collect(
+    work_root: Path,
+    is_active: Callable[[str], bool],
+    max_bytes: int = ANALYZER_WORK_MAX_BYTES,
+    ttl: int = ANALYZER_JOB_TTL_SECONDS,
+    scratch_ttl: int = ANALYZER_SCRATCH_TTL_SECONDS,
+    now: Optional[float] = None,
+) -> Dict[str, object]:
+    """One garbage collection pass over `work_root`.
+
+    1. Scratch dirs older than `scratch_ttl` and bulky parts (checkout, index)
+       of finished jobs older than `ttl` are deleted outright.
+    2. While usage is above `max_bytes`, bulky parts of finished jobs are
+       evicted largest first, then whole finished job dirs oldest first.
+
+    Jobs for which `is_active(job_id)` is true are never touched.
+    """
+    now = now or time.time()
+    removed: List[str] = []
+    freed = 0
+    if not work_root.exists():
+        return {"removed": removed, "freed_bytes": freed}
+
+    bulky: List[Tuple[int, float, Path]] = []
+    finished_dirs: List[Tuple[float, Path]] = []
+    total = 0
+    for child in work_root.iterdir():
+        if not child.is_dir():
+            try:
+                total += child.stat().st_size
+            except OSError:
+                pass
+            continue
+        size = dir_size(child)
+        if child.name.startswith(SCRATCH_PREFIXES):
+            if now - _mtime(child) > scratch_ttl:
+                shutil.rmtree(child, ignore_errors=True)
+                removed.append(child.name)
+                freed += size
+            else:
+                total += size
+            continue
+        if is_active(child.name):
+            total += size
+            continue
+        total += size
+        finished_dirs.append((_mtime(child), child))
+        for part_name in BULKY_PARTS:
+            part = child / part_name
+            if not part.exists():
+                continue
+            part_size = dir_size(part)
+            if now - _mtime(part) > ttl:
+                shutil.rmtree(part, ignore_errors=True)
+                removed.append(f"{child.name}/{part_name}")
+                freed += part_size
+                total -= part_size
+            else:
+                bulky.append((part_size, _mtime(part), part))
+
+    if total > max_bytes:
+        for part_size, _when, part in sorted(bulky, key=lambda t: (-t[0], t[1])):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(part, ignore_errors=True)
+            removed.append(f"{part.parent.name}/{part.name}")
+            freed += part_size
+            total -= part_size
+    if total > max_bytes:
+        for _when, job_dir in sorted(finished_dirs):
+            if total <= max_bytes:
+                break
+            size = dir_size(job_dir)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            removed.append(job_dir.name)
+            freed += size
+            total -= size
+
+    return {"removed": removed, "freed_bytes": freed, "bytes": total}
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import fnmatch
+from typing import Dict, List
+
+from .models import FeatureScanFinding, FeatureSpec
+
+try:
+    import ahocorasick  # type: ignore
+except Exception:  # pragma: no cover - optional
+    ahocorasick = None
+
+
+class FeatureMatcher:
+    """Counts keyword and robust-signal hits for many features in one pass per file.
+
+    Every keyword and signal of every feature is compiled into a single
+    Aho-Corasick automaton (pyahocorasick) when available. Each file is read
+    and lowercased once, and its text is fed through the automaton once. Counts
+    follow str.count semantics (non-overlapping, leftmost first), so findings
+    are identical to checking each feature separately. Without pyahocorasick,
+    each distinct pattern is counted once per file with str.count.
+    """
+
+    def __init__(self, features: List[FeatureSpec]) -> None:
+        self.features = features
+        self._keywords = [[kw.lower() for kw in (spec.keywords or [])] for spec in features]
+        self._robust = [[kw.lower() for kw in (spec.robust_signals or [])] for spec in features]
+        self._globs = [list(spec.file_globs or []) for spec in features]
+        self.patterns = sorted({p for group in self._keywords + self._robust for p in group if p})
+        # An empty keyword "occurs" in every file, so no file can be ruled out up front
+        self.matches_everything = any(not p for group in self._keywords + self._robust for p in group)
+        self._automaton = None
+        if ahocorasick is not None and self.patterns:
+            automaton = ahocorasick.Automaton()
+            for p in self.patterns:
+                automaton.add_word(p, (p, len(p)))
+            automaton.make_automaton()
+            self._automaton = automaton
+        self.keyword_hits = [0] * len(features)
+        self.robust_hits = [0] * len(features)
+        self.files_matched = [0] * len(features)
+
+    def _counts(self, txt: str) -> Dict[str, int]:
+        if self._automaton is None:
+            return {p: txt.count(p) for p in self.patterns}
+        counts: Dict[str, int] = {}
+        taken_until: Dict[str, int] = {}
+        # Matches arrive ordered by end position; for one pattern that is also start order,
+        # so greedily keeping those that start after the last kept one mirrors str.count
+        for end, (p, length) in self._automaton.iter(txt):
+            if end - length + 1 > taken_until.get(p, -1):
+                counts[p] = counts.get(p, 0) + 1
+                taken_until[p] = end
+        return counts
+
+    def add_text(self, txt: str) -> None:
+        """Account for one file's lowercased contents."""
+        counts = self._counts(txt)
+        empty = len(txt) + 1  # str.count("") semantics
+
+        def count(p: str) -> int:
+            return counts.get(p, 0) if p else empty
+
+        for i, patterns in enumerate(self._keywords):
+            if any(count(p) for p in patterns):
+                self.files_matched[i] += 1
+                self.keyword_hits[i] += sum(count(p) for p in patterns)
+            self.robust_hits[i] += sum(count(p) for p in self._robust[i])
+
+    def add_path(self, rel_path: str) -> None:
+        """Account for one file's path against every feature's file_globs."""
+        for i, globs in enumerate(self._globs):
+            for g in globs:
+                if fnmatch.fnmatch(rel_path, g):
+                    self.files_matched[i] += 1
+
+    def findings(self) -> List[FeatureScanFinding]:
+        results: List[FeatureScanFinding] = []
+        for i, spec in enumerate(self.features):
+            robust_hits = self.robust_hits[i]
+            results.append(FeatureScanFinding(
+                feature=spec.name,
+                present=(self.keyword_hits[i] > 0) or (self.files_matched[i] > 0),
+                keyword_hits=self.keyword_hits[i],
+                files_matched=self.files_matched[i],
+                robust_signals_hits=robust_hits,
+                notes=f"robust_signals_hits={robust_hits}" if robust_hits > 0 else None,
+            ))
+        return results
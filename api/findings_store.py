@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from agents.sarif import SEVERITIES, SarifSink, read_sarif, result_path
+
+from .job_store import ANALYZER_JOB_RETENTION_SECONDS
+from .repo_cache import normalize_url
+
+
+# Findings of finished jobs, normalized into one SQLite file for cross-job queries and diffs
+FINDINGS_ENABLED = os.getenv("ANALYZER_FINDINGS", "1").lower() not in ("0", "false", "no", "off")
+ANALYZER_FINDINGS_DB = os.getenv("ANALYZER_FINDINGS_DB")
+_BATCH_ROWS = 10000
+_MESSAGE_CHARS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS finding_jobs (
+    job_id TEXT PRIMARY KEY,
+    repo_url TEXT NOT NULL,
+    repo_key TEXT NOT NULL,
+    commit_sha TEXT,
+    tools TEXT NOT NULL,
+    findings INTEGER NOT NULL,
+    counts TEXT NOT NULL,
+    errors TEXT NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS finding_jobs_repo_key ON finding_jobs (repo_key, ingested_at);
+CREATE INDEX IF NOT EXISTS finding_jobs_commit_key ON finding_jobs (repo_key, commit_sha, ingested_at);
+CREATE TABLE IF NOT EXISTS findings (
+    job_id TEXT NOT NULL REFERENCES finding_jobs (job_id) ON DELETE CASCADE,
+    tool TEXT NOT NULL,
+    rule TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    path TEXT,
+    line INTEGER,
+    message TEXT,
+    occurrences INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (job_id, tool, rule, fingerprint)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS findings_job_severity ON findings (job_id, severity);
+CREATE INDEX IF NOT EXISTS findings_job_path ON findings (job_id, path);
+"""
+
+_UPSERT = """
+INSERT INTO findings (job_id, tool, rule, fingerprint, severity, path, line, message, occurrences)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (job_id, tool, rule, fingerprint) DO UPDATE SET
+    occurrences = occurrences + excluded.occurrences,
+    line = MIN(COALESCE(line, excluded.line), COALESCE(excluded.line, line))
+"""
+
+_COLUMNS = "tool, rule, fingerprint, severity, path, line, message, occurrences"
+
+Row = Tuple[str, str, str, str, Optional[str], Optional[int], Optional[str], int]
+
+
+class _Collector(SarifSink):
+    """Turns one SARIF report into finding rows, handed to `flush` in batches."""
+
+    def __init__(self, path: Path, tool: str, flush: Callable[[List[Row]], None]) -> None:
+        super().__init__(str(path))
+        self.tool = tool
+        self.flush = flush
+        # (rule, fingerprint) -> [severity, path, line, message, occurrences] for the current batch
+        self.rows: Dict[Tuple[str, str], List[object]] = {}
+
+    def keep(self, result):
+        loc = ((result.get("locations") or [{}])[0] or {}).get("physicalLocation") or {}
+        region = loc.get("region") or {}
+        line = region.get("startLine")
+        message = str((result.get("message") or {}).get("text") or "")
+        # Whitespace-insensitive and line-free, so a finding keeps its identity when code above it moves
+        text = " ".join(str((region.get("snippet") or {}).get("text") or message).split())
+        digest = hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()[:16]
+        return (result_path(result), line if isinstance(line, int) else None, digest, message[:_MESSAGE_CHARS])
+
+    def on_result(self, rule_id, severity, kept, n):
+        path, line, digest, message = kept
+        fingerprint = hashlib.sha256(f"{rule_id}\0{path or ''}\0{digest}".encode("utf-8", errors="surrogatepass")).hexdigest()[:32]
+        # Identical findings (same rule, file and text) collapse into one row with an occurrence count
+        row = self.rows.get((rule_id, fingerprint))
+        if row is None:
+            self.rows[(rule_id, fingerprint)] = [severity, path, line, message, n]
+        else:
+            row[4] += n  # type: ignore[operator]
+            if line is not None and (row[2] is None or line < row[2]):  # type: ignore[operator]
+                row[2] = line
+        if len(self.rows) >= _BATCH_ROWS:
+            self.drain()
+
+    def drain(self) -> None:
+        if self.rows:
+            self.flush([(self.tool, rule, fp, *row) for (rule, fp), row in self.rows.items()])  # type: ignore[misc]
+            self.rows = {}
+
+
+def _encode_cursor(row: sqlite3.Row) -> str:
+    raw = json.dumps([row["tool"], row["rule"], row["fingerprint"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str, str]:
+    try:
+        tool, rule, fingerprint = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(tool), str(rule), str(fingerprint)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _finding(row: sqlite3.Row) -> Dict[str, object]:
+    return {k: row[k] for k in ("tool", "rule", "fingerprint", "severity", "path", "line", "message", "occurrences")}
+
+
+class FindingsStore:
+    """Scanner findings of finished jobs in one SQLite file (WAL), queryable across jobs.
+
+    Each job's SARIF reports are ingested once, streamed through the shared
+    reader in `sarif`, into rows keyed by (job, tool, rule, fingerprint); the
+    repo URL as submitted, its normalized form (for lookups) and the commit
+    live on the job row. The fingerprint ignores line
+    numbers so that unrelated edits do not turn a finding into "fixed" plus
+    "new" between two commits.
+    """
+
+    def __init__(self, path: Path, retention: int = ANALYZER_JOB_RETENTION_SECONDS) -> None:
+        self.path = Path(path)
+        self.retention = retention
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(finding_jobs)")}
+        if columns and "repo_key" not in columns:
+            # Older files kept only the normalized URL, in repo_url
+            conn.executescript(
+                """
+                DROP INDEX IF EXISTS finding_jobs_repo;
+                DROP INDEX IF EXISTS finding_jobs_commit;
+                ALTER TABLE finding_jobs ADD COLUMN repo_key TEXT NOT NULL DEFAULT '';
+                UPDATE finding_jobs SET repo_key = repo_url;
+                """
+            )
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def ingest(self, job_id: str, repo_url: str, commit: Optional[str], reports_dir: Path) -> Dict[str, object]:
+        """Replace the findings of `job_id` with those in its `*.sarif` reports."""
+        reports = sorted(p for p in reports_dir.glob("*.sarif") if p.is_file()) if reports_dir.exists() else []
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM finding_jobs WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "INSERT INTO finding_jobs (job_id, repo_url, repo_key, commit_sha, tools, findings, counts, errors, ingested_at) VALUES (?, ?, ?, ?, '[]', 0, '{}', '{}', ?)",
+                (job_id, repo_url, normalize_url(repo_url), commit, time.time()),
+            )
+            errors: Dict[str, str] = {}
+            for report in reports:
+                sink = _Collector(report, report.stem, lambda rows: conn.executemany(_UPSERT, [(job_id, *r) for r in rows]))
+                read_sarif(str(report), sink)
+                sink.drain()
+                if sink.error:
+                    errors[report.stem] = sink.error
+            counts: Dict[str, Dict[str, int]] = {}
+            total = 0
+            for row in conn.execute("SELECT tool, severity, COUNT(*) AS n FROM findings WHERE job_id = ? GROUP BY tool, severity", (job_id,)):
+                counts.setdefault(row["tool"], {})[row["severity"]] = row["n"]
+                total += row["n"]
+            tools = [p.stem for p in reports]
+            conn.execute(
+                "UPDATE finding_jobs SET tools = ?, findings = ?, counts = ?, errors = ? WHERE job_id = ?",
+                (json.dumps(tools), total, json.dumps(counts), json.dumps(errors), job_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {"job_id": job_id, "tools": tools, "findings": total, "errors": errors}
+
+    def job(self, job_id: str) -> Optional[Dict[str, object]]:
+        row = self._conn().execute("SELECT * FROM finding_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Dict[str, object]:
+        return {
+            "job_id": row["job_id"],
+            "repo_url": row["repo_url"],
+            "repo_key": row["repo_key"],
+            "commit": row["commit_sha"],
+            "tools": json.loads(row["tools"]),
+            "findings": row["findings"],
+            "counts": json.loads(row["counts"]),
+            "errors": json.loads(row["errors"]),
+            "ingested_at": row["ingested_at"],
+        }
+
+    def latest(self, repo_url: str, commit: Optional[str] = None, before: Optional[float] = None) -> Optional[Dict[str, object]]:
+        """Most recently ingested job of `repo_url` (at `commit`, if given; ingested before `before`, if given)."""
+        sql = "SELECT * FROM finding_jobs WHERE repo_key = ?"
+        args: List[object] = [normalize_url(repo_url)]
+        if commit:
+            sql += " AND commit_sha = ?"
+            args.append(commit)
+        if before is not None:
+            sql += " AND ingested_at < ?"
+            args.append(before)
+        row = self._conn().execute(sql + " ORDER BY ingested_at DESC LIMIT 1", args).fetchone()
+        return self._job(row) if row else None
+
+    @staticmethod
+    def _filters(alias: str, tool: Optional[str], rule: Optional[str], severity: Optional[List[str]], path_prefix: Optional[str]) -> Tuple[str, List[object]]:
+        sql = ""
+        args: List[object] = []
+        if tool:
+            sql += f" AND {alias}.tool = ?"
+            args.append(tool)
+        if rule:
+            sql += f" AND {alias}.rule = ?"
+            args.append(rule)
+        if severity:
+            sql += f" AND {alias}.severity IN ({','.join('?' for _ in severity)})"
+            args.extend(severity)
+        if path_prefix:
+            # A range rather than LIKE, so the (job_id, path) index applies
+            sql += f" AND {alias}.path >= ? AND {alias}.path < ?"
+            args.extend([path_prefix, path_prefix + "\U0010ffff"])
+        return sql, args
+
+    def query(
+        self,
+        job_id: str,
+        tool: Optional[str] = None,
+        rule: Optional[str] = None,
+        severity: Optional[List[str]] = None,
+        path_prefix: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, object]], Optional[str]]:
+        """One page of a job's findings in (tool, rule, fingerprint) order, plus the cursor of the next page."""
+        where, args = self._filters("f", tool, rule, severity, path_prefix)
+        if cursor:
+            where += " AND (f.tool, f.rule, f.fingerprint) > (?, ?, ?)"
+            args.extend(_decode_cursor(cursor))
+        rows = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM findings f WHERE f.job_id = ?{where} ORDER BY f.tool, f.rule, f.fingerprint LIMIT ?",
+            [job_id, *args, limit + 1],
+        ).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return [_finding(r) for r in rows], (_encode_cursor(rows[-1]) if more and rows else None)
+
+    def diff(
+        self,
+        base_job: str,
+        head_job: str,
+        tools: List[str],
+        severity: Optional[List[str]] = None,
+        limit: int = 100,
+    ) -> Dict[str, object]:
+        """New, fixed and unchanged findings of `head_job` relative to `base_job`, over `tools` only.
+
+        Counts are per severity; `new` and `fixed` list at most `limit` findings each.
+        """
+        if not tools:
+            return {"counts": {"new": {}, "fixed": {}, "unchanged": {}}, "new": [], "fixed": []}
+        conn = self._conn()
+        marks = ",".join("?" for _ in tools)
+        filters, filter_args = self._filters("a", None, None, severity, None)
+        filters += f" AND a.tool IN ({marks})"
+        filter_args.extend(tools)
+        match = "SELECT 1 FROM findings b WHERE b.job_id = ? AND b.tool = a.tool AND b.rule = a.rule AND b.fingerprint = a.fingerprint"
+
+        def counts(side: str, other: str, present: bool) -> Dict[str, int]:
+            exists = "EXISTS" if present else "NOT EXISTS"
+            rows = conn.execute(
+                f"SELECT a.severity, COUNT(*) AS n FROM findings a WHERE a.job_id = ?{filters} AND {exists} ({match}) GROUP BY a.severity",
+                [side, *filter_args, other],
+            )
+            found = {r["severity"]: r["n"] for r in rows}
+            return {s: found[s] for s in SEVERITIES if s in found}
+
+        def listing(side: str, other: str) -> List[Dict[str, object]]:
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM findings a WHERE a.job_id = ?{filters} AND NOT EXISTS ({match}) ORDER BY a.tool, a.rule, a.fingerprint LIMIT ?",
+                [side, *filter_args, other, limit],
+            )
+            return [_finding(r) for r in rows]
+
+        return {
+            "counts": {
+                "new": counts(head_job, base_job, False),
+                "fixed": counts(base_job, head_job, False),
+                "unchanged": counts(head_job, base_job, True),
+            },
+            "new": listing(head_job, base_job),
+            "fixed": listing(base_job, head_job),
+        }
+
+    def evict(self, older_than: Optional[int] = None) -> int:
+        """Drop findings ingested more than `older_than` seconds ago (default: the job retention)."""
+        cutoff = time.time() - (self.retention if older_than is None else older_than)
+        cur = self._conn().execute("DELETE FROM finding_jobs WHERE ingested_at < ?", (cutoff,))
+        return cur.rowcount
+
+
+def create_findings_store(work_root: Path) -> FindingsStore:
+    return FindingsStore(Path(ANALYZER_FINDINGS_DB) if ANALYZER_FINDINGS_DB else work_root / "findings.sqlite3")
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# "sqlite" (default) shares jobs across processes and restarts; "memory" keeps them per process
+ANALYZER_JOB_STORE = os.getenv("ANALYZER_JOB_STORE", "sqlite").lower()
+ANALYZER_JOB_DB = os.getenv("ANALYZER_JOB_DB")
+# Finished jobs (rows and their work directories) are dropped after this long
+ANALYZER_JOB_RETENTION_SECONDS = int(os.getenv("ANALYZER_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# A pending/running job whose owner has not heartbeated for this long is taken over
+ANALYZER_JOB_STALE_SECONDS = int(os.getenv("ANALYZER_JOB_STALE_SECONDS", "90"))
+
+# Identifies this API process as the owner of the jobs it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+ACTIVE_STATUSES = ("pending", "running")
+
+# A job record is a plain dict:
+#   id, repo_url, client, priority, status, message, commit, canceled,
+#   created_at, started_at, finished_at (ISO strings), request (AnalyzeRequest
+#   fields without github_token), had_token, steps (JobStep dicts),
+#   artifacts ({name, bytes} dicts), owner, heartbeat_at (epoch seconds)
+
+
+class JobStore(ABC):
+    """Interface shared by the job store backends."""
+
+    @abstractmethod
+    def save(self, record: Dict[str, object]) -> bool:
+        """Insert or update a job; False (nothing written) when another process has claimed it."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        ...
+
+    @abstractmethod
+    def list_for_repo(self, repo_url: str, limit: int = 20) -> List[Dict[str, object]]:
+        ...
+
+    @abstractmethod
+    def request_cancel(self, job_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def is_canceled(self, job_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def claim_stale(self, stale_after: int = ANALYZER_JOB_STALE_SECONDS) -> List[Dict[str, object]]:
+        """Take ownership of active jobs whose owner stopped heartbeating."""
+
+    @abstractmethod
+    def evict(self, older_than: int = ANALYZER_JOB_RETENTION_SECONDS) -> List[str]:
+        """Delete finished jobs older than `older_than` seconds; returns their ids."""
+
+    def last_for_repo(self, repo_url: str) -> Optional[Dict[str, object]]:
+        rows = self.list_for_repo(repo_url, limit=1)
+        return rows[0] if rows else None
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rows: Dict[str, Dict[str, object]] = {}
+
+    def save(self, record: Dict[str, object]) -> bool:
+        with self._lock:
+            row = dict(record)
+            row.setdefault("owner", WORKER_ID)
+            row["heartbeat_at"] = time.time()
+            prev = self._rows.get(str(record["id"]))
+            if prev and prev.get("canceled"):
+                row["canceled"] = True
+            self._rows[str(record["id"])] = row
+            return True
+
+    def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            row = self._rows.get(job_id)
+            return dict(row) if row else None
+
+    def list_for_repo(self, repo_url: str, limit: int = 20) -> List[Dict[str, object]]:
+        with self._lock:
+            rows = [dict(r) for r in self._rows.values() if r.get("repo_url") == repo_url]
+        rows.sort(key=lambda r: str(r.get("created_at") or ""), reverse=True)
+        return rows[:limit]
+
+    def request_cancel(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._rows.get(job_id)
+            if not row:
+                return False
+            row["canceled"] = True
+            return True
+
+    def is_canceled(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._rows.get(job_id)
+            return bool(row and row.get("canceled"))
+
+    def heartbeat(self, job_ids: List[str]) -> None:
+        return None
+
+    def claim_stale(self, stale_after: int = ANALYZER_JOB_STALE_SECONDS) -> List[Dict[str, object]]:
+        # Nothing outlives the process, so nothing can be orphaned
+        return []
+
+    def evict(self, older_than: int = ANALYZER_JOB_RETENTION_SECONDS) -> List[str]:
+        cutoff = time.time() - older_than
+        with self._lock:
+            gone = [
+                jid for jid, r in self._rows.items()
+                if r.get("status") not in ACTIVE_STATUSES and float(r.get("heartbeat_at") or 0) < cutoff
+            ]
+            for jid in gone:
+                del self._rows[jid]
+        return gone
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    repo_url TEXT NOT NULL,
+    client TEXT,
+    priority TEXT,
+    status TEXT NOT NULL,
+    message TEXT,
+    commit_sha TEXT,
+    canceled INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    started_at TEXT,
+    finished_at TEXT,
+    request TEXT NOT NULL,
+    had_token INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    heartbeat_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_repo_created ON jobs (repo_url, created_at);
+CREATE INDEX IF NOT EXISTS jobs_status_heartbeat ON jobs (status, heartbeat_at);
+CREATE TABLE IF NOT EXISTS job_steps (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    message TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS job_artifacts (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    bytes INTEGER,
+    PRIMARY KEY (job_id, name)
+);
+"""
+
+
+class SQLiteJobStore(JobStore):
+    """Job store in a single SQLite file in WAL mode.
+
+    Safe to share between threads and between uvicorn worker processes on the
+    same host: every thread gets its own connection and writers wait on the
+    database lock instead of failing.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def save(self, record: Dict[str, object]) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                """
+                INSERT INTO jobs (id, repo_url, client, priority, status, message, commit_sha, canceled,
+                                  created_at, started_at, finished_at, request, had_token, owner, heartbeat_at, updated_at)
+                VALUES (:id, :repo_url, :client, :priority, :status, :message, :commit, :canceled,
+                        :created_at, :started_at, :finished_at, :request, :had_token, :owner, :now, :now)
+                ON CONFLICT (id) DO UPDATE SET
+                    status = excluded.status,
+                    message = excluded.message,
+                    commit_sha = excluded.commit_sha,
+                    canceled = MAX(jobs.canceled, excluded.canceled),
+                    started_at = excluded.started_at,
+                    finished_at = excluded.finished_at,
+                    owner = excluded.owner,
+                    heartbeat_at = excluded.heartbeat_at,
+                    updated_at = excluded.updated_at
+                -- A process whose job was claimed by another (see claim_stale) must not take it back
+                WHERE jobs.owner = excluded.owner OR jobs.owner IS NULL
+                """,
+                {
+                    "id": record["id"],
+                    "repo_url": record["repo_url"],
+                    "client": record.get("client"),
+                    "priority": record.get("priority"),
+                    "status": record["status"],
+                    "message": record.get("message"),
+                    "commit": record.get("commit"),
+                    "canceled": 1 if record.get("canceled") else 0,
+                    "created_at": record.get("created_at"),
+                    "started_at": record.get("started_at"),
+                    "finished_at": record.get("finished_at"),
+                    "request": json.dumps(record.get("request") or {}),
+                    "had_token": 1 if record.get("had_token") else 0,
+                    "owner": record.get("owner") or WORKER_ID,
+                    "now": now,
+                },
+            )
+            if cur.rowcount == 0:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("DELETE FROM job_steps WHERE job_id = ?", (record["id"],))
+            conn.executemany(
+                "INSERT INTO job_steps (job_id, seq, name, status, started_at, finished_at, message) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (record["id"], i, s.get("name"), s.get("status"), s.get("started_at"), s.get("finished_at"), s.get("message"))
+                    for i, s in enumerate(record.get("steps") or [])  # type: ignore[union-attr]
+                ],
+            )
+            if record.get("artifacts") is not None:
+                conn.execute("DELETE FROM job_artifacts WHERE job_id = ?", (record["id"],))
+                conn.executemany(
+                    "INSERT INTO job_artifacts (job_id, name, bytes) VALUES (?, ?, ?)",
+                    [(record["id"], a.get("name"), a.get("bytes")) for a in record.get("artifacts") or []],  # type: ignore[union-attr]
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _record(self, row: sqlite3.Row) -> Dict[str, object]:
+        conn = self._conn()
+        steps = [
+            {"name": s["name"], "status": s["status"], "started_at": s["started_at"], "finished_at": s["finished_at"], "message": s["message"]}
+            for s in conn.execute("SELECT * FROM job_steps WHERE job_id = ? ORDER BY seq", (row["id"],))
+        ]
+        artifacts = [{"name": a["name"], "bytes": a["bytes"]} for a in conn.execute("SELECT name, bytes FROM job_artifacts WHERE job_id = ? ORDER BY name", (row["id"],))]
+        return {
+            "id": row["id"],
+            "repo_url": row["repo_url"],
+            "client": row["client"],
+            "priority": row["priority"],
+            "status": row["status"],
+            "message": row["message"],
+            "commit": row["commit_sha"],
+            "canceled": bool(row["canceled"]),
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "request": json.loads(row["request"] or "{}"),
+            "had_token": bool(row["had_token"]),
+            "owner": row["owner"],
+            "heartbeat_at": row["heartbeat_at"],
+            "steps": steps,
+            "artifacts": artifacts,
+        }
+
+    def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def list_for_repo(self, repo_url: str, limit: int = 20) -> List[Dict[str, object]]:
+        rows = self._conn().execute(
+            "SELECT * FROM jobs WHERE repo_url = ? ORDER BY created_at DESC LIMIT ?", (repo_url, limit)
+        ).fetchall()
+        return [self._record(r) for r in rows]
+
+    def request_cancel(self, job_id: str) -> bool:
+        cur = self._conn().execute("UPDATE jobs SET canceled = 1, updated_at = ? WHERE id = ?", (time.time(), job_id))
+        return cur.rowcount > 0
+
+    def is_canceled(self, job_id: str) -> bool:
+        row = self._conn().execute("SELECT canceled FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["canceled"])
+
+    def heartbeat(self, job_ids: List[str]) -> None:
+        if not job_ids:
+            return
+        marks = ",".join("?" for _ in job_ids)
+        self._conn().execute(
+            f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND id IN ({marks})",
+            (time.time(), WORKER_ID, *job_ids),
+        )
+
+    def claim_stale(self, stale_after: int = ANALYZER_JOB_STALE_SECONDS) -> List[Dict[str, object]]:
+        now = time.time()
+        conn = self._conn()
+        rows = conn.execute(
+            # Our own jobs are alive for as long as we are
+            "SELECT id, owner, heartbeat_at FROM jobs WHERE status IN ('pending', 'running') AND heartbeat_at < ? AND owner IS NOT ?",
+            (now - stale_after, WORKER_ID),
+        ).fetchall()
+        claimed: List[Dict[str, object]] = []
+        for row in rows:
+            # Compare-and-swap on (owner, heartbeat) so only one process wins each job
+            cur = conn.execute(
+                "UPDATE jobs SET owner = ?, heartbeat_at = ?, updated_at = ? WHERE id = ? AND owner IS ? AND heartbeat_at = ?",
+                (WORKER_ID, now, now, row["id"], row["owner"], row["heartbeat_at"]),
+            )
+            if cur.rowcount:
+                record = self.get(row["id"])
+                if record:
+                    claimed.append(record)
+        return claimed
+
+    def evict(self, older_than: int = ANALYZER_JOB_RETENTION_SECONDS) -> List[str]:
+        cutoff = time.time() - older_than
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [r["id"] for r in conn.execute(
+                "SELECT id FROM jobs WHERE status NOT IN ('pending', 'running') AND updated_at < ?", (cutoff,)
+            )]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+
+def create_store(work_root: Path) -> JobStore:
+    if ANALYZER_JOB_STORE == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(Path(ANALYZER_JOB_DB) if ANALYZER_JOB_DB else work_root / "jobs.sqlite3")
@@ -1,37 +1,69 @@
 from __future__ import annotations
 
 import asyncio
+import os
 import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional, List, Set, Tuple
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Form, Depends
+import httpx
+from fastapi import FastAPI, HTTPException, Form, Depends, Header, Query, Request
+from fastapi.responses import Response, StreamingResponse
 
-from .models import AnalyzeRequest, AnalyzeStartResponse, JobStatus, JobStatusResponse, SowResponse, JobStep, ScannerName, FeatureScanRequest, FeatureScanResponse, FeatureScanFinding
+from agents.sarif import SEVERITIES
+from tools.indexer.repo_walk import walk_files
+
+from .models import AnalyzeRequest, AnalyzeStartResponse, JobPriority, JobStatus, JobStatusResponse, SowResponse, SearchRequest, SearchResponse, SearchHit, GrepRequest, GrepResponse, GrepHit, JobStep, Finding, FindingsResponse, FindingsDiffResponse, ScannerName, FeatureScanRequest, FeatureScanResponse, FeatureScanFinding, FeatureSpec
 from .cli_wrappers import (
     REPO_ROOT,
+    ProcessCanceled,
     clone_repo,
+    clone_repo_async,
+    resolve_commit,
+    resolve_remote_commit,
     run_gitleaks,
     run_indexer,
     run_semgrep,
+    run_sow,
     run_syft_grype,
-    tools_available,
 )
-from .auth import require_auth, issue_token, authenticate_client
+from .result_cache import RESULT_CACHE_ENABLED, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_VULN_TTL_SECONDS, file_digest, lookup, make_key, restore, store
+from .result_cache import prune as prune_results
+from .result_cache import cache_stats as result_cache_stats
+from .pipeline import SkipStep, Step, run_steps
+from .deadline import ANALYZER_OPTIONAL_STEP_MIN_SECONDS, Deadline, DeadlineExceeded
+from .scheduler import JobScheduler, QueueFull
+from .job_store import JobStore, create_store
+from .findings_store import FINDINGS_ENABLED, FindingsStore, create_findings_store
+from .disk_gc import ANALYZER_GC_INTERVAL_SECONDS, collect, remove_checkout, usage
+from .repo_cache import REPO_CACHE_ENABLED, REPO_CACHE_MAX_BYTES, evict as evict_mirrors
+from .repo_cache import cache_stats as repo_cache_stats
+from .snapshots import SNAPSHOTS, SNAPSHOTS_ENABLED, Snapshot
+from .warm_worker import WARM_POOL
+from .tool_registry import TOOLS
+from .code_search import INDEX_CACHE, search_index
+from .feature_match import FeatureMatcher
+from .trigram_index import CODE_EXTS, TrigramIndex, build_trigram_index, index_files as trigram_files
+from .streaming import PROGRESS_INTERVAL_SECONDS, Event, event_response, iterate_off_loop
+from .artifacts import ANALYZER_PRECOMPRESS_MIN_BYTES, file_etag, file_response, not_modified, precompress
+from .auth import TOKEN_CACHE, require_auth, issue_token, authenticate_client, grant_scope, has_scope
 from bs4 import BeautifulSoup  # type: ignore
 import shutil
-import fnmatch
 
 
 WORK_ROOT = Path((Path.cwd() / "jobs").resolve())
 
 
 class Job:
-    def __init__(self, job_id: str, req: AnalyzeRequest) -> None:
+    def __init__(self, job_id: str, req: AnalyzeRequest, client: str = "anonymous") -> None:
         self.id = job_id
         self.req = req
+        self.client = client  # JWT `sub` of the submitter, used for fairness caps
         self.status: JobStatus = JobStatus.pending
         self.message: Optional[str] = None
         self.created_at = datetime.utcnow()
@@ -41,28 +73,172 @@ class Job:
         self.repo_dir: Path = self.job_dir / "repo"
         self.reports_dir: Path = self.job_dir / "reports"
         self.index_dir: Path = self.job_dir / "data" / "index"
+        self.trigram_dir: Path = self.job_dir / "data" / "trigram"
         self.out_dir: Path = self.job_dir / "out"
         self.sow_path: Path = self.out_dir / "sow.md"
+        # Pre-compressed copies of large reports, served to clients that accept gzip/zstd
+        self.compressed_dir: Path = self.out_dir / "compressed"
         self.steps: List[JobStep] = []
         self.canceled: bool = False
+        self.cancel_checked_at: float = 0.0
+        # Commit SHA that was (or will be) analysed, once known
+        self.commit: Optional[str] = None
+        # Shared checkout the steps read instead of a private clone, while held
+        self.snapshot: Optional[Snapshot] = None
+        # Guards `steps`, which parallel pipeline steps append to concurrently
+        self.lock = threading.Lock()
+
+    def reports_present(self) -> List[str]:
+        names: List[str] = []
+        try:
+            if self.reports_dir.exists():
+                for p in self.reports_dir.glob("*"):
+                    if p.is_file():
+                        names.append(p.name)
+        except Exception:
+            pass
+        return names
+
+    def to_record(self, with_artifacts: bool = False) -> Dict[str, object]:
+        def iso(dt: Optional[datetime]) -> Optional[str]:
+            return dt.isoformat() + "Z" if dt else None
+
+        with self.lock:
+            steps = [s.model_dump() for s in self.steps]
+        record: Dict[str, object] = {
+            "id": self.id,
+            "repo_url": self.req.repo_url,
+            "client": self.client,
+            "priority": self.req.priority.value,
+            "status": self.status.value,
+            "message": self.message,
+            "commit": self.commit,
+            "canceled": self.canceled,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            # Tokens are never persisted; jobs that needed one cannot be resumed after a restart
+            "request": self.req.model_dump(mode="json", exclude={"github_token"}),
+            "had_token": bool(self.req.github_token),
+            "steps": steps,
+        }
+        if with_artifacts:
+            artifacts: List[Dict[str, object]] = []
+            for p in (self.reports_dir.glob("*") if self.reports_dir.exists() else []):
+                if p.is_file():
+                    artifacts.append({"name": p.name, "bytes": p.stat().st_size})
+            if self.sow_path.exists():
+                artifacts.append({"name": "sow.md", "bytes": self.sow_path.stat().st_size})
+            record["artifacts"] = artifacts
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict[str, object]) -> "Job":
+        def dt(value: object) -> Optional[datetime]:
+            return datetime.fromisoformat(str(value).rstrip("Z")) if value else None
+
+        job = cls(str(record["id"]), AnalyzeRequest(**record["request"]), client=str(record.get("client") or "anonymous"))  # type: ignore[arg-type]
+        job.status = JobStatus(str(record["status"]))
+        job.message = record.get("message")  # type: ignore[assignment]
+        job.commit = record.get("commit")  # type: ignore[assignment]
+        job.canceled = bool(record.get("canceled"))
+        job.created_at = dt(record.get("created_at")) or job.created_at
+        job.started_at = dt(record.get("started_at"))
+        job.finished_at = dt(record.get("finished_at"))
+        job.steps = [JobStep(**s) for s in record.get("steps") or []]  # type: ignore[union-attr]
+        return job
 
 
+STORE: JobStore = create_store(WORK_ROOT)
+FINDINGS: Optional[FindingsStore] = create_findings_store(WORK_ROOT) if FINDINGS_ENABLED else None
+# Jobs this process is running or has queued; everything else is read from STORE
 JOBS: Dict[str, Job] = {}
 JOBS_LOCK = threading.Lock()
-# In-memory last artifacts by repo URL (non-persistent)
-REPO_LAST: Dict[str, Dict[str, object]] = {}
+# Cancellation requested through another process is noticed within this long
+_CANCEL_CHECK_SECONDS = 0.5
+# Pipeline steps that read the checkout
+_CHECKOUT_STEPS = ("semgrep", "gitleaks", "sbom", "index", "trigram")
+# How often this process heartbeats its jobs, adopts orphaned ones and evicts old ones
+ANALYZER_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("ANALYZER_MAINTENANCE_INTERVAL_SECONDS", "15"))
+# Threads that read and match files for /features and /aggregate. Few on purpose: the
+# scans hold the GIL, and the event loop must keep its share to answer other requests
+ANALYZER_SCAN_WORKERS = int(os.getenv("ANALYZER_SCAN_WORKERS", "2"))
+SCAN_POOL = ThreadPoolExecutor(max_workers=max(1, ANALYZER_SCAN_WORKERS), thread_name_prefix="scan")
+
+
+def _persist(job: Job, with_artifacts: bool = False) -> None:
+    try:
+        if not STORE.save(job.to_record(with_artifacts=with_artifacts)):
+            # Another process took the job over after our heartbeat stalled; it is
+            # running it now, so stop ours (_is_canceled sees this at the next poll)
+            job.canceled = True
+    except Exception:
+        # A store hiccup must not take down a running scan; the next save catches up
+        pass
+
+
+def _get_job(job_id: str) -> Optional[Job]:
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if job is not None:
+        return job
+    record = STORE.get(job_id)
+    return Job.from_record(record) if record else None
+
+
+def _repo_history(repo_url: str) -> Optional[Dict[str, object]]:
+    record = STORE.last_for_repo(repo_url)
+    if not record:
+        return None
+    return {
+        "job_id": record["id"],
+        "status": record["status"],
+        "when": record.get("finished_at") or record.get("created_at"),
+        "reports_present": [a["name"] for a in record.get("artifacts") or [] if a["name"] != "sow.md"],  # type: ignore[index,union-attr]
+        "scanners_selected": list((record.get("request") or {}).get("scanners") or []),  # type: ignore[union-attr]
+        "commit": record.get("commit"),
+    }
+
+
+def _previous_index(job: Job) -> Optional[Path]:
+    # Most recent earlier index of the same repo that GC has not reclaimed yet
+    for record in STORE.list_for_repo(job.req.repo_url):
+        if record["id"] == job.id:
+            continue
+        candidate = WORK_ROOT / str(record["id"]) / "data" / "index"
+        if (candidate / "manifest.json").exists():
+            return candidate
+    return None
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    stop = threading.Event()
+    thread = threading.Thread(target=_maintenance_loop, args=(stop,), name="job-maintenance", daemon=True)
+    thread.start()
+    # Pay the indexer/SoW import cost now rather than in the first job
+    WARM_POOL.start()
+    # Likewise semgrep & co. `--version`: probed once here, then answered from memory
+    TOOLS.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        SCHEDULER.shutdown()
+        WARM_POOL.shutdown()
 
-app = FastAPI(title="Analyzer API", version="0.1.0")
+
+app = FastAPI(title="Analyzer API", version="0.1.0", lifespan=_lifespan)
 
 
 @app.get("/health")
-def health() -> Dict[str, str]:
+async def health() -> Dict[str, str]:
     return {"ok": "true", "service": "analyzer-api", "version": "0.1.0"}
 
 
 @app.get("/tools")
-def tools() -> Dict[str, bool]:
-    return tools_available()
+async def tools() -> Dict[str, bool]:
+    return {name: bool(info["available"]) for name, info in (await TOOLS.tools_async()).items()}
 
 
 def _validate_request(req: AnalyzeRequest) -> None:
@@ -72,95 +248,404 @@ def _validate_request(req: AnalyzeRequest) -> None:
         raise HTTPException(status_code=400, detail="github_token looks invalid")
 
 
+def _start_step(job: Job, name: str, msg: Optional[str] = None) -> JobStep:
+    step = JobStep(name=name, status="running", started_at=datetime.utcnow().isoformat() + "Z", message=msg)
+    with job.lock:
+        job.steps.append(step)
+    _persist(job)
+    return step
+
+
+def _finish_step(job: Job, step: JobStep, status: str = "succeeded", msg: Optional[str] = None) -> None:
+    step.status = status
+    step.finished_at = datetime.utcnow().isoformat() + "Z"
+    if msg:
+        step.message = msg
+    _persist(job)
+
+
+def _cache_inputs(job: Job, versions: Dict[str, Optional[str]]) -> Dict[str, Optional[Dict[str, object]]]:
+    # Everything besides the commit that can change a step's output. A step whose
+    # tool is not installed gets None and is never cached.
+    def needs(*tools: str) -> bool:
+        return all(versions.get(t) for t in tools)
+
+    config_path = REPO_ROOT / job.req.semgrep_config_path
+    return {
+        "semgrep": {"config": file_digest(config_path), "semgrep": versions.get("semgrep")} if needs("semgrep") else None,
+        "gitleaks": {"gitleaks": versions.get("gitleaks")} if needs("gitleaks") else None,
+        "sbom": {"syft": versions.get("syft"), "grype": versions.get("grype")} if needs("syft", "grype") else None,
+        "index": {
+            "indexer": file_digest(REPO_ROOT / "tools" / "indexer" / "index_repo.py"),
+            "embeddings": file_digest(REPO_ROOT / "tools" / "indexer" / "embeddings.py"),
+            "format": file_digest(REPO_ROOT / "tools" / "indexer" / "index_format.py"),
+            "walker": file_digest(REPO_ROOT / "tools" / "indexer" / "repo_walk.py"),
+            # The indexer reads these from the environment it inherits from us
+            "embedder": os.getenv("INDEXER_EMBEDDER", "hash"),
+            "dtype": os.getenv("INDEXER_DTYPE", "float32"),
+            "batch_size": os.getenv("INDEXER_BATCH_SIZE"),
+        },
+        "trigram": {"builder": file_digest(Path(__file__).with_name("trigram_index.py")), "walker": file_digest(REPO_ROOT / "tools" / "indexer" / "repo_walk.py")},
+        "sow": {
+            "agent": file_digest(REPO_ROOT / "agents" / "security_agent.py"),
+            "sarif": file_digest(REPO_ROOT / "agents" / "sarif.py"),
+            "asvs": os.getenv("ASVS_LEVEL", "L1"),
+        },
+    }
+
+
+def _build_steps(job: Job, deadline: Deadline, commit: Optional[str] = None, versions: Optional[Dict[str, Optional[str]]] = None) -> List[Step]:
+    config_path = REPO_ROOT / job.req.semgrep_config_path
+    selected = [s.value for s in job.req.scanners]
+    # Held back from every earlier step so the SoW always gets its turn
+    sow_reserve = deadline.share("sow")
+
+    def budget(name: str) -> float:
+        return deadline.timeout(cap=deadline.share(name), reserve=sow_reserve)
+
+    checkout_lock = threading.Lock()
+    checked_out: List[Optional[str]] = []
+
+    def clone() -> Optional[str]:
+        # Also called by a cached step whose entry was evicted after lookup; clones at most once
+        with checkout_lock:
+            if not checked_out:
+                checked_out.append(_clone())
+            return checked_out[0]
+
+    def _clone() -> Optional[str]:
+        if SNAPSHOTS_ENABLED and job.req.use_cache:
+            # Shared with /aggregate, /features and other jobs on the same commit
+            snap = SNAPSHOTS.acquire(job.req.repo_url, github_token=job.req.github_token, branch=job.req.branch, commit=commit, timeout=budget("clone"), deadline=deadline)
+            with job.lock:
+                job.snapshot = snap
+                job.repo_dir = snap.path
+            head: Optional[str] = snap.commit
+        else:
+            clone_repo(job.req.repo_url, dest_dir=job.repo_dir, github_token=job.req.github_token, branch=job.req.branch, timeout=budget("clone"), deadline=deadline)
+            head = resolve_commit(job.repo_dir)
+        if commit and head and head != commit:
+            # The branch moved between ls-remote and clone; results get keyed by what was scanned
+            job.commit = head
+            return f"branch={job.req.branch or 'default'} commit={head} (remote moved from {commit})"
+        job.commit = head or commit
+        return None
+
+    def semgrep() -> None:
+        run_semgrep(repo_dir=job.repo_dir, reports_dir=job.reports_dir, config_path=config_path, timeout=budget("semgrep"), deadline=deadline)
+
+    def gitleaks() -> None:
+        run_gitleaks(repo_dir=job.repo_dir, reports_dir=job.reports_dir, timeout=budget("gitleaks"), deadline=deadline)
+
+    def sbom() -> None:
+        run_syft_grype(repo_dir=job.repo_dir, reports_dir=job.reports_dir, timeout=budget("sbom"), deadline=deadline)
+
+    def index() -> None:
+        # Optional: the SoW does not need the index, so a job short on time drops it
+        left = deadline.remaining() - sow_reserve
+        if left < ANALYZER_OPTIONAL_STEP_MIN_SECONDS:
+            raise SkipStep(f"skipped: only {int(max(left, 0))}s of the job budget left")
+        run_indexer(repo_dir=job.repo_dir, index_out_dir=job.index_dir, timeout=budget("index"), deadline=deadline, previous_index_dir=_previous_index(job))
+
+    def trigram() -> None:
+        # Lets /features and /grep answer from this job without cloning again
+        started = time.monotonic()
+
+        def check() -> None:
+            if deadline.canceled():
+                raise ProcessCanceled("trigram index canceled")
+            if time.monotonic() - started > deadline.share("trigram"):
+                raise DeadlineExceeded("trigram index ran over its share of the job budget")
+            deadline.timeout(reserve=sow_reserve)
+
+        build_trigram_index(job.repo_dir, job.trigram_dir, check=check)
+
+    def sow() -> None:
+        # Last step: may use whatever is left of the budget
+        run_sow(index_dir=job.index_dir, reports_dir=job.reports_dir, out_file=job.sow_path, timeout=deadline.timeout(), deadline=deadline)
+
+    # name -> (runner, output paths, restore dir, max cache age)
+    specs: Dict[str, Tuple[Callable[[], Optional[str]], Callable[[], List[Path]], Path, Optional[int]]] = {
+        "semgrep": (semgrep, lambda: [job.reports_dir / "semgrep.sarif"], job.reports_dir, None),
+        "gitleaks": (gitleaks, lambda: [job.reports_dir / "gitleaks.sarif"], job.reports_dir, None),
+        "sbom": (sbom, lambda: [job.reports_dir / "sbom.json", job.reports_dir / "grype.sarif"], job.reports_dir, RESULT_CACHE_VULN_TTL_SECONDS),
+        "index": (index, lambda: sorted(job.index_dir.iterdir()) if job.index_dir.exists() else [], job.index_dir, None),
+        "trigram": (trigram, lambda: trigram_files(job.trigram_dir), job.trigram_dir, None),
+        "sow": (sow, lambda: [job.sow_path], job.out_dir, None),
+    }
+    order = [n for n in ("semgrep", "gitleaks", "sbom") if n in selected] + ["index", "trigram", "sow"]
+    # What the SoW summarises; the trigram index is only for later queries
+    sow_inputs = [n for n in order if n not in ("sow", "trigram")]
+
+    use_cache = bool(commit) and job.req.use_cache and RESULT_CACHE_ENABLED
+    inputs = _cache_inputs(job, versions or {}) if use_cache else {}
+    degraded: Set[str] = set()
+
+    def key_for(name: str, at_commit: str) -> Optional[str]:
+        base = inputs.get(name)
+        if base is None:
+            return None
+        extra: Dict[str, object] = dict(base)
+        if name == "sow":
+            if "index" in degraded:
+                # Produced without the index; not the result a full run would give
+                return None
+            upstream = [key_for(n, at_commit) for n in sow_inputs]
+            if any(k is None for k in upstream):
+                return None
+            extra["upstream"] = upstream
+        return make_key(name, at_commit, extra)
+
+    def cached_runner(name: str) -> Callable[[], Optional[str]]:
+        runner, outputs, _dest, _max_age = specs[name]
+
+        def run() -> Optional[str]:
+            try:
+                runner()
+            except Exception:
+                degraded.add(name)
+                raise
+            at_commit = job.commit or commit
+            key = key_for(name, at_commit) if at_commit else None
+            if key:
+                store(key, name, at_commit, inputs.get(name) or {}, outputs())
+            return None
+
+        return run
+
+    def restorer(name: str, key: str) -> Callable[[], Optional[str]]:
+        _runner, _outputs, dest, max_age = specs[name]
+
+        def run() -> Optional[str]:
+            if restore(key, dest, max_age=max_age) is not None:
+                return f"cached ({key[:12]})"
+            # Pruned between lookup and restore: run the step for real after all
+            if name in _CHECKOUT_STEPS:
+                clone()
+            cached_runner(name)()
+            return f"cache entry {key[:12]} evicted; ran again"
+
+        return run
+
+    hits: Dict[str, str] = {}
+    if use_cache and commit:
+        for name in order:
+            key = key_for(name, commit)
+            if key and lookup(key, max_age=specs[name][3]) is not None:
+                hits[name] = key
+
+    steps: List[Step] = []
+    if len(hits) < len(order):
+        # Only clone when at least one step has to run for real
+        steps.append(Step("clone", clone, message=f"branch={job.req.branch or 'default'}"))
+    # Scanners and the indexer only read the checkout and write separate outputs,
+    # so they all hang off the clone and run side by side.
+    for name in order:
+        if name in hits:
+            fn, deps = restorer(name, hits[name]), []
+        else:
+            fn, deps = (cached_runner(name) if use_cache else specs[name][0]), ["clone"]
+        if name == "sow":
+            # SoW summarises every report plus the index, so it waits for all of them
+            deps = deps + sow_inputs
+        steps.append(Step(name, fn, deps=deps, optional=name in ("index", "trigram")))
+    return steps
+
+
 def _run_job(job: Job) -> None:
     try:
         job.status = JobStatus.running
         job.started_at = datetime.utcnow()
+        _persist(job)
+        # One budget for the whole job; every step and subprocess draws from it
+        deadline = Deadline(job.req.timeout_seconds, cancel=lambda: _is_canceled(job))
+
+        commit: Optional[str] = None
+        versions: Dict[str, Optional[str]] = {}
+        if job.req.use_cache and RESULT_CACHE_ENABLED:
+            # Resolve the commit up front so fully cached jobs never clone at all
+            resolve = _start_step(job, "resolve")
+            try:
+                commit = resolve_remote_commit(job.req.repo_url, github_token=job.req.github_token, branch=job.req.branch, timeout=min(deadline.share("resolve"), 60), deadline=deadline)
+                versions = TOOLS.versions()
+                _finish_step(job, resolve, "succeeded", f"commit={commit}" if commit else "commit unknown")
+            except Exception as exc:
+                # Let the clone step surface the real error; just run uncached
+                _finish_step(job, resolve, "skipped", str(exc))
+            job.commit = commit
 
-        timeout = job.req.timeout_seconds
+        steps = _build_steps(job, deadline, commit=commit, versions=versions)
+        records: Dict[str, JobStep] = {}
+        # Steps that read the checkout (cached ones may fall back to it); once all are done it can be deleted
+        readers = {s.name for s in steps if s.name in _CHECKOUT_STEPS}
 
-        # Helper to manage steps
-        def start_step(name: str, msg: Optional[str] = None) -> None:
-            step = JobStep(name=name, status="running", started_at=datetime.utcnow().isoformat() + "Z", message=msg)
-            job.steps.append(step)
+        def on_start(step: Step) -> None:
+            records[step.name] = _start_step(job, step.name, step.message)
 
-        def finish_step(status: str = "succeeded", msg: Optional[str] = None) -> None:
-            if not job.steps:
+        def on_finish(step: Step, status: str, msg: Optional[str]) -> None:
+            if step.name in readers:
+                readers.discard(step.name)
+                if not readers:
+                    _release_checkout(job)
+            record = records.get(step.name)
+            if record is None:
+                # Never started (skipped); still surface it in the step list
+                record = JobStep(name=step.name, status=status, message=msg or step.message)
+                with job.lock:
+                    job.steps.append(record)
+                _persist(job)
                 return
-            step = job.steps[-1]
-            step.status = status
-            step.finished_at = datetime.utcnow().isoformat() + "Z"
-            if msg:
-                step.message = msg
-
-        def check_cancel() -> None:
-            if job.canceled:
-                raise RuntimeError("job canceled")
-
-        # 1) Clone repo
-        start_step("clone", f"branch={job.req.branch or 'default'}")
-        clone_repo(job.req.repo_url, dest_dir=job.repo_dir, github_token=job.req.github_token, branch=job.req.branch, timeout=timeout)
-        finish_step("succeeded")
-        check_cancel()
-
-        # 2) Run scanners according to selection
-        config_path = REPO_ROOT / job.req.semgrep_config_path
-
-        selected = [s.value for s in job.req.scanners]
-        if "semgrep" in selected:
-            start_step("semgrep")
-            run_semgrep(repo_dir=job.repo_dir, reports_dir=job.reports_dir, config_path=config_path, timeout=timeout)
-            finish_step("succeeded")
-            check_cancel()
-        if "gitleaks" in selected:
-            start_step("gitleaks")
-            run_gitleaks(repo_dir=job.repo_dir, reports_dir=job.reports_dir, timeout=timeout)
-            finish_step("succeeded")
-            check_cancel()
-        if "sbom" in selected:
-            start_step("sbom")
-            run_syft_grype(repo_dir=job.repo_dir, reports_dir=job.reports_dir, timeout=timeout)
-            finish_step("succeeded")
-            check_cancel()
-
-        # 3) Build index and generate SoW
-        start_step("index")
-        run_indexer(repo_dir=job.repo_dir, index_out_dir=job.index_dir, timeout=timeout)
-        finish_step("succeeded")
-        check_cancel()
-        start_step("sow")
-        job.sow_path.parent.mkdir(parents=True, exist_ok=True)
-        from .cli_wrappers import run_sow
-
-        run_sow(index_dir=job.index_dir, reports_dir=job.reports_dir, out_file=job.sow_path, timeout=timeout)
-        finish_step("succeeded")
+            _finish_step(job, record, status, msg)
 
+        run_steps(
+            steps,
+            on_start=on_start,
+            on_finish=on_finish,
+            max_parallel=job.req.max_parallel_steps,
+            should_cancel=lambda: _is_canceled(job),
+        )
+
+        _precompress_reports(job)
+        _ingest_findings(job)
         job.status = JobStatus.succeeded
     except Exception as exc:  # pragma: no cover
         job.status = JobStatus.failed
         job.message = str(exc)
-        # Mark current step as failed if running
-        if job.steps and job.steps[-1].status == "running":
-            job.steps[-1].status = "failed"
-            job.steps[-1].finished_at = datetime.utcnow().isoformat() + "Z"
     finally:
+        _release_checkout(job)
         job.finished_at = datetime.utcnow()
-        # Update repo history record
+        # Final save also records artifact metadata, which feeds /plan history
+        _persist(job, with_artifacts=True)
+        with JOBS_LOCK:
+            JOBS.pop(job.id, None)
+
+
+def _precompress_reports(job: Job) -> None:
+    # Compressed once here rather than on every download of a large report
+    for path in (job.reports_dir.glob("*") if job.reports_dir.exists() else []):
         try:
-            reports_present: List[str] = []
-            if job.reports_dir.exists():
-                for p in job.reports_dir.glob("*"):
-                    if p.is_file():
-                        reports_present.append(p.name)
-            REPO_LAST[job.req.repo_url] = {
-                "job_id": job.id,
-                "status": job.status.value,
-                "when": datetime.utcnow().isoformat() + "Z",
-                "reports_present": reports_present,
-                "scanners_selected": [s.value for s in job.req.scanners],
-            }
+            if path.is_file() and path.stat().st_size >= ANALYZER_PRECOMPRESS_MIN_BYTES:
+                precompress(path, job.compressed_dir)
+        except OSError:
+            continue
+
+
+def _ingest_findings(job: Job) -> None:
+    if FINDINGS is None:
+        return
+    step = _start_step(job, "findings")
+    try:
+        result = FINDINGS.ingest(job.id, job.req.repo_url, job.commit, job.reports_dir)
+    except Exception as exc:
+        # The SARIF files stay authoritative; the job is only missing from /findings, and says why
+        _finish_step(job, step, "skipped", f"not ingested: {exc}")
+        return
+    _finish_step(job, step, "succeeded", f"{result['findings']} findings")
+
+
+def _release_checkout(job: Job) -> None:
+    with job.lock:
+        snap, job.snapshot = job.snapshot, None
+        if snap is not None:
+            job.repo_dir = job.job_dir / "repo"
+    if snap is not None:
+        SNAPSHOTS.release(snap)
+    else:
+        remove_checkout(job.repo_dir)
+
+
+def _is_canceled(job: Job) -> bool:
+    # Cancellation may have been requested through another API process. Every
+    # running command polls this several times a second, so the store is only
+    # consulted once per interval.
+    if not job.canceled:
+        now = time.monotonic()
+        if now - job.cancel_checked_at >= _CANCEL_CHECK_SECONDS:
+            job.cancel_checked_at = now
+            try:
+                job.canceled = STORE.is_canceled(job.id)
+            except Exception:
+                pass
+    return job.canceled
+
+
+SCHEDULER = JobScheduler(_run_job)
+
+
+def _resume(record: Dict[str, object]) -> None:
+    # Adopt a job whose owning process died: start it over from the queue
+    job = Job.from_record(record)
+    if job.status not in (JobStatus.pending, JobStatus.running):
+        return
+    if record.get("had_token") or job.canceled:
+        job.status = JobStatus.failed
+        job.message = "job canceled" if job.canceled else "interrupted by restart; resubmit (credentials are not persisted)"
+        job.finished_at = datetime.utcnow()
+        _persist(job, with_artifacts=True)
+        return
+    shutil.rmtree(job.job_dir, ignore_errors=True)
+    job.status = JobStatus.pending
+    job.steps = []
+    job.started_at = None
+    job.message = "resumed after restart"
+    with JOBS_LOCK:
+        JOBS[job.id] = job
+    try:
+        SCHEDULER.submit(job.id, job, client=job.client, priority=job.req.priority.value)
+    except QueueFull:
+        with JOBS_LOCK:
+            JOBS.pop(job.id, None)
+        job.status = JobStatus.failed
+        job.message = "interrupted by restart; queue full on resume"
+        job.finished_at = datetime.utcnow()
+    _persist(job)
+
+
+def _is_active(job_id: str) -> bool:
+    with JOBS_LOCK:
+        if job_id in JOBS:
+            return True
+    record = STORE.get(job_id)
+    # Directories without a job row are leftovers and fair game
+    return bool(record and record["status"] in (JobStatus.pending.value, JobStatus.running.value))
+
+
+LAST_GC: Dict[str, object] = {}
+
+
+def _collect_garbage() -> Dict[str, object]:
+    result = collect(WORK_ROOT, _is_active)
+    result["at"] = datetime.utcnow().isoformat() + "Z"
+    LAST_GC.clear()
+    LAST_GC.update(result)
+    return result
+
+
+def _maintenance_loop(stop: threading.Event) -> None:
+    next_gc = 0.0
+    while True:
+        try:
+            with JOBS_LOCK:
+                live = list(JOBS)
+            STORE.heartbeat(live)
+            for record in STORE.claim_stale():
+                _resume(record)
+            for job_id in STORE.evict():
+                shutil.rmtree(WORK_ROOT / job_id, ignore_errors=True)
+            SNAPSHOTS.prune()
+            if RESULT_CACHE_ENABLED:
+                prune_results(RESULT_CACHE_MAX_BYTES)
+            if REPO_CACHE_ENABLED:
+                evict_mirrors(REPO_CACHE_MAX_BYTES)
+            if FINDINGS is not None:
+                FINDINGS.evict()
+            if time.time() >= next_gc:
+                next_gc = time.time() + ANALYZER_GC_INTERVAL_SECONDS
+                _collect_garbage()
         except Exception:
             pass
+        if stop.wait(ANALYZER_MAINTENANCE_INTERVAL_SECONDS):
+            return
 
 
 @app.post("/oauth/token")
@@ -174,35 +659,35 @@ async def oauth_token(
         raise HTTPException(status_code=400, detail="unsupported_grant_type")
     if not authenticate_client(client_id, client_secret):
         raise HTTPException(status_code=401, detail="invalid_client")
-    return issue_token(client_id, scope)
+    return issue_token(client_id, grant_scope(client_id, scope))
 
 
-@app.post("/api/v1/analyze", response_model=AnalyzeStartResponse, dependencies=[Depends(require_auth)])
-async def start_analyze(req: AnalyzeRequest, background_tasks: BackgroundTasks) -> AnalyzeStartResponse:
+@app.post("/api/v1/analyze", response_model=AnalyzeStartResponse)
+async def start_analyze(req: AnalyzeRequest, claims: Dict[str, object] = Depends(require_auth)) -> AnalyzeStartResponse:
     _validate_request(req)
+    # Otherwise every client could put itself at the front of the queue
+    if req.priority == JobPriority.high and not has_scope(claims, "priority:high"):
+        raise HTTPException(status_code=403, detail="priority high requires the priority:high scope")
     job_id = uuid.uuid4().hex
-    job = Job(job_id, req)
+    job = Job(job_id, req, client=str(claims.get("sub") or "anonymous"))
     with JOBS_LOCK:
         JOBS[job_id] = job
-
-    background_tasks.add_task(_run_job, job)
-    return AnalyzeStartResponse(job_id=job_id, status=job.status)
+    try:
+        position = SCHEDULER.submit(job_id, job, client=job.client, priority=req.priority.value)
+    except QueueFull as exc:
+        with JOBS_LOCK:
+            JOBS.pop(job_id, None)
+        raise HTTPException(status_code=429, detail=exc.reason, headers={"Retry-After": str(exc.retry_after)})
+    # A store write can wait on the SQLite lock; keep that off the event loop
+    await asyncio.to_thread(_persist, job)
+    return AnalyzeStartResponse(job_id=job_id, status=job.status, queue_position=position)
 
 
 @app.get("/api/v1/jobs/{job_id}", response_model=JobStatusResponse, dependencies=[Depends(require_auth)])
 def job_status(job_id: str) -> JobStatusResponse:
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
+    job = _get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
-    reports_present: List[str] = []
-    try:
-        if job.reports_dir.exists():
-            for p in job.reports_dir.glob("*"):
-                if p.is_file():
-                    reports_present.append(p.name)
-    except Exception:
-        pass
     return JobStatusResponse(
         job_id=job.id,
         status=job.status,
@@ -214,105 +699,292 @@ def job_status(job_id: str) -> JobStatusResponse:
         finished_at=job.finished_at.isoformat() + "Z" if job.finished_at else None,
         steps=job.steps,
         canceled=job.canceled,
+        commit=job.commit,
+        queue_position=SCHEDULER.position(job.id) if job.status == JobStatus.pending else None,
+        eta_seconds=SCHEDULER.eta_seconds(job.id) if job.status == JobStatus.pending else None,
         scanners_selected=[ScannerName(s) for s in [s.value for s in job.req.scanners]],
-        reports_present=reports_present,
+        reports_present=job.reports_present(),
     )
 
 
 @app.get("/api/v1/jobs/{job_id}/sow", response_model=SowResponse, dependencies=[Depends(require_auth)])
-def get_sow(job_id: str) -> SowResponse:
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
+def get_sow(job_id: str, request: Request, response: Response):
+    job = _get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
     if not job.sow_path.exists():
         raise HTTPException(status_code=404, detail="sow not available for this job")
+    etag = file_etag(job.sow_path.stat())
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
     content = job.sow_path.read_text(encoding="utf-8")
     return SowResponse(job_id=job_id, sow_markdown=content)
 
 
+@app.post("/api/v1/jobs/{job_id}/search", response_model=SearchResponse, dependencies=[Depends(require_auth)])
+def search_job_index(job_id: str, req: SearchRequest) -> SearchResponse:
+    job = _get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    if not (job.index_dir / "header.json").exists():
+        INDEX_CACHE.drop(job_id)
+        raise HTTPException(status_code=404, detail="index not available for this job")
+    try:
+        results, kind, took_ms = search_index(job_id, job.index_dir, req.query, req.top_k)
+    except (OSError, ValueError) as exc:
+        raise HTTPException(status_code=409, detail=f"index unreadable: {exc}")
+    return SearchResponse(job_id=job_id, results=[SearchHit(**r) for r in results], index=kind, took_ms=took_ms)
+
+
 @app.post("/api/v1/jobs/{job_id}/cancel", dependencies=[Depends(require_auth)])
 def cancel_job(job_id: str) -> Dict[str, str]:
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
+    job = _get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
     job.canceled = True
+    STORE.request_cancel(job_id)
+    if SCHEDULER.remove(job_id):
+        # Never started: finish it here instead of waiting for a worker
+        job.status = JobStatus.failed
+        job.message = "job canceled"
+        job.finished_at = datetime.utcnow()
+        _persist(job)
+        with JOBS_LOCK:
+            JOBS.pop(job_id, None)
+        return {"status": "canceled"}
     return {"status": "cancellation_requested"}
 
 
+@app.get("/api/v1/queue", dependencies=[Depends(require_auth)])
+def queue_stats() -> Dict[str, object]:
+    stats = SCHEDULER.stats()
+    stats["warm_workers"] = WARM_POOL.stats()
+    stats["search_cache"] = INDEX_CACHE.stats()
+    stats["auth_cache"] = TOKEN_CACHE.stats()
+    return stats
+
+
+@app.get("/api/v1/disk", dependencies=[Depends(require_auth)])
+def disk_usage() -> Dict[str, object]:
+    return {
+        "work": usage(WORK_ROOT),
+        "repo_cache": repo_cache_stats(),
+        "result_cache": result_cache_stats(),
+        "snapshots": SNAPSHOTS.stats(),
+        "last_gc": LAST_GC or None,
+    }
+
+
 @app.get("/api/v1/capabilities")
-def capabilities() -> Dict[str, object]:
-    avail = tools_available()
+async def capabilities() -> Dict[str, object]:
+    avail = {name: bool(info["available"]) for name, info in (await TOOLS.tools_async()).items()}
     scanners = [
         {"name": "semgrep", "available": bool(avail.get("semgrep"))},
         {"name": "gitleaks", "available": bool(avail.get("gitleaks"))},
         {"name": "sbom", "available": bool(avail.get("syft")) and bool(avail.get("grype"))},
     ]
-    return {"scanners": scanners, "tools": avail}
+    return {"scanners": scanners, "tools": avail, "checked_at": TOOLS.checked_at}
 
 
 @app.get("/api/v1/jobs/{job_id}/reports/{name}", dependencies=[Depends(require_auth)])
-def get_report(job_id: str, name: str):
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
+def get_report(job_id: str, name: str, request: Request, response: Response):
+    _, path = _report_path(job_id, name)
+    etag = file_etag(path.stat())
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
+    try:
+        return {"name": name, "content": path.read_text(encoding="utf-8")}
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@app.get("/api/v1/jobs/{job_id}/reports/{name}/raw", dependencies=[Depends(require_auth)])
+def download_report(job_id: str, name: str, request: Request) -> Response:
+    """The report file itself, streamed from disk; supports If-None-Match, Range and gzip/zstd."""
+    job, path = _report_path(job_id, name)
+    return file_response(request, path, copies_dir=job.compressed_dir, filename=name)
+
+
+@app.get("/api/v1/findings", response_model=FindingsResponse, dependencies=[Depends(require_auth)])
+def list_findings(
+    job_id: Optional[str] = None,
+    repo_url: Optional[str] = None,
+    commit: Optional[str] = None,
+    tool: Optional[str] = None,
+    rule: Optional[str] = None,
+    severity: Optional[List[str]] = Query(default=None),
+    path: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+) -> FindingsResponse:
+    """Findings of `job_id`, or of the latest ingested job of `repo_url` (at `commit`, if given)."""
+    meta = _findings_job(job_id, repo_url, commit)
+    try:
+        rows, next_cursor = FINDINGS.query(  # type: ignore[union-attr]
+            str(meta["job_id"]), tool=tool, rule=rule, severity=_severities(severity), path_prefix=path, limit=limit, cursor=cursor
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return FindingsResponse(
+        job_id=str(meta["job_id"]),
+        repo_url=str(meta["repo_url"]),
+        commit=meta["commit"],  # type: ignore[arg-type]
+        counts=meta["counts"],  # type: ignore[arg-type]
+        findings=[Finding(**r) for r in rows],
+        next_cursor=next_cursor,
+    )
+
+
+@app.get("/api/v1/findings/diff", response_model=FindingsDiffResponse, dependencies=[Depends(require_auth)])
+def diff_findings(
+    head: Optional[str] = None,
+    base: Optional[str] = None,
+    repo_url: Optional[str] = None,
+    head_commit: Optional[str] = None,
+    base_commit: Optional[str] = None,
+    severity: Optional[List[str]] = Query(default=None),
+    limit: int = Query(default=100, ge=0, le=1000),
+) -> FindingsDiffResponse:
+    """New, fixed and unchanged findings between two ingested jobs of one repo.
+
+    Jobs are named directly (`head`, `base`) or by commit of `repo_url`. Without
+    either base parameter, the job of that repo ingested just before head is used.
+    """
+    head_meta = _findings_job(head, repo_url, head_commit)
+    if base or base_commit:
+        base_meta = _findings_job(base, str(head_meta["repo_url"]), base_commit)
+    else:
+        previous = FINDINGS.latest(str(head_meta["repo_url"]), before=float(head_meta["ingested_at"]))  # type: ignore[union-attr,arg-type]
+        if previous is None:
+            raise HTTPException(status_code=404, detail="no earlier findings for this repo")
+        base_meta = previous
+    if base_meta["repo_key"] != head_meta["repo_key"]:
+        raise HTTPException(status_code=400, detail="base and head belong to different repositories")
+    tools = [t for t in head_meta["tools"] if t in base_meta["tools"]]  # type: ignore[attr-defined,operator]
+    result = FINDINGS.diff(str(base_meta["job_id"]), str(head_meta["job_id"]), tools, severity=_severities(severity), limit=limit)  # type: ignore[union-attr]
+    return FindingsDiffResponse(
+        base_job_id=str(base_meta["job_id"]),
+        head_job_id=str(head_meta["job_id"]),
+        base_commit=base_meta["commit"],  # type: ignore[arg-type]
+        head_commit=head_meta["commit"],  # type: ignore[arg-type]
+        tools=tools,
+        counts=result["counts"],  # type: ignore[arg-type]
+        new=[Finding(**r) for r in result["new"]],  # type: ignore[union-attr]
+        fixed=[Finding(**r) for r in result["fixed"]],  # type: ignore[union-attr]
+    )
+
+
+def _findings_job(job_id: Optional[str], repo_url: Optional[str], commit: Optional[str]) -> Dict[str, object]:
+    if FINDINGS is None:
+        raise HTTPException(status_code=503, detail="findings store disabled")
+    if job_id:
+        meta = FINDINGS.job(job_id)
+    elif repo_url:
+        meta = FINDINGS.latest(repo_url, commit=commit)
+    else:
+        raise HTTPException(status_code=400, detail="job id or repo_url required")
+    if meta is None:
+        raise HTTPException(status_code=404, detail="no findings ingested for this job")
+    return meta
+
+
+def _severities(values: Optional[List[str]]) -> Optional[List[str]]:
+    unknown = [v for v in values or [] if v not in SEVERITIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown severity: {', '.join(unknown)}")
+    return values or None
+
+
+def _report_path(job_id: str, name: str) -> Tuple[Job, Path]:
+    job = _get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
     path = job.reports_dir / name
     if not path.exists() or not path.is_file():
         raise HTTPException(status_code=404, detail="report not found")
-    try:
-        return {"name": name, "content": path.read_text(encoding="utf-8")}
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=str(exc))
+    return job, path
 
 
 @app.post("/api/v1/plan", dependencies=[Depends(require_auth)])
-def plan(req: AnalyzeRequest) -> Dict[str, object]:
+async def plan(req: AnalyzeRequest) -> Dict[str, object]:
     # Do not clone; return installed scanners and any last-known artifacts for this repo
-    avail = tools_available()
+    avail = {name: bool(info["available"]) for name, info in (await TOOLS.tools_async()).items()}
     scanners = [
         {"name": "semgrep", "available": bool(avail.get("semgrep"))},
         {"name": "gitleaks", "available": bool(avail.get("gitleaks"))},
         {"name": "sbom", "available": bool(avail.get("syft")) and bool(avail.get("grype"))},
     ]
-    history = REPO_LAST.get(req.repo_url, None)
+    history = await asyncio.to_thread(_repo_history, req.repo_url)
     return {"scanners": scanners, "history": history}
 
 
-@app.post("/api/v1/aggregate", dependencies=[Depends(require_auth)])
-def aggregate(req: AnalyzeRequest) -> Dict[str, object]:
-    # Clone repo shallow, collect README and *.md files (size-limited), and fetch website if provided via branch field hack
-    # We reuse AnalyzeRequest; use branch for optional website URL if supplied as "site:<url>" (keeps client simple). Alternatively add dedicated model later.
-    job_id = uuid.uuid4().hex
-    job_dir = WORK_ROOT / ("agg-" + job_id)
-    repo_dir = job_dir / "repo"
+@asynccontextmanager
+async def _checkout(prefix: str, repo_url: str, github_token: Optional[str], branch: Optional[str], timeout: float) -> AsyncIterator[Path]:
+    """A read-only checkout for the duration of the block: a shared snapshot, or a scratch clone under WORK_ROOT."""
+    if SNAPSHOTS_ENABLED:
+        snap = await SNAPSHOTS.acquire_async(repo_url, github_token=github_token, branch=branch, timeout=timeout)
+        try:
+            yield snap.path
+        finally:
+            SNAPSHOTS.release(snap)
+        return
+    job_dir = WORK_ROOT / (prefix + uuid.uuid4().hex)
     try:
-        clone_repo(req.repo_url, dest_dir=repo_dir, github_token=req.github_token, branch=req.branch, timeout=min(req.timeout_seconds, 300))
-    except Exception as exc:
-        # Allow aggregate to proceed without repo if clone fails
-        repo_dir = None  # type: ignore
-        repo_error = str(exc)
-    else:
-        repo_error = None
+        await clone_repo_async(repo_url, dest_dir=job_dir / "repo", github_token=github_token, branch=branch, timeout=timeout)
+        yield job_dir / "repo"
+    finally:
+        # Cleanup on every path, including failed clones that left a partial checkout
+        await asyncio.to_thread(remove_checkout, job_dir / "repo")
+        await asyncio.to_thread(shutil.rmtree, job_dir, True)
 
-    md_texts: List[Dict[str, str]] = []
-    readme_text: Optional[str] = None
-    if repo_dir and repo_dir.exists():
-        total_bytes = 0
-        for p in repo_dir.rglob("*.md"):
-            try:
-                if p.stat().st_size > 200_000:
-                    continue
-                txt = p.read_text(encoding="utf-8", errors="ignore")
-                total_bytes += len(txt.encode("utf-8"))
-                if total_bytes > 1_000_000:
-                    break
-                md_texts.append({"path": str(p.relative_to(repo_dir)), "text": txt})
-                if p.name.lower().startswith("readme") and readme_text is None:
-                    readme_text = txt
-            except Exception:
-                continue
+
+def _markdown_docs(repo_dir: Path) -> Iterator[Tuple[str, str, bool]]:
+    # (path, text, is the README) for each *.md file, size-limited
+    total_bytes = 0
+    readme_seen = False
+    for p in walk_files(repo_dir, suffixes=[".md"], max_file_bytes=200_000):
+        try:
+            txt = p.read_text(encoding="utf-8", errors="ignore")
+        except Exception:
+            continue
+        total_bytes += len(txt.encode("utf-8"))
+        if total_bytes > 1_000_000:
+            break
+        readme = not readme_seen and p.name.lower().startswith("readme")
+        readme_seen = readme_seen or readme
+        yield str(p.relative_to(repo_dir)), txt, readme
+
+
+async def _website_text(url: str) -> Optional[str]:
+    try:
+        async with httpx.AsyncClient(timeout=15, follow_redirects=True) as client:
+            resp = await client.get(url)
+        if resp.status_code >= 400:
+            return None
+        # Parsing a large page is CPU work; keep it off the event loop
+        return await asyncio.to_thread(lambda: BeautifulSoup(resp.text, "html.parser").get_text(separator=" ", strip=True))
+    except Exception:
+        return None
+
+
+async def _aggregate_events(req: AnalyzeRequest) -> AsyncIterator[Event]:
+    # Clone repo shallow, collect README and *.md files (size-limited), and fetch website if provided via branch field hack
+    # We reuse AnalyzeRequest; use branch for optional website URL if supplied as "site:<url>" (keeps client simple). Alternatively add dedicated model later.
+    async with AsyncExitStack() as stack:
+        # Held until the documents are read (or the client goes away mid-stream)
+        try:
+            repo_dir = await stack.enter_async_context(_checkout("agg-", req.repo_url, req.github_token, req.branch, min(req.timeout_seconds, 300)))
+        except Exception as exc:
+            # Allow aggregate to proceed without repo if clone fails
+            yield "repo", {"repo_url": req.repo_url, "repo_error": str(exc)}
+        else:
+            yield "repo", {"repo_url": req.repo_url, "repo_error": None}
+            async for path, txt, readme in iterate_off_loop(_markdown_docs(repo_dir), SCAN_POOL):
+                yield "md_file", {"path": path, "text": txt, "readme": readme}
 
     website_text: Optional[str] = None
     # Optional: overload semgrep_config_path to carry website URL (until separate model is added)
@@ -320,94 +992,162 @@ def aggregate(req: AnalyzeRequest) -> Dict[str, object]:
     if req.semgrep_config_path and req.semgrep_config_path.startswith("http"):
         site_url = req.semgrep_config_path
     if site_url:
+        website_text = await _website_text(site_url)
+    yield "website", {"text": website_text}
+
+
+@app.post("/api/v1/aggregate", dependencies=[Depends(require_auth)])
+async def aggregate(req: AnalyzeRequest) -> Dict[str, object]:
+    result: Dict[str, object] = {"repo_url": req.repo_url, "readme": None, "md_files": [], "website_text": None, "repo_error": None}
+    async for name, data in _aggregate_events(req):
+        if name == "repo":
+            result["repo_error"] = data["repo_error"]
+        elif name == "md_file":
+            result["md_files"].append({"path": data["path"], "text": data["text"]})  # type: ignore[attr-defined]
+            if data["readme"]:
+                result["readme"] = data["text"]
+        elif name == "website":
+            result["website_text"] = data["text"]
+    return result
+
+
+@app.post("/api/v1/aggregate/stream", dependencies=[Depends(require_auth)])
+async def aggregate_stream(req: AnalyzeRequest, accept: Optional[str] = Header(default=None)) -> StreamingResponse:
+    """/aggregate as a stream: a `repo` event, one `md_file` event per document, then `website` and `done`."""
+    async def events() -> AsyncIterator[Event]:
+        async for event in _aggregate_events(req):
+            yield event
+        yield "done", {}
+
+    return event_response(events(), accept)
+
+
+def _feed_checkout(matcher: FeatureMatcher, repo_dir: Path) -> Iterator[int]:
+    """Runs every code file of `repo_dir` through `matcher`, yielding the running file count."""
+    # Each file is read and lowercased once, for all features together
+    for n, f in enumerate(walk_files(repo_dir, suffixes=CODE_EXTS, skip_binary=True), 1):
+        matcher.add_path(str(f.relative_to(repo_dir)))
         try:
-            import requests  # local import
-            resp = requests.get(site_url, timeout=15)
-            if resp.ok:
-                soup = BeautifulSoup(resp.text, "html.parser")
-                website_text = soup.get_text(separator=" ", strip=True)
+            txt = f.read_text(encoding="utf-8", errors="ignore").lower()
         except Exception:
-            website_text = None
+            txt = None
+        if txt is not None:
+            matcher.add_text(txt)
+        yield n
 
-    # Cleanup clone dir to save space
-    try:
-        if job_dir.exists():
-            shutil.rmtree(job_dir, ignore_errors=True)
-    except Exception:
+
+def _feed_index(matcher: FeatureMatcher, index: TrigramIndex) -> Iterator[int]:
+    """Like _feed_checkout, but from a job's trigram index; yields the running count of files read."""
+    for rel in index.files:
+        matcher.add_path(rel)
+    # Files without any trigram of any pattern cannot change a count; skip them outright
+    cands = None if matcher.matches_everything else index.candidates_any(matcher.patterns)
+    for n, file_id in enumerate(range(len(index.files)) if cands is None else sorted(cands), 1):
+        if file_id not in index.unreadable:
+            matcher.add_text(index.text(file_id))
+        yield n
+
+
+def _scan_features(repo_dir: Path, features: List[FeatureSpec]) -> List[FeatureScanFinding]:
+    matcher = FeatureMatcher(features)
+    for _ in _feed_checkout(matcher, repo_dir):
         pass
+    return matcher.findings()
 
-    return {
-        "repo_url": req.repo_url,
-        "readme": readme_text,
-        "md_files": md_texts,
-        "website_text": website_text,
-        "repo_error": repo_error,
-    }
+
+def _scan_features_indexed(index: TrigramIndex, features: List[FeatureSpec]) -> List[FeatureScanFinding]:
+    matcher = FeatureMatcher(features)
+    for _ in _feed_index(matcher, index):
+        pass
+    return matcher.findings()
 
 
-@app.post("/api/v1/features", response_model=FeatureScanResponse, dependencies=[Depends(require_auth)])
-def feature_scan(req: FeatureScanRequest) -> FeatureScanResponse:
-    # Clone shallow and scan
-    job_id = uuid.uuid4().hex
-    job_dir = WORK_ROOT / ("feat-" + job_id)
-    repo_dir = job_dir / "repo"
-    try:
-        clone_repo(req.repo_url, dest_dir=repo_dir, github_token=req.github_token, branch=req.branch, timeout=min(req.timeout_seconds, 300))
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"clone_failed: {exc}")
-
-    code_exts = {".ts", ".tsx", ".js", ".jsx", ".py", ".go", ".java", ".rb", ".rs"}
-    files: List[Path] = []
-    for p in repo_dir.rglob("*"):
-        if p.is_file() and p.suffix.lower() in code_exts:
-            files.append(p)
-
-    results: List[FeatureScanFinding] = []
-    for spec in req.features:
-        keyword_hits = 0
-        robust_hits = 0
-        files_matched = 0
-        patterns = [kw.lower() for kw in (spec.keywords or [])]
-        robust_patterns = [kw.lower() for kw in (spec.robust_signals or [])]
-        for f in files:
-            try:
-                txt = f.read_text(encoding="utf-8", errors="ignore").lower()
-            except Exception:
-                continue
-            if any(p in txt for p in patterns):
-                files_matched += 1
-                for p in patterns:
-                    keyword_hits += txt.count(p)
-            for rp in robust_patterns:
-                robust_hits += txt.count(rp)
-        # file_globs
-        for g in (spec.file_globs or []):
-            for f in files:
-                if fnmatch.fnmatch(str(f.relative_to(repo_dir)), g):
-                    files_matched += 1
-        present = (keyword_hits > 0) or (files_matched > 0)
-        notes = None
-        if robust_hits > 0:
-            notes = f"robust_signals_hits={robust_hits}"
-        results.append(FeatureScanFinding(
-            feature=spec.name,
-            present=present,
-            keyword_hits=keyword_hits,
-            files_matched=files_matched,
-            robust_signals_hits=robust_hits,
-            notes=notes,
-        ))
-
-    # Cleanup
+def _job_trigram_index(job_id: str) -> Tuple[Job, TrigramIndex]:
+    job = _get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    if not TrigramIndex.exists(job.trigram_dir):
+        raise HTTPException(status_code=404, detail="trigram index not available for this job")
     try:
-        if job_dir.exists():
-            shutil.rmtree(job_dir, ignore_errors=True)
-    except Exception:
-        pass
+        return job, TrigramIndex(job.trigram_dir)
+    except (OSError, ValueError) as exc:
+        raise HTTPException(status_code=409, detail=f"trigram index unreadable: {exc}")
+
+
+@app.post("/api/v1/jobs/{job_id}/grep", response_model=GrepResponse, dependencies=[Depends(require_auth)])
+def grep_job(job_id: str, req: GrepRequest) -> GrepResponse:
+    started = time.perf_counter()
+    _job, index = _job_trigram_index(job_id)
+    hits = index.grep(req.pattern, max_files=req.max_files)
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    return GrepResponse(job_id=job_id, pattern=req.pattern, files=[GrepHit(**h) for h in hits], took_ms=took_ms)
+
+
+@app.post("/api/v1/features", response_model=FeatureScanResponse, dependencies=[Depends(require_auth)])
+async def feature_scan(req: FeatureScanRequest) -> FeatureScanResponse:
+    if req.job_id:
+        job, index = await asyncio.to_thread(_job_trigram_index, req.job_id)
+        results = await asyncio.get_running_loop().run_in_executor(SCAN_POOL, _scan_features_indexed, index, req.features)
+        return FeatureScanResponse(repo_url=job.req.repo_url, results=results)
+    if not req.repo_url:
+        raise HTTPException(status_code=422, detail="repo_url or job_id is required")
+    async with AsyncExitStack() as stack:
+        try:
+            repo_dir = await stack.enter_async_context(_checkout("feat-", req.repo_url, req.github_token, req.branch, min(req.timeout_seconds, 300)))
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=f"clone_failed: {exc}")
+        # Reading and matching every file is blocking work; the clone above only awaited
+        results = await asyncio.get_running_loop().run_in_executor(SCAN_POOL, _scan_features, repo_dir, req.features)
 
     return FeatureScanResponse(repo_url=req.repo_url, results=results)
 
 
+def _feature_events(matcher: FeatureMatcher, feed: Iterator[int]) -> Iterator[Event]:
+    files = 0
+    last = time.monotonic()
+    for files in feed:
+        if time.monotonic() - last >= PROGRESS_INTERVAL_SECONDS:
+            last = time.monotonic()
+            yield "progress", {"files": files}
+    # Counts are only final once every file went through the single pass
+    for finding in matcher.findings():
+        yield "finding", finding.model_dump()
+    yield "done", {"files": files}
+
+
+@app.post("/api/v1/features/stream", dependencies=[Depends(require_auth)])
+async def feature_scan_stream(req: FeatureScanRequest, accept: Optional[str] = Header(default=None)) -> StreamingResponse:
+    """/features as a stream: a `repo` event, `progress` while scanning, one `finding` per feature, then `done`.
+
+    A failed clone is reported as an `error` event, since the status line has already gone out by then.
+    """
+    matcher = FeatureMatcher(req.features)
+    if req.job_id:
+        job, index = await asyncio.to_thread(_job_trigram_index, req.job_id)
+
+        async def indexed() -> AsyncIterator[Event]:
+            yield "repo", {"repo_url": job.req.repo_url}
+            async for event in iterate_off_loop(_feature_events(matcher, _feed_index(matcher, index)), SCAN_POOL):
+                yield event
+
+        return event_response(indexed(), accept)
+    if not req.repo_url:
+        raise HTTPException(status_code=422, detail="repo_url or job_id is required")
+
+    async def cloned() -> AsyncIterator[Event]:
+        async with AsyncExitStack() as stack:
+            try:
+                repo_dir = await stack.enter_async_context(_checkout("feat-", req.repo_url, req.github_token, req.branch, min(req.timeout_seconds, 300)))
+            except Exception as exc:
+                yield "error", {"detail": f"clone_failed: {exc}"}
+                return
+            yield "repo", {"repo_url": req.repo_url}
+            async for event in iterate_off_loop(_feature_events(matcher, _feed_checkout(matcher, repo_dir)), SCAN_POOL):
+                yield event
+
+    return event_response(cloned(), accept)
+
+
 if __name__ == "__main__":  # pragma: no cover
     import uvicorn
 
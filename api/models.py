@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -12,6 +12,12 @@ class ScannerName(str, Enum):
     sbom = "sbom"  # syft + grype
 
 
+class JobPriority(str, Enum):
+    high = "high"
+    normal = "normal"
+    low = "low"
+
+
 class AnalyzeRequest(BaseModel):
     repo_url: str = Field(..., description="Git repository HTTPS URL to analyze")
     github_token: Optional[str] = Field(
@@ -33,6 +39,20 @@ class AnalyzeRequest(BaseModel):
         le=7200,
         description="Overall timeout budget for the analysis job",
     )
+    max_parallel_steps: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=8,
+        description="Max pipeline steps (scanners, indexer) run concurrently; defaults to ANALYZER_STEP_PARALLELISM",
+    )
+    priority: JobPriority = Field(
+        default=JobPriority.normal,
+        description="Queue priority class; higher classes are started first",
+    )
+    use_cache: bool = Field(
+        default=True,
+        description="Reuse results from earlier scans of the same commit with the same scanner inputs",
+    )
 
 
 class JobStatus(str, Enum):
@@ -45,11 +65,12 @@ class JobStatus(str, Enum):
 class AnalyzeStartResponse(BaseModel):
     job_id: str
     status: JobStatus
+    queue_position: Optional[int] = None
 
 
 class JobStep(BaseModel):
     name: str
-    status: str  # pending|running|succeeded|failed|skipped
+    status: str  # pending|running|succeeded|failed|skipped|canceled
     started_at: Optional[str] = None
     finished_at: Optional[str] = None
     message: Optional[str] = None
@@ -66,6 +87,9 @@ class JobStatusResponse(BaseModel):
     finished_at: Optional[str] = None
     steps: List[JobStep] = []
     canceled: bool = False
+    commit: Optional[str] = None
+    queue_position: Optional[int] = None  # 1-based while pending, None once started
+    eta_seconds: Optional[float] = None  # estimated seconds until the job starts
     scanners_selected: List[ScannerName] = []
     reports_present: List[str] = []  # filenames present in reports_dir
 
@@ -75,6 +99,26 @@ class SowResponse(BaseModel):
     sow_markdown: str
 
 
+class SearchRequest(BaseModel):
+    query: str = Field(min_length=1, max_length=4000)
+    top_k: int = Field(default=10, ge=1, le=100)
+
+
+class SearchHit(BaseModel):
+    path: str
+    span_lines: List[int]
+    lang: str
+    preview: str
+    score: float
+
+
+class SearchResponse(BaseModel):
+    job_id: str
+    results: List[SearchHit]
+    index: str  # flat|hnsw|ivf
+    took_ms: float
+
+
 class FeatureSpec(BaseModel):
     name: str
     keywords: List[str] = []
@@ -83,7 +127,9 @@ class FeatureSpec(BaseModel):
 
 
 class FeatureScanRequest(BaseModel):
-    repo_url: str
+    repo_url: Optional[str] = None
+    # Scan the checkout of a finished /analyze job (via its trigram index) instead of cloning
+    job_id: Optional[str] = None
     github_token: Optional[str] = None
     branch: Optional[str] = None
     features: List[FeatureSpec]
@@ -99,7 +145,57 @@ class FeatureScanFinding(BaseModel):
     notes: Optional[str] = None
 
 
+class GrepRequest(BaseModel):
+    pattern: str = Field(min_length=1, max_length=1000)
+    max_files: int = Field(default=100, ge=1, le=1000)
+
+
+class GrepHit(BaseModel):
+    path: str
+    count: int
+
+
+class GrepResponse(BaseModel):
+    job_id: str
+    pattern: str
+    files: List[GrepHit]
+    took_ms: float
+
+
 class FeatureScanResponse(BaseModel):
     repo_url: str
     results: List[FeatureScanFinding]
 
+
+class Finding(BaseModel):
+    tool: str  # report name: semgrep|gitleaks|grype|...
+    rule: str
+    fingerprint: str
+    severity: str  # critical|high|medium|low|info
+    path: Optional[str] = None
+    line: Optional[int] = None
+    message: Optional[str] = None
+    occurrences: int = 1
+
+
+class FindingsResponse(BaseModel):
+    job_id: str
+    repo_url: str
+    commit: Optional[str] = None
+    # tool -> severity -> findings, over the whole job regardless of filters
+    counts: Dict[str, Dict[str, int]]
+    findings: List[Finding]
+    next_cursor: Optional[str] = None
+
+
+class FindingsDiffResponse(BaseModel):
+    base_job_id: str
+    head_job_id: str
+    base_commit: Optional[str] = None
+    head_commit: Optional[str] = None
+    # Only tools both jobs ran are compared
+    tools: List[str]
+    # new|fixed|unchanged -> severity -> findings
+    counts: Dict[str, Dict[str, int]]
+    new: List[Finding]
+    fixed: List[Finding]
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+
+# Default cap on how many steps of a single job may run at the same time
+DEFAULT_STEP_PARALLELISM = int(os.getenv("ANALYZER_STEP_PARALLELISM", "4"))
+# How often the scheduler re-checks for cancellation while steps are running
+_CANCEL_POLL_SECONDS = 0.5
+
+
+class SkipStep(Exception):
+    """Raised by a step function to report the step as skipped rather than failed."""
+
+
+class Step:
+    """A unit of work in a job pipeline.
+
+    `fn` runs in a worker thread once every step named in `deps` has succeeded.
+    It may return a short message that is recorded on the step. An `optional`
+    step that fails or skips itself is reported as skipped and does not hold
+    back the steps that depend on it.
+    """
+
+    def __init__(self, name: str, fn: Callable[[], Optional[str]], deps: Optional[List[str]] = None, message: Optional[str] = None, optional: bool = False) -> None:
+        self.name = name
+        self.fn = fn
+        self.deps: List[str] = list(deps or [])
+        self.message = message
+        self.optional = optional
+
+
+StartHook = Callable[[Step], None]
+FinishHook = Callable[[Step, str, Optional[str]], None]
+
+
+def _validate(steps: List[Step]) -> None:
+    names = [s.name for s in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("duplicate step names in pipeline")
+    known = set(names)
+    for s in steps:
+        missing = [d for d in s.deps if d not in known]
+        if missing:
+            raise ValueError(f"step {s.name} depends on unknown steps: {', '.join(missing)}")
+    # Reject cycles up front so the scheduler can never stall
+    state: Dict[str, int] = {}
+    by_name = {s.name: s for s in steps}
+
+    def visit(name: str) -> None:
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"dependency cycle through step {name}")
+        state[name] = 1
+        for dep in by_name[name].deps:
+            visit(dep)
+        state[name] = 2
+
+    for n in names:
+        visit(n)
+
+
+def run_steps(
+    steps: List[Step],
+    on_start: StartHook,
+    on_finish: FinishHook,
+    max_parallel: Optional[int] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+) -> None:
+    """Run `steps` as a dependency DAG with at most `max_parallel` running at once.
+
+    Steps become ready when all their dependencies succeeded and are started in
+    declaration order. The first failure (or a cancellation) stops new steps from
+    being launched; steps already running are allowed to finish, everything not
+    started is reported as skipped, and the original error is re-raised.
+
+    Cancellation is polled while steps run; steps are expected to notice it
+    themselves (via the same flag) and stop. A step that fails after the job was
+    canceled is reported as "canceled" rather than "failed".
+    """
+    _validate(steps)
+    limit = max(1, max_parallel or DEFAULT_STEP_PARALLELISM)
+    optional = {s.name for s in steps if s.optional}
+    pending: List[Step] = list(steps)
+    results: Dict[str, str] = {}
+    running: Dict[Future, Step] = {}
+    error: Optional[BaseException] = None
+
+    with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="job-step") as pool:
+        while pending or running:
+            if error is None and should_cancel is not None and should_cancel():
+                error = RuntimeError("job canceled")
+
+            if error is None:
+                def satisfied(dep: str) -> bool:
+                    return results.get(dep) == "succeeded" or (dep in optional and results.get(dep) == "skipped")
+
+                for step in list(pending):
+                    if len(running) >= limit:
+                        break
+                    if any(d in results and not satisfied(d) for d in step.deps):
+                        # An upstream step did not succeed; this one can never run
+                        pending.remove(step)
+                        results[step.name] = "skipped"
+                        on_finish(step, "skipped", "dependency did not succeed")
+                        continue
+                    if all(satisfied(d) for d in step.deps):
+                        pending.remove(step)
+                        on_start(step)
+                        running[pool.submit(step.fn)] = step
+            else:
+                for step in pending:
+                    results[step.name] = "skipped"
+                    on_finish(step, "skipped", None)
+                pending = []
+
+            if not running:
+                if pending and error is None:
+                    # Nothing runnable and nothing in flight: only possible with unmet deps
+                    error = RuntimeError("pipeline stalled with unmet dependencies")
+                continue
+
+            finished, _ = wait(list(running), timeout=_CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                step = running.pop(fut)
+                exc = fut.exception()
+                if exc is None:
+                    results[step.name] = "succeeded"
+                    on_finish(step, "succeeded", fut.result())
+                elif should_cancel is not None and should_cancel():
+                    results[step.name] = "canceled"
+                    on_finish(step, "canceled", "job canceled")
+                    if error is None:
+                        error = RuntimeError("job canceled")
+                elif isinstance(exc, SkipStep):
+                    results[step.name] = "skipped"
+                    on_finish(step, "skipped", str(exc) or None)
+                elif step.optional:
+                    # Degrade gracefully: the job carries on without this step's output
+                    results[step.name] = "skipped"
+                    on_finish(step, "skipped", f"optional step gave up: {exc}")
+                else:
+                    results[step.name] = "failed"
+                    on_finish(step, "failed", str(exc))
+                    if error is None:
+                        error = exc
+
+    if error is not None:
+        raise error
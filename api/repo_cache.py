@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from .cli_wrappers import _run, _run_async, sanitize_url_for_logging
+from .deadline import Deadline
+
+
+# Bare mirrors of remote repos, reused across jobs; each checkout fetches only the tip it needs
+REPO_CACHE_ENABLED = os.getenv("ANALYZER_REPO_CACHE", "1").lower() not in ("0", "false", "no", "off")
+REPO_CACHE_DIR = Path(os.getenv("ANALYZER_REPO_CACHE_DIR", str(Path.cwd() / "cache" / "mirrors"))).resolve()
+REPO_CACHE_MAX_BYTES = int(os.getenv("ANALYZER_REPO_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+
+_LAST_USED = "analyzer-last-used"
+_SOURCE = "analyzer-source-url"
+# Bytes on disk after the last fetch, so eviction never has to walk the object stores
+_SIZE = "analyzer-bytes"
+
+# How often an async caller retries a mirror another request is busy with
+_LOCK_POLL_SECONDS = 0.1
+
+_LOCKS: Dict[str, threading.Lock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def normalize_url(repo_url: str) -> str:
+    # Credentials, trailing slashes and a ".git" suffix do not change which repo we talk to
+    url = re.sub(r"^(\w+://)[^@/]+@", r"\1", repo_url.strip())
+    url = url.rstrip("/")
+    if url.endswith(".git"):
+        url = url[: -len(".git")]
+    m = re.match(r"^(\w+://)([^/]+)(.*)$", url)
+    if m:
+        url = m.group(1).lower() + m.group(2).lower() + m.group(3)
+    return url
+
+
+def cache_key(repo_url: str) -> str:
+    return hashlib.sha256(normalize_url(repo_url).encode("utf-8")).hexdigest()[:32]
+
+
+def mirror_path(repo_url: str) -> Path:
+    return REPO_CACHE_DIR / f"{cache_key(repo_url)}.git"
+
+
+def _thread_lock(key: str) -> threading.Lock:
+    with _LOCKS_GUARD:
+        lock = _LOCKS.get(key)
+        if lock is None:
+            lock = _LOCKS[key] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def mirror_lock(key: str, blocking: bool = True) -> Iterator[bool]:
+    """Exclusive lock on one mirror, across threads and across processes.
+
+    Yields False (without holding anything) when `blocking` is off and the
+    mirror is busy.
+    """
+    tlock = _thread_lock(key)
+    if not tlock.acquire(blocking=blocking):
+        yield False
+        return
+    try:
+        REPO_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(REPO_CACHE_DIR / f"{key}.lock", "a+") as fh:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fh.fileno(), flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    finally:
+        tlock.release()
+
+
+@asynccontextmanager
+async def mirror_lock_async(key: str) -> AsyncIterator[None]:
+    """`mirror_lock` for coroutines: polls instead of blocking the event loop while the mirror is busy."""
+    while True:
+        with mirror_lock(key, blocking=False) as acquired:
+            if acquired:
+                yield
+                return
+        await asyncio.sleep(_LOCK_POLL_SECONDS)
+
+
+def _git_error(what: str, repo_url: str, result: subprocess.CompletedProcess) -> RuntimeError:
+    # stderr can echo the authenticated URL back; never let the token escape
+    return RuntimeError(f"{what}: {sanitize_url_for_logging(repo_url)}\n{sanitize_url_for_logging(result.stderr or '')}")
+
+
+def _ls_remote_cmd(fetch_url: str, branch: Optional[str]) -> List[str]:
+    cmd = ["git", "ls-remote", "--symref", fetch_url, "HEAD"]
+    return cmd + [f"refs/heads/{branch}", f"refs/tags/{branch}"] if branch else cmd
+
+
+def _wanted_refs(result: subprocess.CompletedProcess, branch: Optional[str]) -> Tuple[Optional[str], List[str]]:
+    """The remote's default branch, and refspecs for just the ref the checkout needs."""
+    head = None
+    refs = set()
+    for line in (result.stdout or "").splitlines() if result.returncode == 0 else []:
+        if line.startswith("ref:") and line.endswith("\tHEAD"):
+            head = line[len("ref:"):].split("\t", 1)[0].strip()
+        elif "\t" in line:
+            refs.add(line.split("\t", 1)[1].strip())
+    if branch:
+        # Same preference as `git clone --branch`: a branch wins over a tag of the same name
+        wanted = next((r for r in (f"refs/heads/{branch}", f"refs/tags/{branch}") if r in refs), None)
+    else:
+        wanted = head
+    if wanted is None:
+        # ls-remote failed or the branch is missing; let the fetch or the checkout report it
+        return head, ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+    return head, [f"+{wanted}:{wanted}"]
+
+
+def update_mirror(repo_url: str, fetch_url: str, branch: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Path:
+    """Create or refresh the bare mirror for `repo_url` with the tip of `branch` (default branch if None).
+
+    Must be called with the mirror lock held. The fetch always goes to the
+    remote with the caller's credentials, so a cached copy is never handed to a
+    caller that could not have cloned the repo themselves. Credentials are only
+    passed on the command line and never written to the mirror's config.
+    """
+    mirror = mirror_path(repo_url)
+    created = not (mirror / "HEAD").exists()
+    if created:
+        shutil.rmtree(mirror, ignore_errors=True)
+        result = _run(["git", "init", "--bare", "--quiet", str(mirror)], timeout=timeout)
+        if result.returncode != 0:
+            raise _git_error("git init failed", repo_url, result)
+        (mirror / _SOURCE).write_text(sanitize_url_for_logging(repo_url), encoding="utf-8")
+
+    head, refspecs = _wanted_refs(_run(_ls_remote_cmd(fetch_url, branch), timeout=timeout, deadline=deadline), branch)
+    result = _run(_fetch_cmd(mirror, fetch_url, refspecs), timeout=timeout, deadline=deadline)
+    if result.returncode != 0:
+        if created:
+            shutil.rmtree(mirror, ignore_errors=True)
+        raise _git_error("git fetch failed", repo_url, result)
+    if head:
+        _run(["git", "-C", str(mirror), "symbolic-ref", "HEAD", head], timeout=timeout)
+    _record_size(mirror, _run(_COUNT_OBJECTS + [str(mirror)], timeout=timeout))
+    (mirror / _LAST_USED).touch()
+    return mirror
+
+
+async def update_mirror_async(repo_url: str, fetch_url: str, branch: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Path:
+    """`update_mirror` for coroutines; must be called with `mirror_lock_async` held."""
+    mirror = mirror_path(repo_url)
+    created = not (mirror / "HEAD").exists()
+    if created:
+        shutil.rmtree(mirror, ignore_errors=True)
+        result = await _run_async(["git", "init", "--bare", "--quiet", str(mirror)], timeout=timeout)
+        if result.returncode != 0:
+            raise _git_error("git init failed", repo_url, result)
+        (mirror / _SOURCE).write_text(sanitize_url_for_logging(repo_url), encoding="utf-8")
+
+    head, refspecs = _wanted_refs(await _run_async(_ls_remote_cmd(fetch_url, branch), timeout=timeout, deadline=deadline), branch)
+    result = await _run_async(_fetch_cmd(mirror, fetch_url, refspecs), timeout=timeout, deadline=deadline)
+    if result.returncode != 0:
+        if created:
+            await asyncio.to_thread(shutil.rmtree, mirror, True)
+        raise _git_error("git fetch failed", repo_url, result)
+    if head:
+        await _run_async(["git", "-C", str(mirror), "symbolic-ref", "HEAD", head], timeout=timeout)
+    counted = await _run_async(_COUNT_OBJECTS + [str(mirror)], timeout=timeout)
+    await asyncio.to_thread(_record_size, mirror, counted)
+    (mirror / _LAST_USED).touch()
+    return mirror
+
+
+def _fetch_cmd(mirror: Path, fetch_url: str, refspecs: List[str]) -> List[str]:
+    # Only the tip the checkout needs, like the `clone --depth 1` this replaces: the
+    # checkout is itself depth 1 and nothing downstream reads history, so a repo
+    # scanned once costs no more than a direct shallow clone.
+    return [
+        "git", "-C", str(mirror), "fetch", "--depth", "1", "--no-tags", "--prune", "--force", "--quiet", "--no-write-fetch-head",
+        fetch_url,
+        *refspecs,
+    ]
+
+
+_COUNT_OBJECTS = ["git", "count-objects", "-v", "--git-dir"]
+
+
+def _record_size(mirror: Path, result: subprocess.CompletedProcess) -> None:
+    # `count-objects -v` reports KiB of loose objects, packs and garbage without walking them
+    kib = 0
+    for line in (result.stdout or "").splitlines() if result.returncode == 0 else []:
+        name, _, value = line.partition(":")
+        if name in ("size", "size-pack", "size-garbage") and value.strip().isdigit():
+            kib += int(value)
+    size = kib * 1024 if kib else _dir_size(mirror)
+    try:
+        (mirror / _SIZE).write_text(str(size), encoding="utf-8")
+    except OSError:
+        pass
+
+
+def _mirror_size(mirror: Path) -> int:
+    try:
+        return int((mirror / _SIZE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        # Fetched before sizes were recorded
+        return _dir_size(mirror)
+
+
+def _checkout_cmd(mirror: Path, dest_dir: Path, branch: Optional[str]) -> List[str]:
+    # A shallow file:// clone keeps the same single-commit checkout the scanners
+    # saw with a direct `clone --depth 1`, and owns its objects, so evicting
+    # the mirror later cannot break a running job.
+    cmd = ["git", "clone", "--quiet", "--depth", "1"]
+    if branch:
+        cmd += ["--branch", branch]
+    return cmd + [mirror.as_uri(), str(dest_dir)]
+
+
+def checkout_from_mirror(repo_url: str, fetch_url: str, dest_dir: Path, branch: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> None:
+    key = cache_key(repo_url)
+    with mirror_lock(key):
+        mirror = update_mirror(repo_url, fetch_url, branch=branch, timeout=timeout, deadline=deadline)
+        result = _run(_checkout_cmd(mirror, dest_dir, branch), timeout=timeout, deadline=deadline)
+        if result.returncode != 0:
+            raise _git_error("git clone from mirror failed", repo_url, result)
+    # Tools such as `semgrep ci` read the origin URL for metadata
+    _run(["git", "-C", str(dest_dir), "remote", "set-url", "origin", sanitize_url_for_logging(repo_url)], timeout=timeout)
+
+
+async def checkout_from_mirror_async(repo_url: str, fetch_url: str, dest_dir: Path, branch: Optional[str] = None, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> None:
+    key = cache_key(repo_url)
+    async with mirror_lock_async(key):
+        mirror = await update_mirror_async(repo_url, fetch_url, branch=branch, timeout=timeout, deadline=deadline)
+        result = await _run_async(_checkout_cmd(mirror, dest_dir, branch), timeout=timeout, deadline=deadline)
+        if result.returncode != 0:
+            raise _git_error("git clone from mirror failed", repo_url, result)
+    await _run_async(["git", "-C", str(dest_dir), "remote", "set-url", "origin", sanitize_url_for_logging(repo_url)], timeout=timeout)
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _last_used(mirror: Path) -> float:
+    try:
+        return (mirror / _LAST_USED).stat().st_mtime
+    except OSError:
+        try:
+            return mirror.stat().st_mtime
+        except OSError:
+            return 0.0
+
+
+def cache_stats() -> Dict[str, object]:
+    mirrors: List[Dict[str, object]] = []
+    total = 0
+    if REPO_CACHE_DIR.exists():
+        for mirror in REPO_CACHE_DIR.glob("*.git"):
+            size = _mirror_size(mirror)
+            total += size
+            try:
+                source = (mirror / _SOURCE).read_text(encoding="utf-8").strip()
+            except OSError:
+                source = None
+            mirrors.append({"repo_url": source, "bytes": size, "last_used": _last_used(mirror)})
+    return {"enabled": REPO_CACHE_ENABLED, "dir": str(REPO_CACHE_DIR), "max_bytes": REPO_CACHE_MAX_BYTES, "bytes": total, "mirrors": mirrors}
+
+
+def evict(max_bytes: int) -> List[Path]:
+    """Delete least recently used mirrors until the cache fits in `max_bytes`.
+
+    Sizes come from what each fetch recorded. Called from the maintenance loop;
+    mirrors that are locked (being fetched or checked out) are left alone.
+    """
+    if not REPO_CACHE_DIR.exists():
+        return []
+    entries: List[Tuple[float, int, Path]] = []
+    total = 0
+    for mirror in REPO_CACHE_DIR.glob("*.git"):
+        size = _mirror_size(mirror)
+        total += size
+        entries.append((_last_used(mirror), size, mirror))
+    removed: List[Path] = []
+    if total <= max_bytes:
+        return removed
+    for _used, size, mirror in sorted(entries):
+        if total <= max_bytes:
+            break
+        key = mirror.name[: -len(".git")]
+        with mirror_lock(key, blocking=False) as acquired:
+            if not acquired:
+                continue
+            shutil.rmtree(mirror, ignore_errors=True)
+        total -= size
+        removed.append(mirror)
+    return removed
+
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Content-addressed store of step outputs keyed by commit SHA and every input that
+# can change a step's result (scanner config, tool versions, script versions).
+RESULT_CACHE_ENABLED = os.getenv("ANALYZER_RESULT_CACHE", "1").lower() not in ("0", "false", "no", "off")
+RESULT_CACHE_DIR = Path(os.getenv("ANALYZER_RESULT_CACHE_DIR", str(Path.cwd() / "cache" / "results"))).resolve()
+RESULT_CACHE_MAX_BYTES = int(os.getenv("ANALYZER_RESULT_CACHE_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+# Vulnerability databases move daily; results that depend on them expire sooner
+RESULT_CACHE_VULN_TTL_SECONDS = int(os.getenv("ANALYZER_RESULT_CACHE_VULN_TTL_SECONDS", "86400"))
+
+_META = "meta.json"
+
+
+def file_digest(path: Path) -> Optional[str]:
+    try:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+    except OSError:
+        return None
+
+
+def make_key(step: str, commit: str, inputs: Dict[str, object]) -> str:
+    material = json.dumps({"step": step, "commit": commit, "inputs": inputs}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _entry_dir(key: str) -> Path:
+    return RESULT_CACHE_DIR / key[:2] / key
+
+
+def lookup(key: str, max_age: Optional[int] = None) -> Optional[Path]:
+    """Return the directory holding the artifacts for `key`, or None on a miss."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    entry = _entry_dir(key)
+    meta_path = entry / _META
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if max_age is not None and time.time() - float(meta.get("created", 0)) > max_age:
+        return None
+    try:
+        # Entry mtime doubles as the LRU clock for pruning
+        os.utime(meta_path)
+    except OSError:
+        pass
+    return entry / "files"
+
+
+def restore(key: str, dest_dir: Path, max_age: Optional[int] = None) -> Optional[List[str]]:
+    """Copy a cached entry's artifacts into `dest_dir`; returns the names copied or None on a miss."""
+    files_dir = lookup(key, max_age=max_age)
+    if files_dir is None or not files_dir.exists():
+        return None
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    names: List[str] = []
+    for src in sorted(files_dir.iterdir()):
+        target = dest_dir / src.name
+        if src.is_dir():
+            shutil.copytree(src, target, dirs_exist_ok=True)
+        else:
+            shutil.copy2(src, target)
+        names.append(src.name)
+    return names
+
+
+def store(key: str, step: str, commit: str, inputs: Dict[str, object], paths: List[Path]) -> bool:
+    """Save `paths` (files or directories) under `key`. Missing paths are ignored.
+
+    Entries are assembled in a scratch directory and renamed into place, so a
+    concurrent reader sees either nothing or a complete entry.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return False
+    present = [p for p in paths if p.exists()]
+    if not present:
+        return False
+    entry = _entry_dir(key)
+    if (entry / _META).exists():
+        return True
+    scratch = RESULT_CACHE_DIR / "tmp" / uuid.uuid4().hex
+    try:
+        files_dir = scratch / "files"
+        files_dir.mkdir(parents=True, exist_ok=True)
+        for p in present:
+            if p.is_dir():
+                shutil.copytree(p, files_dir / p.name)
+            else:
+                shutil.copy2(p, files_dir / p.name)
+        meta = {
+            "key": key,
+            "step": step,
+            "commit": commit,
+            "inputs": inputs,
+            "created": time.time(),
+            "files": [p.name for p in present],
+            "bytes": _tree_size(files_dir),
+        }
+        (scratch / _META).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(scratch, entry)
+        except OSError:
+            # Another job stored the same key first; theirs is just as good
+            return (entry / _META).exists()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    # Pruned by the maintenance loop, never here: another job may be between lookup and restore
+    return True
+
+
+def _tree_size(root: Path) -> int:
+    size = 0
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                continue
+    return size
+
+
+def _entries() -> List[Tuple[float, int, Path]]:
+    out: List[Tuple[float, int, Path]] = []
+    if not RESULT_CACHE_DIR.exists():
+        return out
+    for meta_path in RESULT_CACHE_DIR.glob("*/*/" + _META):
+        entry = meta_path.parent
+        try:
+            size = int(json.loads(meta_path.read_text(encoding="utf-8"))["bytes"])
+        except (OSError, ValueError, KeyError, TypeError):
+            # Written before sizes were recorded
+            size = _tree_size(entry)
+        try:
+            used = meta_path.stat().st_mtime
+        except OSError:
+            used = 0.0
+        out.append((used, size, entry))
+    return out
+
+
+def prune(max_bytes: int) -> int:
+    """Drop least recently used entries until the cache fits in `max_bytes`.
+
+    Reads each entry's recorded size rather than walking its files; meant for
+    the maintenance loop, not the job path.
+    """
+    entries = _entries()
+    total = sum(size for _used, size, _entry in entries)
+    removed = 0
+    for _used, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def cache_stats() -> Dict[str, object]:
+    entries = _entries()
+    return {
+        "enabled": RESULT_CACHE_ENABLED,
+        "dir": str(RESULT_CACHE_DIR),
+        "max_bytes": RESULT_CACHE_MAX_BYTES,
+        "entries": len(entries),
+        "bytes": sum(size for _used, size, _entry in entries),
+    }
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+ANALYZER_JOB_WORKERS = int(os.getenv("ANALYZER_JOB_WORKERS", "2"))
+ANALYZER_QUEUE_MAX = int(os.getenv("ANALYZER_QUEUE_MAX", "100"))
+# Per JWT `sub`: jobs running at once, and jobs waiting in the queue
+ANALYZER_CLIENT_MAX_RUNNING = int(os.getenv("ANALYZER_CLIENT_MAX_RUNNING", "1"))
+ANALYZER_CLIENT_MAX_QUEUED = int(os.getenv("ANALYZER_CLIENT_MAX_QUEUED", "20"))
+# Seed for the job duration estimate until real jobs have finished
+ANALYZER_JOB_ESTIMATE_SECONDS = float(os.getenv("ANALYZER_JOB_ESTIMATE_SECONDS", "300"))
+
+PRIORITY_RANK = {"high": 0, "normal": 1, "low": 2}
+
+
+class QueueFull(Exception):
+    """Raised by `JobScheduler.submit` when a job cannot be accepted right now."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Entry:
+    def __init__(self, item_id: str, client: str, priority: str, seq: int, payload: object) -> None:
+        self.item_id = item_id
+        self.client = client
+        self.rank = PRIORITY_RANK.get(priority, PRIORITY_RANK["normal"])
+        self.seq = seq
+        self.payload = payload
+
+
+class JobScheduler:
+    """Bounded priority queue in front of a fixed pool of job worker threads.
+
+    Jobs are picked by priority class, then by how few jobs their client already
+    has running, then FIFO. A client never has more than `client_max_running`
+    jobs running; its extra jobs wait without blocking other clients.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[Any], None],
+        workers: int = ANALYZER_JOB_WORKERS,
+        max_queue: int = ANALYZER_QUEUE_MAX,
+        client_max_running: int = ANALYZER_CLIENT_MAX_RUNNING,
+        client_max_queued: int = ANALYZER_CLIENT_MAX_QUEUED,
+        estimate_seconds: float = ANALYZER_JOB_ESTIMATE_SECONDS,
+    ) -> None:
+        self._run = run
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.client_max_running = max(1, client_max_running)
+        self.client_max_queued = client_max_queued
+        self._cond = threading.Condition()
+        self._queue: List[_Entry] = []
+        self._running: Dict[str, float] = {}  # item_id -> start time
+        self._running_by_client: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._avg_seconds = estimate_seconds
+        self._stopped = False
+
+    # -- submission -----------------------------------------------------
+
+    def submit(self, item_id: str, payload: object, client: str, priority: str = "normal") -> int:
+        """Queue a job and return its 1-based queue position, or raise QueueFull."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFull("queue_full", self._retry_after_locked())
+            if self.client_max_queued and sum(1 for e in self._queue if e.client == client) >= self.client_max_queued:
+                raise QueueFull("client_queue_full", self._retry_after_locked())
+            self._queue.append(_Entry(item_id, client, priority, next(self._seq), payload))
+            self._ensure_workers_locked()
+            self._cond.notify_all()
+            return self._position_locked(item_id) or 0
+
+    def remove(self, item_id: str) -> bool:
+        """Drop a job that has not started yet. Returns False if it is not queued."""
+        with self._cond:
+            for i, entry in enumerate(self._queue):
+                if entry.item_id == item_id:
+                    del self._queue[i]
+                    return True
+        return False
+
+    # -- introspection --------------------------------------------------
+
+    def position(self, item_id: str) -> Optional[int]:
+        with self._cond:
+            return self._position_locked(item_id)
+
+    def eta_seconds(self, item_id: str) -> Optional[float]:
+        """Rough seconds until `item_id` starts, from the average job duration."""
+        with self._cond:
+            ordered = self._ordered_locked()
+            ids = [e.item_id for e in ordered]
+            if item_id not in ids:
+                return None
+            now = time.time()
+            # Simulate workers freeing up: running jobs finish at the average
+            # duration, idle workers are free now, then each queued job ahead of
+            # us occupies the earliest free worker.
+            free = [max(0.0, self._avg_seconds - (now - started)) for started in self._running.values()]
+            free += [0.0] * max(0, self.workers - len(free))
+            heapq.heapify(free)
+            for entry_id in ids:
+                at = heapq.heappop(free)
+                if entry_id == item_id:
+                    return round(at, 1)
+                heapq.heappush(free, at + self._avg_seconds)
+        return None
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queued": len(self._queue),
+                "running": len(self._running),
+                "max_queue": self.max_queue,
+                "avg_job_seconds": round(self._avg_seconds, 1),
+            }
+
+    # -- internals ------------------------------------------------------
+
+    def _ordered_locked(self) -> List[_Entry]:
+        return sorted(self._queue, key=lambda e: (e.rank, self._running_by_client.get(e.client, 0), e.seq))
+
+    def _position_locked(self, item_id: str) -> Optional[int]:
+        for i, entry in enumerate(self._ordered_locked()):
+            if entry.item_id == item_id:
+                return i + 1
+        return None
+
+    def _retry_after_locked(self) -> int:
+        return max(1, int(self._avg_seconds * max(1, len(self._queue)) / self.workers))
+
+    def _ensure_workers_locked(self) -> None:
+        # Workers start lazily so importing the app does not spawn threads
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._worker, name=f"job-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _next_locked(self) -> Optional[_Entry]:
+        for entry in self._ordered_locked():
+            if self._running_by_client.get(entry.client, 0) < self.client_max_running:
+                return entry
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                entry = self._next_locked()
+                while entry is None and not self._stopped:
+                    self._cond.wait()
+                    entry = self._next_locked()
+                if self._stopped:
+                    return
+                self._queue.remove(entry)
+                started = time.time()
+                self._running[entry.item_id] = started
+                self._running_by_client[entry.client] = self._running_by_client.get(entry.client, 0) + 1
+            try:
+                self._run(entry.payload)
+            except Exception:
+                pass
+            finally:
+                with self._cond:
+                    self._running.pop(entry.item_id, None)
+                    left = self._running_by_client.get(entry.client, 1) - 1
+                    if left > 0:
+                        self._running_by_client[entry.client] = left
+                    else:
+                        self._running_by_client.pop(entry.client, None)
+                    # Exponentially weighted so the estimate follows recent load
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.time() - started)
+                    self._cond.notify_all()
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
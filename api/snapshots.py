@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from tools.indexer.repo_walk import forget
+
+from .cli_wrappers import (
+    clone_repo,
+    clone_repo_async,
+    resolve_commit,
+    resolve_commit_async,
+    resolve_remote_commit,
+    resolve_remote_commit_async,
+    sanitize_url_for_logging,
+)
+from .deadline import Deadline
+from .repo_cache import normalize_url
+
+
+# Shared read-only checkouts, one per (repo, commit), handed to jobs, /aggregate and /features
+SNAPSHOTS_ENABLED = os.getenv("ANALYZER_SNAPSHOTS", "1").lower() not in ("0", "false", "no", "off")
+SNAPSHOT_DIR = Path(os.getenv("ANALYZER_SNAPSHOT_DIR", str(Path.cwd() / "cache" / "snapshots"))).resolve()
+# How long a snapshot nobody holds is kept around for the next request
+SNAPSHOT_TTL_SECONDS = int(os.getenv("ANALYZER_SNAPSHOT_TTL_SECONDS", "300"))
+# How often a coroutine checks on a clone that another request or job is running
+_WAIT_POLL_SECONDS = 0.05
+
+
+class Snapshot:
+    """One checkout of `repo_url` at `commit`; valid while the caller holds a reference."""
+
+    def __init__(self, key: str, repo_url: str, commit: str, path: Path) -> None:
+        self.key = key
+        self.repo_url = repo_url
+        self.commit = commit
+        self.path = path
+        self.refs = 0
+        self.released_at = time.monotonic()
+        # False when the checkout turned out not to be `commit` (the branch moved mid-clone)
+        self.reusable = True
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+def _make_read_only(root: Path) -> None:
+    # Files only: directories stay writable so the snapshot can still be deleted,
+    # and .git is left alone since read-only git commands may refresh its index
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == str(root) and ".git" in dirnames:
+            dirnames.remove(".git")
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                mode = os.lstat(path).st_mode
+                if stat.S_ISREG(mode):
+                    os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+            except OSError:
+                continue
+
+
+class SnapshotManager:
+    """Reference-counted checkouts keyed by (normalized repo URL, commit).
+
+    `acquire` resolves the commit with the caller's own credentials first, so a
+    snapshot is only handed to callers that could have cloned the repo
+    themselves. Concurrent requests for the same commit wait on one clone.
+    Snapshots nobody holds are deleted by `prune` once they have been idle for
+    `ttl` seconds, or on its next pass if they can never be handed out again.
+    `release` does no disk work, so it is safe to call from the event loop.
+    """
+
+    def __init__(self, root: Path = SNAPSHOT_DIR, ttl: int = SNAPSHOT_TTL_SECONDS) -> None:
+        self.root = root
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Reusable snapshot per key, and every snapshot with a directory (by directory name)
+        self._entries: Dict[str, Snapshot] = {}
+        self._dirs: Dict[str, Snapshot] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(repo_url: str, commit: str) -> str:
+        return hashlib.sha256(f"{normalize_url(repo_url)}@{commit}".encode("utf-8")).hexdigest()[:32]
+
+    def acquire(
+        self,
+        repo_url: str,
+        github_token: Optional[str] = None,
+        branch: Optional[str] = None,
+        commit: Optional[str] = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Snapshot:
+        """A checkout of `branch` (default branch if None); pair every call with `release`.
+
+        `commit` skips the ls-remote when the caller already resolved it.
+        """
+        started = time.monotonic()
+        if commit is None:
+            commit = resolve_remote_commit(repo_url, github_token=github_token, branch=branch, timeout=timeout, deadline=deadline)
+            if not commit:
+                raise RuntimeError(f"branch not found: {branch}")
+        snap, creator = self._claim(repo_url, commit)
+        if creator:
+            try:
+                self._create(snap, github_token, branch, timeout, deadline)
+            except BaseException:
+                self.release(snap)
+                raise
+        else:
+            left = None if timeout is None else max(timeout - (time.monotonic() - started), 0.0)
+            if not snap.ready.wait(left):
+                self.release(snap)
+                raise TimeoutError(f"timed out waiting for the checkout of {commit[:12]}")
+        return self._checked(snap)
+
+    async def acquire_async(
+        self,
+        repo_url: str,
+        github_token: Optional[str] = None,
+        branch: Optional[str] = None,
+        commit: Optional[str] = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Snapshot:
+        """`acquire` for coroutines: the clone and any wait for someone else's clone never block the event loop."""
+        started = time.monotonic()
+        if commit is None:
+            commit = await resolve_remote_commit_async(repo_url, github_token=github_token, branch=branch, timeout=timeout, deadline=deadline)
+            if not commit:
+                raise RuntimeError(f"branch not found: {branch}")
+        snap, creator = self._claim(repo_url, commit)
+        try:
+            if creator:
+                await self._create_async(snap, github_token, branch, timeout, deadline)
+            else:
+                # The clone may be running in a job thread, so poll its event rather than await it
+                while not snap.ready.is_set():
+                    if timeout is not None and time.monotonic() - started >= timeout:
+                        raise TimeoutError(f"timed out waiting for the checkout of {commit[:12]}")
+                    await asyncio.sleep(_WAIT_POLL_SECONDS)
+        except BaseException:
+            self.release(snap)
+            raise
+        return self._checked(snap)
+
+    def _checked(self, snap: Snapshot) -> Snapshot:
+        if snap.error is not None:
+            self.release(snap)
+            raise RuntimeError(str(snap.error))
+        return snap
+
+    def _claim(self, repo_url: str, commit: str) -> Tuple[Snapshot, bool]:
+        """The snapshot for `commit` with one more reference, and whether the caller must create it."""
+        key = self._key(repo_url, commit)
+        with self._lock:
+            snap = self._entries.get(key)
+            if snap is not None and snap.reusable and snap.error is None:
+                snap.refs += 1
+                self.hits += 1
+                return snap, False
+            # Per-process directory names: several API processes may share SNAPSHOT_DIR
+            path = self.root / f"{os.getpid()}-{key}-{uuid.uuid4().hex[:8]}"
+            snap = self._entries[key] = self._dirs[path.name] = Snapshot(key, repo_url, commit, path)
+            snap.refs = 1
+            self.misses += 1
+            return snap, True
+
+    def _create(self, snap: Snapshot, github_token: Optional[str], branch: Optional[str], timeout: Optional[float], deadline: Optional[Deadline]) -> None:
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            clone_repo(snap.repo_url, dest_dir=snap.path, github_token=github_token, branch=branch, timeout=timeout, deadline=deadline)
+            head = resolve_commit(snap.path)
+            if head and head != snap.commit:
+                # Still handed to everyone already waiting, but never to a later request for `commit`
+                snap.commit = head
+                snap.reusable = False
+            _make_read_only(snap.path)
+        except BaseException as exc:
+            snap.error = exc
+            shutil.rmtree(snap.path, ignore_errors=True)
+            raise
+        finally:
+            snap.ready.set()
+
+    async def _create_async(self, snap: Snapshot, github_token: Optional[str], branch: Optional[str], timeout: Optional[float], deadline: Optional[Deadline]) -> None:
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            await clone_repo_async(snap.repo_url, dest_dir=snap.path, github_token=github_token, branch=branch, timeout=timeout, deadline=deadline)
+            head = await resolve_commit_async(snap.path)
+            if head and head != snap.commit:
+                snap.commit = head
+                snap.reusable = False
+            await asyncio.to_thread(_make_read_only, snap.path)
+        except BaseException as exc:
+            snap.error = exc
+            await asyncio.to_thread(shutil.rmtree, snap.path, True)
+            raise
+        finally:
+            snap.ready.set()
+
+    def release(self, snap: Snapshot) -> None:
+        with self._lock:
+            snap.refs -= 1
+            snap.released_at = time.monotonic()
+            if snap.refs <= 0 and self._dead(snap) and self._entries.get(snap.key) is snap:
+                # No later acquire may pick it up; the directory goes on the next prune
+                del self._entries[snap.key]
+
+    @staticmethod
+    def _dead(snap: Snapshot) -> bool:
+        return snap.error is not None or not snap.reusable
+
+    def _forget_locked(self, snap: Snapshot) -> None:
+        if self._entries.get(snap.key) is snap:
+            del self._entries[snap.key]
+        self._dirs.pop(snap.path.name, None)
+
+    @staticmethod
+    def _delete(path: Path) -> None:
+        forget(path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def prune(self, now: Optional[float] = None) -> List[str]:
+        """Delete released snapshots that failed, went stale or idled past the TTL, plus leftovers of dead processes."""
+        now = now if now is not None else time.monotonic()
+        expired: List[Snapshot] = []
+        with self._lock:
+            for snap in list(self._dirs.values()):
+                if snap.refs <= 0 and snap.ready.is_set() and (self._dead(snap) or now - snap.released_at >= self.ttl):
+                    self._forget_locked(snap)
+                    expired.append(snap)
+            # Listed under the lock, so a clone that starts meanwhile is not mistaken for a leftover
+            known = set(self._dirs) | {snap.path.name for snap in expired}
+            children = [c for c in self.root.iterdir() if c.is_dir() and c.name not in known] if self.root.exists() else []
+        removed = [snap.commit for snap in expired]
+        for snap in expired:
+            self._delete(snap.path)
+        for child in children:
+            pid = child.name.split("-", 1)[0]
+            if pid.isdigit() and (int(pid) == os.getpid() or not _pid_alive(int(pid))):
+                self._delete(child)
+                removed.append(child.name)
+        return removed
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            entries = [
+                {"repo_url": sanitize_url_for_logging(s.repo_url), "commit": s.commit, "refs": s.refs, "ready": s.ready.is_set()}
+                for s in self._dirs.values()
+            ]
+            return {
+                "enabled": SNAPSHOTS_ENABLED,
+                "dir": str(self.root),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "snapshots": entries,
+            }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+SNAPSHOTS = SnapshotManager()
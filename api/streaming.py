@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from concurrent.futures import Executor
+from typing import AsyncIterable, AsyncIterator, Dict, Iterator, Optional, Tuple, TypeVar, Union
+
+from fastapi.responses import StreamingResponse
+
+
+NDJSON = "application/x-ndjson"
+SSE = "text/event-stream"
+# Long scans report how far they got at most this often, so clients can tell a slow scan from a stalled one
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+Event = Tuple[str, Dict[str, object]]
+T = TypeVar("T")
+
+
+async def iterate_off_loop(items: Iterator[T], executor: Optional[Executor] = None) -> AsyncIterator[T]:
+    """Pull a blocking iterator one item at a time on a worker thread, so the event loop never waits on it."""
+    loop = asyncio.get_running_loop()
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, next, items, done)
+            if item is done:
+                return
+            yield item  # type: ignore[misc]
+    finally:
+        close = getattr(items, "close", None)
+        try:
+            if close is not None:
+                close()
+        except ValueError:
+            # Still running on its thread (the consumer was cancelled); it is dropped once that returns
+            pass
+
+
+async def _frames(events: Union[AsyncIterable[Event], Iterator[Event]], sse: bool) -> AsyncIterator[str]:
+    source = events if hasattr(events, "__aiter__") else iterate_off_loop(events)  # type: ignore[arg-type]
+    async for name, data in source:  # type: ignore[union-attr]
+        if sse:
+            yield f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+        else:
+            yield json.dumps({"event": name, "data": data}, separators=(",", ":")) + "\n"
+
+
+def event_response(events: Union[AsyncIterable[Event], Iterator[Event]], accept: Optional[str]) -> StreamingResponse:
+    """Stream `(name, data)` events as NDJSON, or as server-sent events if the client accepts them.
+
+    `events` is pulled one item at a time while the response is written, so
+    nothing but the event in flight is held in memory and a slow client slows
+    the producer down instead of making the server buffer for it.
+    """
+    sse = bool(accept) and SSE in accept  # type: ignore[operator]
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(_frames(events, sse), media_type=SSE if sse else NDJSON, headers=headers)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .cli_wrappers import _TOOL_PROBES, probe_tool
+
+
+# Probe results older than this are refreshed in the background; callers keep getting the last answer meanwhile
+ANALYZER_TOOL_PROBE_TTL_SECONDS = int(os.getenv("ANALYZER_TOOL_PROBE_TTL_SECONDS", "600"))
+
+
+class ToolRegistry:
+    """Availability and versions of the scanner CLIs, probed once and served from memory.
+
+    The first probe starts with the API (`start`) and runs every tool at once.
+    Results older than `ttl` stay valid while one background probe replaces
+    them, so no request ever waits on `semgrep --version` after startup.
+    """
+
+    def __init__(self, probes: Optional[Dict[str, List[str]]] = None, ttl: int = ANALYZER_TOOL_PROBE_TTL_SECONDS) -> None:
+        self.probes = dict(probes or _TOOL_PROBES)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Held for the duration of a probe, so concurrent callers wait for it instead of probing again
+        self._probe_lock = threading.Lock()
+        self._tools: Dict[str, Dict[str, object]] = {}
+        self._probed_at: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self._refreshing = False
+
+    def refresh(self) -> Dict[str, Dict[str, object]]:
+        """Probe every tool now, in parallel, and keep the results."""
+        with self._probe_lock:
+            return self._probe_locked()
+
+    def _probe_locked(self) -> Dict[str, Dict[str, object]]:
+        names = list(self.probes)
+        with ThreadPoolExecutor(max_workers=max(1, len(names)), thread_name_prefix="tool-probe") as pool:
+            results = dict(zip(names, pool.map(probe_tool, [self.probes[n] for n in names])))
+        with self._lock:
+            self._tools = results
+            self._probed_at = time.monotonic()
+            self.checked_at = time.time()
+            self._refreshing = False
+        return results
+
+    def start(self) -> None:
+        """Probe in the background so the first request finds the answer ready."""
+        with self._lock:
+            if self._refreshing or self._probed_at is not None:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_quietly, name="tool-probe", daemon=True).start()
+
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            with self._lock:
+                self._refreshing = False
+
+    def ready(self) -> bool:
+        with self._lock:
+            return self._probed_at is not None
+
+    def tools(self) -> Dict[str, Dict[str, object]]:
+        """Latest probe results per tool (`available`, `version`, `raw`).
+
+        Blocks only if nothing has been probed yet; a stale answer is returned
+        as is while a background probe refreshes it.
+        """
+        with self._lock:
+            probed_at = self._probed_at
+            stale = probed_at is not None and time.monotonic() - probed_at >= self.ttl and not self._refreshing
+            if stale:
+                self._refreshing = True
+        if probed_at is None:
+            with self._probe_lock:
+                # Whoever held the lock (usually the startup probe) may have filled it in
+                if not self.ready():
+                    self._probe_locked()
+        elif stale:
+            threading.Thread(target=self._refresh_quietly, name="tool-probe", daemon=True).start()
+        with self._lock:
+            return {name: dict(info) for name, info in self._tools.items()}
+
+    async def tools_async(self) -> Dict[str, Dict[str, object]]:
+        # Only the very first call can block; keep that wait off the event loop
+        if self.ready():
+            return self.tools()
+        return await asyncio.to_thread(self.tools)
+
+    def available(self) -> Dict[str, bool]:
+        return {name: bool(info["available"]) for name, info in self.tools().items()}
+
+    def versions(self) -> Dict[str, Optional[str]]:
+        """Parsed version per tool (None when missing); part of the result cache keys."""
+        return {name: info["version"] for name, info in self.tools().items()}  # type: ignore[misc]
+
+
+TOOLS = ToolRegistry()
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from tools.indexer.repo_walk import walk_files
+
+
+# Files that feature scans look at; the trigram index covers exactly these
+CODE_EXTS = (".ts", ".tsx", ".js", ".jsx", ".py", ".go", ".java", ".rb", ".rs")
+
+FORMAT = "analyzer-trigram"
+VERSION = 1
+HEADER = "header.json"
+_COLUMNS = ("keys.npy", "offsets.npy", "postings.npy", "text.offsets.npy", "text.bin")
+
+
+def _trigram_keys(txt: str) -> np.ndarray:
+    """Distinct trigrams of `txt`, each packed as three 21-bit code points into a uint64."""
+    cps = np.frombuffer(txt.encode("utf-32-le", errors="surrogatepass"), dtype="<u4").astype(np.uint64)
+    if len(cps) < 3:
+        return np.zeros(0, dtype=np.uint64)
+    keys = (cps[:-2] << np.uint64(42)) | (cps[1:-1] << np.uint64(21)) | cps[2:]
+    return np.unique(keys)
+
+
+def build_trigram_index(repo_dir: Path, out_dir: Path, check: Optional[Callable[[], None]] = None) -> Dict[str, int]:
+    """Index every code file under `repo_dir` into `out_dir`.
+
+    Alongside the posting lists the lowercased text of each file is stored, so
+    exact counts can still be taken after the checkout has been deleted.
+    `check` is called between files and may raise to abort the build.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / HEADER).unlink(missing_ok=True)
+    paths: List[str] = []
+    unreadable: List[int] = []
+    key_parts: List[np.ndarray] = []
+    id_parts: List[np.ndarray] = []
+    text_offsets = [0]
+    with open(out_dir / "text.bin", "wb") as text_out:
+        for f in walk_files(repo_dir, suffixes=CODE_EXTS, skip_binary=True):
+            if check is not None and len(paths) % 64 == 0:
+                check()
+            try:
+                txt = f.read_text(encoding="utf-8", errors="ignore").lower()
+            except Exception:
+                # Unreadable files still count for file_globs, just never for keywords
+                txt = None
+            file_id = len(paths)
+            paths.append(str(f.relative_to(repo_dir)))
+            if txt is None:
+                unreadable.append(file_id)
+            blob = txt.encode("utf-8", errors="surrogatepass") if txt is not None else b""
+            text_out.write(blob)
+            text_offsets.append(text_offsets[-1] + len(blob))
+            if txt:
+                keys = _trigram_keys(txt)
+                key_parts.append(keys)
+                id_parts.append(np.full(len(keys), file_id, dtype=np.uint32))
+
+    keys = np.concatenate(key_parts) if key_parts else np.zeros(0, dtype=np.uint64)
+    ids = np.concatenate(id_parts) if id_parts else np.zeros(0, dtype=np.uint32)
+    order = np.lexsort((ids, keys))
+    keys, ids = keys[order], ids[order]
+    unique_keys, starts = np.unique(keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.uint64)
+
+    np.save(out_dir / "keys.npy", unique_keys)
+    np.save(out_dir / "offsets.npy", offsets)
+    np.save(out_dir / "postings.npy", ids)
+    np.save(out_dir / "text.offsets.npy", np.asarray(text_offsets, dtype=np.uint64))
+    header = {"format": FORMAT, "version": VERSION, "files": paths, "unreadable": unreadable, "trigrams": int(len(unique_keys))}
+    (out_dir / HEADER).write_text(json.dumps(header), encoding="utf-8")
+    return {"files": len(paths), "trigrams": int(len(unique_keys)), "postings": int(len(ids))}
+
+
+class TrigramIndex:
+    """Read side of a trigram index; all arrays are memory-mapped."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        header = json.loads((self.path / HEADER).read_text(encoding="utf-8"))
+        if header.get("format") != FORMAT or int(header.get("version", 0)) > VERSION:
+            raise ValueError(f"{self.path} is not a supported trigram index")
+        self.files: List[str] = list(header["files"])
+        self.unreadable: Set[int] = set(header.get("unreadable") or [])
+        self._keys = np.load(self.path / "keys.npy", mmap_mode="r")
+        self._offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self._postings = np.load(self.path / "postings.npy", mmap_mode="r")
+        self._text_offsets = np.load(self.path / "text.offsets.npy", mmap_mode="r")
+        size = (self.path / "text.bin").stat().st_size
+        self._text = np.memmap(self.path / "text.bin", dtype="uint8", mode="r") if size else np.zeros(0, dtype="uint8")
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        return (path / HEADER).exists()
+
+    def _posting(self, key: int) -> np.ndarray:
+        i = int(np.searchsorted(self._keys, np.uint64(key)))
+        if i >= len(self._keys) or int(self._keys[i]) != key:
+            return np.zeros(0, dtype=np.uint32)
+        return self._postings[int(self._offsets[i]):int(self._offsets[i + 1])]
+
+    def candidates(self, pattern: str) -> Optional[Set[int]]:
+        """Files that may contain `pattern` (lowercased), or None when it is too short to narrow."""
+        if len(pattern) < 3:
+            return None
+        keys = sorted(set(int(k) for k in _trigram_keys(pattern)),
+                      key=lambda k: len(self._posting(k)))
+        result: Optional[np.ndarray] = None
+        # Intersect rarest first so the working set shrinks as fast as possible
+        for key in keys:
+            posting = self._posting(key)
+            result = np.asarray(posting) if result is None else np.intersect1d(result, posting, assume_unique=True)
+            if not len(result):
+                break
+        return set(int(i) for i in (result if result is not None else []))
+
+    def candidates_any(self, patterns: Iterable[str]) -> Optional[Set[int]]:
+        """Files that may contain any of `patterns`, or None if every file might."""
+        found: Set[int] = set()
+        for p in patterns:
+            cands = self.candidates(p)
+            if cands is None:
+                return None
+            found |= cands
+        return found
+
+    def text(self, file_id: int) -> str:
+        lo, hi = int(self._text_offsets[file_id]), int(self._text_offsets[file_id + 1])
+        return bytes(self._text[lo:hi]).decode("utf-8", errors="surrogatepass")
+
+    def grep(self, pattern: str, max_files: int = 100) -> List[Dict[str, object]]:
+        """Case-insensitive literal search: files containing `pattern` and how often."""
+        needle = pattern.lower()
+        cands = self.candidates(needle)
+        ids = sorted(cands) if cands is not None else range(len(self.files))
+        hits: List[Dict[str, object]] = []
+        for file_id in ids:
+            if file_id in self.unreadable:
+                continue
+            count = self.text(file_id).count(needle)
+            if count:
+                hits.append({"path": self.files[file_id], "count": count})
+                if len(hits) >= max_files:
+                    break
+        return hits
+
+
+def index_files(path: Path) -> List[Path]:
+    return [path / name for name in (HEADER,) + _COLUMNS if (path / name).exists()]
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from types import ModuleType
+from typing import Dict, List, Optional
+
+from .cli_wrappers import REPO_ROOT, ProcessCanceled, _kill_group
+from .deadline import Deadline
+
+
+# Long-lived helper processes that keep the indexer and SoW agent imported (0 disables)
+ANALYZER_WARM_WORKERS = int(os.getenv("ANALYZER_WARM_WORKERS", "2"))
+# A worker is replaced after this many tasks so leaks cannot build up
+ANALYZER_WARM_WORKER_MAX_TASKS = int(os.getenv("ANALYZER_WARM_WORKER_MAX_TASKS", "50"))
+
+TASKS: Dict[str, str] = {
+    "index": str(REPO_ROOT / "tools" / "indexer" / "index_repo.py"),
+    "sow": str(REPO_ROOT / "agents" / "security_agent.py"),
+}
+
+_POLL_SECONDS = 0.2
+
+
+class _Worker:
+    def __init__(self) -> None:
+        env = os.environ.copy()
+        env.setdefault("LC_ALL", "C")
+        env.setdefault("LANG", "C")
+        # stderr is inherited: task output ends up in the server log
+        self.proc = subprocess.Popen(
+            [sys.executable or "python3", "-m", "api.warm_worker"],
+            cwd=str(REPO_ROOT),
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.tasks = 0
+        self.ready = False
+        self._buf = b""
+
+    def send(self, message: Dict[str, object]) -> None:
+        assert self.proc.stdin is not None
+        self.proc.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+        self.proc.stdin.flush()
+
+    def read(self, cmd: List[str], timeout: Optional[float], deadline: Optional[Deadline]) -> Optional[Dict[str, object]]:
+        """Next message from the worker, or None if it exited."""
+        assert self.proc.stdout is not None
+        fd = self.proc.stdout.fileno()
+        expires = time.monotonic() + timeout if timeout else None
+        while b"\n" not in self._buf:
+            if deadline is not None and deadline.canceled():
+                self.kill()
+                raise ProcessCanceled(f"{cmd[0]} canceled")
+            if expires is not None and time.monotonic() >= expires:
+                self.kill()
+                raise subprocess.TimeoutExpired(cmd, timeout or 0)
+            readable, _, _ = select.select([fd], [], [], _POLL_SECONDS)
+            if readable:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    return None
+                self._buf += chunk
+        line, _, self._buf = self._buf.partition(b"\n")
+        return json.loads(line)
+
+    def kill(self) -> None:
+        _kill_group(self.proc)
+
+    def close(self) -> None:
+        try:
+            if self.proc.stdin:
+                self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+class WarmPool:
+    """A few pre-started Python processes that run the indexer and SoW agent.
+
+    Each worker imports the task scripts (tree-sitter, numpy) once and
+    then runs tasks sent over its stdin/stdout. Workers are separate processes,
+    so a crash or kill only loses the task in flight; the worker is replaced.
+    `run` returns None when every worker is busy so the caller can fall back to
+    a one-off subprocess instead of waiting.
+    """
+
+    def __init__(self, size: int = ANALYZER_WARM_WORKERS, max_tasks: int = ANALYZER_WARM_WORKER_MAX_TASKS) -> None:
+        self.size = max(0, size)
+        self.max_tasks = max(1, max_tasks)
+        self._lock = threading.Lock()
+        self._idle: List[_Worker] = []
+        self._busy = 0
+        self._stopped = False
+
+    def start(self) -> None:
+        with self._lock:
+            while not self._stopped and len(self._idle) + self._busy < self.size:
+                self._idle.append(_Worker())
+
+    def run(self, task: str, argv: List[str], timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Optional[subprocess.CompletedProcess]:
+        worker = self._checkout()
+        if worker is None:
+            return None
+        cmd = [TASKS[task]] + list(argv)
+        if deadline is not None:
+            if deadline.canceled():
+                self._checkin(worker)
+                raise ProcessCanceled(f"{cmd[0]} canceled")
+            timeout = deadline.timeout(cap=timeout)
+        expires = time.monotonic() + timeout if timeout else None
+        keep = False
+        try:
+            if not worker.ready:
+                # Preloading counts against the task's time like a cold start would
+                if worker.read(cmd, timeout, deadline) is None:
+                    # Could not even preload; let the caller run the task cold
+                    return None
+                worker.ready = True
+            worker.send({"task": task, "argv": list(argv)})
+            left = max(0.001, expires - time.monotonic()) if expires is not None else None
+            reply = worker.read(cmd, left, deadline)
+            if reply is None:
+                # The worker died mid-task; report it like a crashed subprocess
+                return subprocess.CompletedProcess(cmd, worker.proc.wait())
+            worker.tasks += 1
+            keep = worker.tasks < self.max_tasks
+            return subprocess.CompletedProcess(cmd, int(reply.get("returncode", 1)))  # type: ignore[arg-type]
+        except (BrokenPipeError, ValueError):
+            return subprocess.CompletedProcess(cmd, worker.proc.poll() or 1)
+        finally:
+            if keep:
+                self._checkin(worker)
+            else:
+                self._replace(worker)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "busy": self._busy}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._stopped = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+    def _checkout(self) -> Optional[_Worker]:
+        with self._lock:
+            if self._stopped:
+                return None
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.proc.poll() is None:
+                    self._busy += 1
+                    return worker
+            if self._busy < self.size:
+                self._busy += 1
+                return _Worker()
+        return None
+
+    def _checkin(self, worker: _Worker) -> None:
+        with self._lock:
+            self._busy -= 1
+            if self._stopped:
+                worker.close()
+            else:
+                self._idle.append(worker)
+
+    def _replace(self, worker: _Worker) -> None:
+        if worker.proc.poll() is None:
+            worker.close()
+        with self._lock:
+            self._busy -= 1
+        self.start()
+
+
+WARM_POOL = WarmPool()
+
+
+# -- worker process side -----------------------------------------------------
+
+def _load(name: str, path: str) -> ModuleType:
+    # The scripts import their sibling modules, as they would when run directly
+    folder = os.path.dirname(path)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    spec = importlib.util.spec_from_file_location(f"_warm_{name}", path)
+    module = importlib.util.module_from_spec(spec)  # type: ignore[arg-type]
+    sys.modules[spec.name] = module  # type: ignore[union-attr]
+    spec.loader.exec_module(module)  # type: ignore[union-attr]
+    return module
+
+
+def _run_task(module: ModuleType, path: str, argv: List[str]) -> int:
+    sys.argv = [path] + argv
+    try:
+        module.main()
+        return 0
+    except SystemExit as exc:
+        if exc.code is None:
+            return 0
+        return exc.code if isinstance(exc.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def _serve() -> None:
+    # Keep the real stdout for replies; anything the tasks print goes to stderr
+    channel = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+    modules = {name: _load(name, path) for name, path in TASKS.items()}
+    for module in modules.values():
+        warm = getattr(module, "warm_up", None)
+        if warm is not None:
+            warm()
+    channel.write(json.dumps({"ready": True}) + "\n")
+    for line in sys.stdin:
+        request = json.loads(line)
+        task = str(request["task"])
+        rc = _run_task(modules[task], TASKS[task], [str(a) for a in request.get("argv") or []])
+        channel.write(json.dumps({"returncode": rc}) + "\n")
+
+
+if __name__ == "__main__":
+    _serve()
@@ -0,0 +1 @@
+"""Offline tooling shared with the analyzer API."""
@@ -0,0 +1 @@
+"""Code indexer: chunking, embedders and the on-disk index format."""
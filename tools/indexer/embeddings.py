@@ -0,0 +1,81 @@
+"""Batch embedding backends for the indexer.
+
+Every backend fills rows of a caller-allocated matrix, so a whole index is
+embedded into one float32/float16 array without per-chunk allocations.
+Backends are picked with a spec string:
+
+  hash                 offline faux embedding (sha256-seeded gaussian, 768 dims)
+  st:<model path>      sentence-transformers model from a local directory
+  onnx:<model path>    same, running the model's ONNX export (sentence-transformers >= 3.2)
+"""
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_BATCH_SIZE = 256
+
+
+class HashEmbedder:
+    """Deterministic stand-in for a real model; needs nothing but numpy."""
+
+    name = 'sha256gauss768'
+    dim = 768
+
+    def embed_into(self, texts, out):
+        scratch = np.empty(self.dim, dtype='float64')
+        for i, text in enumerate(texts):
+            h = hashlib.sha256(text.encode('utf-8')).digest()
+            rng = np.random.default_rng(int.from_bytes(h[:8], 'little'))
+            rng.standard_normal(out=scratch)
+            out[i] = scratch
+        # One vectorized normalisation for the whole batch
+        block = out[:len(texts)]
+        norms = np.linalg.norm(block.astype('float32', copy=False), axis=1, keepdims=True)
+        block /= (norms + 1e-9).astype(block.dtype)
+
+
+class SentenceTransformerEmbedder:
+    """A local sentence-transformers model on CPU; never downloads anything."""
+
+    def __init__(self, path: str, backend: str = 'torch'):
+        try:
+            from sentence_transformers import SentenceTransformer  # type: ignore
+        except ImportError as exc:
+            raise RuntimeError('sentence-transformers is not installed; use the hash embedder or install it') from exc
+        kwargs = {'device': 'cpu', 'local_files_only': True}
+        if backend != 'torch':
+            kwargs['backend'] = backend
+        self.model = SentenceTransformer(path, **kwargs)
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        self.name = f"{backend}:{path.rstrip('/').rsplit('/', 1)[-1]}:{self.dim}"
+
+    def embed_into(self, texts, out):
+        vecs = self.model.encode(list(texts), batch_size=len(texts), normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False)
+        out[:len(texts)] = vecs
+
+
+@lru_cache(maxsize=None)
+def get_embedder(spec: str = 'hash'):
+    """Embedder for `spec`, built once per process (models are expensive to load)."""
+    kind, _, path = spec.partition(':')
+    if kind == 'hash':
+        return HashEmbedder()
+    if kind == 'st' and path:
+        return SentenceTransformerEmbedder(path)
+    if kind == 'onnx' and path:
+        return SentenceTransformerEmbedder(path, backend='onnx')
+    raise ValueError(f'unknown embedder spec: {spec}')
+
+
+def embed_texts(texts, spec: str = 'hash', batch_size: int = DEFAULT_BATCH_SIZE, dtype: str = 'float32', out=None):
+    """Embed `texts` into one (len(texts), dim) matrix, `batch_size` rows at a time."""
+    embedder = get_embedder(spec)
+    if out is None:
+        out = np.empty((len(texts), embedder.dim), dtype=dtype)
+    step = max(1, batch_size)
+    for lo in range(0, len(texts), step):
+        hi = min(lo + step, len(texts))
+        embedder.embed_into(texts[lo:hi], out[lo:hi])
+    return out
@@ -0,0 +1,152 @@
+"""Columnar, memory-mappable on-disk layout of a code index.
+
+An index directory holds one file per column plus a small JSON header:
+
+  header.json            format name, version, row count, vector dim/dtype, language table
+  vectors.npy            (count, dim) float32/float16 matrix
+  spans.npy              (count, 2) int32 [start_line, end_line)
+  path_ids.npy           (count,) int32 row -> entry in the paths string table
+  lang_ids.npy           (count,) uint8 row -> entry in header["langs"]
+  paths.offsets.npy      (n_paths + 1,) uint64 byte offsets into paths.bin
+  paths.bin              UTF-8 path strings, back to back
+  previews.offsets.npy   (count + 1,) uint64 byte offsets into previews.bin
+  previews.bin           UTF-8 chunk previews, back to back
+
+Every array is opened with mmap, so opening an index costs the same no matter
+how big it is and reading a row only touches the pages that row lives on.
+"""
+import json
+import pathlib
+
+import numpy as np
+
+FORMAT = 'analyzer-index'
+VERSION = 1
+HEADER = 'header.json'
+COLUMNS = ('vectors.npy', 'spans.npy', 'path_ids.npy', 'lang_ids.npy',
+           'paths.offsets.npy', 'paths.bin', 'previews.offsets.npy', 'previews.bin')
+
+
+def _string_table(strings):
+    blobs = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(blobs) + 1, dtype='uint64')
+    if blobs:
+        np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    return offsets, b''.join(blobs)
+
+
+def write_index(out: pathlib.Path, records, vectors, extra=None):
+    """Write `records` (dicts with path/span_lines/lang/preview) and their `vectors`."""
+    out.mkdir(parents=True, exist_ok=True)
+    # The header goes first and last: a missing header means "incomplete"
+    (out / HEADER).unlink(missing_ok=True)
+
+    paths, path_ids = [], np.empty(len(records), dtype='int32')
+    path_index = {}
+    langs, lang_ids = [], np.empty(len(records), dtype='uint8')
+    lang_index = {}
+    spans = np.empty((len(records), 2), dtype='int32')
+    for i, rec in enumerate(records):
+        pid = path_index.get(rec['path'])
+        if pid is None:
+            pid = path_index[rec['path']] = len(paths)
+            paths.append(rec['path'])
+        path_ids[i] = pid
+        lid = lang_index.get(rec['lang'])
+        if lid is None:
+            lid = lang_index[rec['lang']] = len(langs)
+            langs.append(rec['lang'])
+        lang_ids[i] = lid
+        spans[i] = rec['span_lines']
+
+    np.save(out / 'vectors.npy', np.ascontiguousarray(vectors))
+    np.save(out / 'spans.npy', spans)
+    np.save(out / 'path_ids.npy', path_ids)
+    np.save(out / 'lang_ids.npy', lang_ids)
+    for name, strings in (('paths', paths), ('previews', [r['preview'] for r in records])):
+        offsets, blob = _string_table(strings)
+        np.save(out / f'{name}.offsets.npy', offsets)
+        (out / f'{name}.bin').write_bytes(blob)
+
+    header = {
+        'format': FORMAT,
+        'version': VERSION,
+        'count': len(records),
+        'dim': int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        'dtype': str(vectors.dtype),
+        'langs': langs,
+    }
+    header.update(extra or {})
+    (out / HEADER).write_text(json.dumps(header), encoding='utf-8')
+
+
+def remove_index(out: pathlib.Path):
+    for name in (HEADER,) + COLUMNS:
+        (out / name).unlink(missing_ok=True)
+
+
+class IndexReader:
+    """Lazy, read-only view of an index directory.
+
+    Nothing but the header is read up front; columns are memory-mapped on first
+    use. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.header = json.loads((self.path / HEADER).read_text(encoding='utf-8'))
+        if self.header.get('format') != FORMAT:
+            raise ValueError(f'{self.path} is not an {FORMAT} directory')
+        if int(self.header.get('version', 0)) > VERSION:
+            raise ValueError(f"{self.path}: index version {self.header.get('version')} is newer than supported ({VERSION})")
+        self.count = int(self.header['count'])
+        self.dim = int(self.header['dim'])
+        self.langs = list(self.header.get('langs') or [])
+        self._cols = {}
+
+    def __len__(self):
+        return self.count
+
+    def _col(self, name):
+        col = self._cols.get(name)
+        if col is None:
+            if name.endswith('.bin'):
+                size = (self.path / name).stat().st_size
+                col = np.memmap(self.path / name, dtype='uint8', mode='r') if size else np.zeros(0, dtype='uint8')
+            else:
+                col = np.load(self.path / name, mmap_mode='r')
+            self._cols[name] = col
+        return col
+
+    @property
+    def vectors(self):
+        return self._col('vectors.npy')
+
+    def nbytes(self):
+        """Bytes the index occupies on disk (and at most in the page cache)."""
+        return sum((self.path / n).stat().st_size for n in COLUMNS if (self.path / n).exists())
+
+    def _string(self, table, i):
+        offsets = self._col(f'{table}.offsets.npy')
+        lo, hi = int(offsets[i]), int(offsets[i + 1])
+        return bytes(self._col(f'{table}.bin')[lo:hi]).decode('utf-8')
+
+    def path_of(self, row):
+        return self._string('paths', int(self._col('path_ids.npy')[row]))
+
+    def preview(self, row):
+        return self._string('previews', row)
+
+    def span(self, row):
+        lo, hi = self._col('spans.npy')[row]
+        return [int(lo), int(hi)]
+
+    def lang(self, row):
+        return self.langs[int(self._col('lang_ids.npy')[row])]
+
+    def record(self, row):
+        return {'path': self.path_of(row), 'span_lines': self.span(row), 'lang': self.lang(row), 'preview': self.preview(row)}
+
+    def records(self, lo=0, hi=None):
+        hi = self.count if hi is None else min(hi, self.count)
+        return [self.record(i) for i in range(lo, hi)]
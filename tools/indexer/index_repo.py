@@ -1,17 +1,41 @@
 #!/usr/bin/env python3
 import os, json, argparse, hashlib, pathlib
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from tree_sitter_languages import get_parser
 import numpy as np
-try:
-    import faiss  # type: ignore
-except Exception:
-    faiss = None
 
 SUPPORTED = {
     '.py': 'python', '.js': 'javascript', '.ts': 'typescript', '.tsx': 'tsx',
     '.jsx': 'tsx', '.go': 'go', '.java': 'java', '.rb': 'ruby', '.rs': 'rust'
 }
 
+from embeddings import DEFAULT_BATCH_SIZE, embed_texts, get_embedder
+from index_format import IndexReader, remove_index, write_index
+# The repo walker is shared with the API, which imports it from here
+from repo_walk import walk_files
+
+# Bump when chunking changes so old manifests stop matching; the embedder and dtype are part of the format too
+INDEX_FORMAT = 'chunk80-v3'
+MANIFEST = 'manifest.json'
+
+def index_format(spec: str, dtype: str = 'float32') -> str:
+    # Reused rows are copied as stored, so an index of another dtype must not be reused
+    return f'{INDEX_FORMAT}-{get_embedder(spec).name}-{dtype}'
+
+@lru_cache(maxsize=None)
+def parser_for(lang: str):
+    # Building a parser loads the grammar; do it once per language per process
+    return get_parser(lang)
+
+def warm_up():
+    """Preload every grammar (used by the API's long-lived warm workers)."""
+    for lang in set(SUPPORTED.values()):
+        try:
+            parser_for(lang)
+        except Exception:
+            continue
+
 def chunk_source(src: str, max_lines: int = 80):
     lines = src.splitlines()
     for i in range(0, len(lines), max_lines):
@@ -19,65 +43,173 @@ def chunk_source(src: str, max_lines: int = 80):
         if piece.strip():
             yield piece, (i, min(i+max_lines, len(lines)))
 
-def embed(text: str) -> np.ndarray:
-    # offline-friendly faux embedding (hash seeded gaussian) – replace with OpenAI if desired
-    h = hashlib.sha256(text.encode('utf-8')).digest()
-    seed = int.from_bytes(h[:8], 'little')
-    rng = np.random.default_rng(seed)
-    v = rng.standard_normal(768).astype('float32')
-    v /= (np.linalg.norm(v) + 1e-9)
-    return v
+def list_files(root: pathlib.Path):
+    # Pruned walk: excluded and .gitignore'd directories are never entered
+    return walk_files(root, suffixes=SUPPORTED)
+
+def chunk_file(root: pathlib.Path, p: pathlib.Path):
+    """Records and chunk texts for one file; embedding happens later, in batches."""
+    ext = p.suffix.lower()
+    try:
+        parser = parser_for(SUPPORTED[ext])
+    except Exception:
+        return [], []
+    src = p.read_text(errors='ignore')
+    parser.parse(bytes(src, 'utf-8'))  # parse to validate
+    records, texts = [], []
+    for chunk, (lo, hi) in chunk_source(src):
+        rec = {'path': str(p.relative_to(root)), 'span_lines': [lo, hi], 'lang': SUPPORTED[ext], 'preview': chunk[:2000]}
+        records.append(rec)
+        texts.append(chunk)
+    return records, texts
+
+def index_batch(root: str, paths, embed_opts):
+    # Runs in a worker process; vectors go back as one array to keep pickling cheap
+    base = pathlib.Path(root)
+    records, texts = [], []
+    for p in paths:
+        recs, chunks = chunk_file(base, base / p)
+        records.extend(recs)
+        texts.extend(chunks)
+    return records, embed_texts(texts, **embed_opts)
+
+def batches(items, jobs: int, max_size: int = 64):
+    # A few batches per worker evens out uneven file sizes without drowning in IPC
+    size = max(1, min(max_size, len(items) // (jobs * 4) or 1))
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+def index_files(root: pathlib.Path, files, jobs: int = 1, embed_opts=None):
+    """Index `files` and return (records, vector matrix) in `files` order, whatever `jobs` is."""
+    embed_opts = embed_opts or {}
+    if jobs <= 1 or len(files) < 2:
+        records, texts = [], []
+        for p in files:
+            recs, chunks = chunk_file(root, p)
+            records.extend(recs)
+            texts.extend(chunks)
+        return records, embed_texts(texts, **embed_opts)
+    # Build the embedder before forking so workers inherit a loaded model
+    get_embedder(embed_opts.get('spec', 'hash'))
+    rel = [str(p.relative_to(root)) for p in files]
+    chunks = batches(rel, jobs)
+    records, parts = [], []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # map() yields in submission order, so the merge is deterministic
+        for recs, vecs in pool.map(index_batch, [str(root)] * len(chunks), chunks, [embed_opts] * len(chunks)):
+            records.extend(recs)
+            parts.append(vecs)
+    return records, np.concatenate(parts)
+
+def file_hash(p: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(p, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class _LazyRecords:
+    # Slicing yields records on demand, so reused rows are read straight from the mmap
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __getitem__(self, rows):
+        return self.reader.records(rows.start, rows.stop)
+
+def load_previous(prev: pathlib.Path, fmt: str):
+    """Manifest, records and vectors of an earlier index, or None if unusable."""
+    try:
+        manifest = json.loads((prev / MANIFEST).read_text(encoding='utf-8'))
+        if manifest.get('format') != fmt:
+            return None
+        reader = IndexReader(prev)
+        if len(reader.vectors) != len(reader):
+            return None
+        return manifest['files'], _LazyRecords(reader), reader.vectors
+    except Exception:
+        # Missing, partial or from an older layout: fall back to a full build
+        return None
+
+def index_incremental(root: pathlib.Path, files, jobs: int, prev, embed_opts):
+    """Like index_files, but reuses chunks of files whose content hash is unchanged."""
+    hashes = {str(p.relative_to(root)): file_hash(p) for p in files}
+    old_files, old_records, old_vectors = prev if prev else ({}, [], None)
+    changed = [p for p in files if (old_files.get(str(p.relative_to(root))) or {}).get('sha256') != hashes[str(p.relative_to(root))]]
+    fresh_records, fresh_vectors = index_files(root, changed, jobs, embed_opts)
+
+    # Fresh chunks come out grouped by file, in `changed` order
+    fresh = {}
+    for i, rec in enumerate(fresh_records):
+        lo, _ = fresh.get(rec['path'], (i, i))
+        fresh[rec['path']] = (lo, i + 1)
+
+    # Re-assemble in walk order so the result matches a full rebuild
+    changed_paths = {str(p.relative_to(root)) for p in changed}
+    sources, records, manifest = [], [], {}
+    for p in files:
+        rel = str(p.relative_to(root))
+        if rel in changed_paths:
+            lo, hi = fresh.get(rel, (0, 0))
+            src_records, src_vectors = fresh_records, fresh_vectors
+        else:
+            lo = old_files[rel]['start']
+            hi = lo + old_files[rel]['count']
+            src_records, src_vectors = old_records, old_vectors
+        manifest[rel] = {'sha256': hashes[rel], 'start': len(records), 'count': hi - lo}
+        sources.append((len(records), src_vectors, lo, hi))
+        records.extend(src_records[lo:hi])
+
+    # One preallocated matrix; each file's rows are copied into it exactly once
+    vectors = np.empty((len(records), fresh_vectors.shape[1]), dtype=embed_opts.get('dtype', 'float32'))
+    for at, src, lo, hi in sources:
+        if hi > lo:
+            vectors[at:at + hi - lo] = src[lo:hi]
+    stats = {'files': len(files), 'reindexed': len(changed), 'reused': len(files) - len(changed),
+             'removed': len(set(old_files) - set(hashes))}
+    return records, vectors, manifest, stats
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument('--repo', default='.', help='path to repo to index')
     ap.add_argument('--out', default='data/index', help='output dir')
+    ap.add_argument('--jobs', type=int, default=1, help='worker processes for parse/chunk/embed (0 = all cores)')
+    ap.add_argument('--previous', default=None, help='earlier index of the same repo to reuse unchanged files from (default: --out itself)')
+    ap.add_argument('--full', action='store_true', help='ignore any previous index and rebuild from scratch')
+    ap.add_argument('--embedder', default=os.getenv('INDEXER_EMBEDDER', 'hash'), help='hash | st:<local model dir> | onnx:<local model dir>')
+    ap.add_argument('--batch-size', type=int, default=int(os.getenv('INDEXER_BATCH_SIZE', str(DEFAULT_BATCH_SIZE))), help='chunks per embedding batch')
+    ap.add_argument('--dtype', choices=['float32', 'float16'], default=os.getenv('INDEXER_DTYPE', 'float32'), help='vector precision in memory and on disk')
     args = ap.parse_args()
 
     root = pathlib.Path(args.repo).resolve()
     out = pathlib.Path(args.out).resolve()
     out.mkdir(parents=True, exist_ok=True)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
 
-    records, vectors = [], []
+    embed_opts = {'spec': args.embedder, 'batch_size': args.batch_size, 'dtype': args.dtype}
+    fmt = index_format(args.embedder, args.dtype)
+    prev = None
+    if not args.full:
+        prev = load_previous(pathlib.Path(args.previous).resolve() if args.previous else out, fmt)
+    records, vecs, manifest, stats = index_incremental(root, list_files(root), jobs, prev, embed_opts)
 
-    for p in root.rglob('*'):
-        if not p.is_file():
-            continue
-        if any(s in str(p) for s in ['.git/', 'node_modules/', 'dist/', 'build/', '.venv/']):
-            continue
-        ext = p.suffix.lower()
-        if ext not in SUPPORTED:
-            continue
-        try:
-            parser = get_parser(SUPPORTED[ext])
-        except Exception:
-            continue
-        src = p.read_text(errors='ignore')
-        parser.parse(bytes(src, 'utf-8'))  # parse to validate
-        for chunk, (lo, hi) in chunk_source(src):
-            rec = {'path': str(p.relative_to(root)), 'span_lines': [lo, hi], 'lang': SUPPORTED[ext], 'preview': chunk[:2000]}
-            records.append(rec)
-            vectors.append(embed(chunk))
+    # Layout from before the columnar format
+    for name in ('faiss.index', 'records.json'):
+        (out / name).unlink(missing_ok=True)
 
     if not records:
+        remove_index(out)
+        (out / MANIFEST).unlink(missing_ok=True)
         print("No indexable files found.")
         return
 
-    vecs = np.vstack(vectors).astype('float32')
-    index_path = out / 'faiss.index'
-    meta_path = out / 'records.json'
-
-    if faiss is not None:
-        index = faiss.IndexFlatIP(vecs.shape[1])
-        index.add(vecs)
-        faiss.write_index(index, str(index_path))
-    else:
-        np.save(out / 'vectors.npy', vecs)
-
-    with open(meta_path, 'w', encoding='utf-8') as f:
-        json.dump(records, f, indent=2)
+    # Drop the old manifest first so a crash mid-write cannot pair it with new files
+    (out / MANIFEST).unlink(missing_ok=True)
+    write_index(out, records, vecs, {'embedder': args.embedder, 'index_format': fmt})
+    # Written last: a manifest only exists next to a complete index
+    with open(out / MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump({'format': fmt, 'dim': int(vecs.shape[1]), 'dtype': args.dtype, 'files': manifest}, f)
 
-    print(f"Indexed {len(records)} chunks into {out}")
+    print(f"Indexed {len(records)} chunks into {out} "
+          f"({stats['reindexed']} files re-indexed, {stats['reused']} reused, {stats['removed']} removed)")
 
 if __name__ == '__main__':
     main()
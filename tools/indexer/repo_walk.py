@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+
+# Never descended into: VCS data, dependency trees, build output, virtualenvs, caches
+DEFAULT_EXCLUDE_DIRS: FrozenSet[str] = frozenset({
+    ".git", ".hg", ".svn",
+    "node_modules", "bower_components", "vendor", "third_party",
+    "dist", "build", "target",
+    ".venv", "venv", "__pycache__", ".tox", ".nox", ".mypy_cache", ".pytest_cache",
+    ".next", ".nuxt", ".gradle", ".idea", ".terraform",
+})
+# Bytes sniffed for a NUL byte when skipping binary files
+_BINARY_SNIFF_BYTES = 8192
+_CACHE_ENTRIES = 32
+
+
+class _Rule:
+    """One .gitignore line, matched against paths relative to the file's directory."""
+
+    def __init__(self, pattern: str) -> None:
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A slash anywhere but the end anchors the pattern to the .gitignore's directory
+        self.anchored = "/" in pattern
+        self.regex = re.compile(_translate(pattern.lstrip("/")) + r"\Z")
+
+    def matches(self, rel: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return bool(self.regex.match(rel if self.anchored else name))
+
+
+def _translate(pattern: str) -> str:
+    out: List[str] = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def _read_gitignore(directory: str) -> List[_Rule]:
+    try:
+        with open(os.path.join(directory, ".gitignore"), encoding="utf-8", errors="ignore") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        rules.append(_Rule(line))
+    return rules
+
+
+def _ignored(layers: List[Tuple[str, List[_Rule]]], rel: str, name: str, is_dir: bool) -> bool:
+    # Deeper .gitignore files and later lines win, as in git
+    verdict = False
+    for base, rules in layers:
+        sub = rel[len(base) + 1:] if base else rel
+        for rule in rules:
+            if rule.matches(sub, name, is_dir):
+                verdict = not rule.negate
+    return verdict
+
+
+def _is_binary(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(_BINARY_SNIFF_BYTES)
+    except OSError:
+        return True
+
+
+def _walk(
+    root: Path,
+    suffixes: Optional[FrozenSet[str]],
+    exclude_dirs: FrozenSet[str],
+    gitignore: bool,
+    max_file_bytes: Optional[int],
+    skip_binary: bool,
+) -> List[str]:
+    found: List[str] = []
+    # (absolute dir, its path relative to root, .gitignore layers in effect)
+    stack: List[Tuple[str, str, List[Tuple[str, List[_Rule]]]]] = [(str(root), "", [])]
+    while stack:
+        directory, rel_dir, layers = stack.pop()
+        if gitignore:
+            rules = _read_gitignore(directory)
+            if rules:
+                layers = layers + [(rel_dir, rules)]
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                # Symlinks are skipped: a checkout must not lead the walk outside itself
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in exclude_dirs or (layers and _ignored(layers, rel, entry.name, True)):
+                        continue
+                    subdirs.append((entry.path, rel))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if suffixes is not None and os.path.splitext(entry.name)[1].lower() not in suffixes:
+                    continue
+                if layers and _ignored(layers, rel, entry.name, False):
+                    continue
+                if max_file_bytes is not None and entry.stat(follow_symlinks=False).st_size > max_file_bytes:
+                    continue
+                if skip_binary and _is_binary(entry.path):
+                    continue
+            except OSError:
+                continue
+            found.append(rel)
+        # Reversed so the stack pops them in name order: a stable, depth-first listing
+        for path, rel in reversed(subdirs):
+            stack.append((path, rel, layers))
+    return found
+
+
+def _checkout_stamp(root: Path) -> Tuple[object, ...]:
+    # A checkout only changes through git (HEAD / index) or, for plain trees, its top-level mtime
+    stamp: List[object] = []
+    for name in (".git/HEAD", ".git/index", "."):
+        try:
+            st = (root / name).stat()
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+_cache: "OrderedDict[Tuple[object, ...], Tuple[Tuple[object, ...], List[str]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def walk_files(
+    root: Path,
+    suffixes: Optional[Iterable[str]] = None,
+    exclude_dirs: FrozenSet[str] = DEFAULT_EXCLUDE_DIRS,
+    gitignore: bool = True,
+    max_file_bytes: Optional[int] = None,
+    skip_binary: bool = False,
+    use_cache: bool = True,
+) -> List[Path]:
+    """Files under `root` worth reading, in a stable depth-first name order.
+
+    Excluded and .gitignore'd directories are pruned before they are entered.
+    `suffixes` (lowercase, with dot) limits the result to those extensions.
+    Results are cached per checkout and reused until its git HEAD/index change.
+    """
+    root = Path(root).resolve()
+    suffix_set = frozenset(s.lower() for s in suffixes) if suffixes is not None else None
+    key = (str(root), suffix_set, exclude_dirs, gitignore, max_file_bytes, skip_binary)
+    stamp = _checkout_stamp(root)
+    if use_cache:
+        with _cache_lock:
+            hit = _cache.get(key)
+            if hit is not None and hit[0] == stamp:
+                _cache.move_to_end(key)
+                return [root / rel for rel in hit[1]]
+    rels = _walk(root, suffix_set, exclude_dirs, gitignore, max_file_bytes, skip_binary)
+    if use_cache:
+        with _cache_lock:
+            _cache[key] = (stamp, rels)
+            _cache.move_to_end(key)
+            while len(_cache) > _CACHE_ENTRIES:
+                _cache.popitem(last=False)
+    return [root / rel for rel in rels]
+
+
+def forget(root: Path) -> None:
+    """Drop cached listings for `root` (e.g. before its checkout is deleted)."""
+    prefix = str(Path(root).resolve())
+    with _cache_lock:
+        for key in [k for k in _cache if k[0] == prefix]:
+            del _cache[key]
+